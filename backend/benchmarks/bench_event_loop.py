@@ -0,0 +1,173 @@
+"""
+Benchmark: request latency under concurrent load with database work run
+inline on the event loop ("before") versus on the database executor ("after").
+
+A background thread periodically holds the SQLite write lock, the way a slow
+write on agent_jobs would. Demo requests issued while the lock is held wait on
+SQLite's busy timeout; when that wait happens on the event loop, every other
+in-flight request on the worker stalls with it.
+
+Usage:
+    python benchmarks/bench_event_loop.py [--clients 32] [--requests 40] [--rate 200]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+from common import BACKEND_DIR, percentile
+
+
+def seed(db_path, agents):
+    """Insert approved agents and return their ids."""
+    conn = sqlite3.connect(db_path)
+    now = time.strftime("%Y-%m-%dT%H:%M:%S")
+    ids = [str(uuid.uuid4()) for _ in range(agents)]
+    conn.executemany(
+        """
+        INSERT INTO agents (
+            id, name, description, short_description, creator, creator_wallet,
+            price, category, tags, is_active, is_approved, demo_limit,
+            created_at, updated_at, input_schema, crewai_config
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1, 1, 1000000, ?, ?, '{}', '{}')
+        """,
+        [
+            (agent_id, f"Agent {i}", "Benchmark agent", "Benchmark", "bench",
+             "addr_bench", 1000000, "bench", '["bench"]', now, now)
+            for i, agent_id in enumerate(ids)
+        ],
+    )
+    conn.commit()
+    conn.close()
+    return ids
+
+
+def hold_write_lock(db_path, stop, hold_seconds, interval_seconds):
+    """Repeatedly take the write lock and sit on it, like a slow writer."""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    while not stop.is_set():
+        conn.execute("BEGIN IMMEDIATE")
+        time.sleep(hold_seconds)
+        conn.execute("COMMIT")
+        stop.wait(interval_seconds)
+    conn.close()
+
+
+async def run_load(app, agent_ids, clients, requests_per_client, demo_every, rate):
+    """
+    Drive an open-loop workload: request i is due at ``i / rate`` seconds and its
+    latency is measured from that due time, so time spent stuck behind a
+    blocked event loop is counted instead of silently omitted.
+    """
+    import httpx
+
+    latencies = {"get_agent": [], "demo_agent": []}
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Warm up connections, statement caches and the executor threads
+        await asyncio.gather(*(client.get(f"/api/agents/{agent_id}") for agent_id in agent_ids[:clients]))
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+
+        async def worker(worker_id):
+            for i in range(requests_per_client):
+                seq = i * clients + worker_id
+                due = started + seq / rate
+                delay = due - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                agent_id = agent_ids[seq % len(agent_ids)]
+                if demo_every and seq % demo_every == 0:
+                    name = "demo_agent"
+                    response = await client.post(
+                        f"/api/agents/{agent_id}/demo",
+                        json={"input": {"n": seq}, "user_wallet": f"wallet-{worker_id}"},
+                    )
+                else:
+                    name = "get_agent"
+                    response = await client.get(f"/api/agents/{agent_id}")
+                latencies[name].append(loop.time() - due)
+                response.raise_for_status()
+
+        await asyncio.gather(*(worker(n) for n in range(clients)))
+        elapsed = loop.time() - started
+
+    total = sum(len(v) for v in latencies.values())
+    return {
+        "requests": total,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 1),
+        "endpoints": {
+            name: {
+                "count": len(samples),
+                "p50_ms": round(percentile(samples, 50) * 1000, 2),
+                "p95_ms": round(percentile(samples, 95) * 1000, 2),
+                "p99_ms": round(percentile(samples, 99) * 1000, 2),
+            }
+            for name, samples in latencies.items()
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agents", type=int, default=500)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=40, help="requests per client")
+    parser.add_argument("--rate", type=float, default=200.0, help="target requests per second")
+    parser.add_argument("--demo-every", type=int, default=10, help="every Nth request is a demo write")
+    parser.add_argument("--lock-hold-ms", type=float, default=50.0)
+    parser.add_argument("--lock-interval-ms", type=float, default=100.0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="agenthub-bench-")
+    os.environ["DATABASE_PATH"] = os.path.join(workdir, "bench.db")
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")  # one client at a high request rate
+    # Reads answered from the response cache never reach the database, which is what is measured here
+    os.environ["RESPONSE_CACHE_MAX_ENTRIES"] = "0"
+    sys.path.insert(0, BACKEND_DIR)
+
+    from config import settings
+    import database
+    import main as backend
+
+    agent_ids = seed(settings.DATABASE_PATH, args.agents)
+    executor_workers = settings.DB_EXECUTOR_WORKERS or settings.DB_POOL_SIZE
+
+    results = {}
+    for mode, workers in (("inline", 0), ("executor", executor_workers)):
+        settings.DB_EXECUTOR_WORKERS = workers
+        stop = threading.Event()
+        locker = threading.Thread(
+            target=hold_write_lock,
+            args=(settings.DATABASE_PATH, stop, args.lock_hold_ms / 1000, args.lock_interval_ms / 1000),
+            daemon=True,
+        )
+        locker.start()
+        try:
+            results[mode] = asyncio.run(
+                run_load(backend.app, agent_ids, args.clients, args.requests, args.demo_every, args.rate)
+            )
+        finally:
+            stop.set()
+            locker.join()
+            database.shutdown_db_executor()
+
+    print(json.dumps({
+        "benchmark": "event_loop",
+        "config": vars(args),
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
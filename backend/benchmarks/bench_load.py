@@ -0,0 +1,344 @@
+"""
+Load benchmark: a mixed read/write workload against a seeded catalog.
+
+The app runs either in-process (ASGI transport, no sockets) or as a
+multi-worker uvicorn server on a local port. The dataset is generated from a
+fixed seed and cached, and every run starts from a fresh copy of it, so two
+runs with the same arguments on different commits measure the same work.
+
+Each client picks operations from the weighted mix with its own seeded RNG
+and keeps one request in flight (closed loop). Results are printed as JSON:
+overall throughput plus latency percentiles and status codes per endpoint,
+tagged with the git commit. Pass ``--baseline`` with an earlier result to
+fail (exit 1) when throughput or p95 latency regress beyond ``--max-regression``.
+
+Usage:
+    python benchmarks/bench_load.py [--mode inprocess|uvicorn] [--agents 10000] [--jobs 100000]
+        [--concurrency 32] [--requests 5000] [--mix list_agents=35,get_agent=35,...]
+        [--workers 4] [--client-processes 2] [--output result.json] [--baseline old.json]
+
+At full scale (``--agents 100000 --jobs 10000000``) seeding takes a while the
+first time; the seeded database is kept in ``--data-dir`` for later runs.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from common import BACKEND_DIR, run_info, summarize
+
+# The load generator is one client; per-client rate limits would only measure the limiter
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+sys.path.insert(0, BACKEND_DIR)
+from generate_data import CATEGORIES, TAGS, example_input, generate
+
+DEFAULT_MIX = "list_agents=35,get_agent=35,search_agents=10,demo_agent=10,start_job=5,create_agent=5"
+OPERATIONS = ("list_agents", "get_agent", "search_agents", "demo_agent", "start_job", "create_agent")
+
+
+def seed_database(db_path, agents, jobs, seed):
+    """Create the schema and fill it with a deterministic catalog and job history."""
+    import database
+
+    generate(db_path, agents, jobs, seed=seed)
+    database.close_pool()
+    # Leave nothing in the WAL so the main file can be copied on its own
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+
+def prepare_database(args):
+    """Return a fresh working copy of the (cached) seeded database."""
+    os.makedirs(args.data_dir, exist_ok=True)
+    pristine = os.path.join(args.data_dir, f"seed-{args.agents}-{args.jobs}-{args.seed}.db")
+    seed_seconds = None
+    if args.reseed or not os.path.exists(pristine):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(pristine + suffix):
+                os.remove(pristine + suffix)
+        started = time.perf_counter()
+        seed_database(pristine + ".tmp", args.agents, args.jobs, args.seed)
+        os.replace(pristine + ".tmp", pristine)
+        seed_seconds = round(time.perf_counter() - started, 2)
+
+    workdir = tempfile.mkdtemp(prefix="agenthub-load-")
+    working = os.path.join(workdir, "bench.db")
+    shutil.copyfile(pristine, working)
+
+    conn = sqlite3.connect(working)
+    agent_ids = [row[0] for row in conn.execute(
+        "SELECT id FROM agents WHERE is_active = 1 AND is_approved = 1 ORDER BY rowid"
+    )]
+    conn.close()
+    return working, agent_ids, seed_seconds
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise SystemExit(f"Unknown operation in --mix: {name!r} (choose from {', '.join(OPERATIONS)})")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def build_request(name, rng, agent_ids):
+    """Return (method, url, json body) for one operation."""
+    if name == "list_agents":
+        params = ["limit=20"]
+        if rng.random() < 0.5:
+            params.append(f"category={rng.choice(CATEGORIES)}")
+        if rng.random() < 0.5:
+            params.append("view=card")
+        return "GET", "/api/agents?" + "&".join(params), None
+    if name == "get_agent":
+        return "GET", f"/api/agents/{rng.choice(agent_ids)}", None
+    if name == "search_agents":
+        return "GET", f"/api/agents/search?q={rng.choice(TAGS)}&limit=20", None
+    if name == "demo_agent":
+        return "POST", f"/api/agents/{rng.choice(agent_ids)}/demo", {
+            "input": example_input(), "user_wallet": f"addr_load_{rng.randrange(1_000_000)}",
+        }
+    if name == "start_job":
+        return "POST", f"/api/agents/{rng.choice(agent_ids)}/start", {
+            "input": example_input(), "user_wallet": f"addr_load_{rng.randrange(1_000_000)}",
+        }
+    words = rng.sample(TAGS, 3)
+    return "POST", "/api/agents", {
+        "name": f"Load {words[0]} agent", "description": f"Created under load for {words[1]}",
+        "short_description": words[2], "creator": "load", "creator_wallet": "addr_load_creator",
+        "price": rng.randrange(10_000_000), "category": rng.choice(CATEGORIES), "tags": words,
+    }
+
+
+async def drive(client, weights, agent_ids, concurrency, requests, seed):
+    """Run ``requests`` operations over ``concurrency`` closed-loop clients."""
+    names = list(weights)
+    name_weights = list(weights.values())
+    latencies = {name: [] for name in names}
+    statuses = {name: Counter() for name in names}
+
+    async def worker(n, count):
+        rng = random.Random(f"{seed}-{n}")
+        for _ in range(count):
+            name = rng.choices(names, weights=name_weights)[0]
+            method, url, body = build_request(name, rng, agent_ids)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, json=body)
+                status = str(response.status_code)
+            except Exception as e:
+                status = type(e).__name__
+            latencies[name].append(time.perf_counter() - started)
+            statuses[name][status] += 1
+
+    per_worker, extra = divmod(requests, concurrency)
+    await asyncio.gather(*(worker(n, per_worker + (n < extra)) for n in range(concurrency)))
+    return latencies, {name: dict(counts) for name, counts in statuses.items()}
+
+
+def _http_client(base_url, concurrency):
+    import httpx
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    return httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0)
+
+
+def client_process(base_url, weights, agent_ids, concurrency, requests, warmup, seed):
+    """Drive a running server from a separate process (uvicorn mode)."""
+    async def run():
+        async with _http_client(base_url, concurrency) as client:
+            if warmup:
+                await drive(client, weights, agent_ids, concurrency, warmup, f"warmup-{seed}")
+            return await drive(client, weights, agent_ids, concurrency, requests, seed)
+    return asyncio.run(run())
+
+
+def run_inprocess(args, db_path, weights, agent_ids):
+    import httpx
+    from config import settings
+
+    settings.DATABASE_PATH = db_path
+    import main as backend
+
+    async def run():
+        await backend.app.router.startup()
+        try:
+            transport = httpx.ASGITransport(app=backend.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60.0) as client:
+                if args.warmup:
+                    await drive(client, weights, agent_ids, args.concurrency, args.warmup, f"warmup-{args.seed}")
+                started = time.perf_counter()
+                latencies, statuses = await drive(
+                    client, weights, agent_ids, args.concurrency, args.requests, args.seed,
+                )
+                return latencies, statuses, time.perf_counter() - started
+        finally:
+            await backend.app.router.shutdown()
+
+    return asyncio.run(run())
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_uvicorn(args, db_path, weights, agent_ids):
+    import httpx
+
+    port = _free_port()
+    env = dict(os.environ, DATABASE_PATH=db_path)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning", "--no-access-log"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.time() + 60
+        while True:
+            try:
+                if httpx.get(base_url + "/", timeout=1.0).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if server.poll() is not None or time.time() > deadline:
+                raise SystemExit("uvicorn did not start")
+            time.sleep(0.2)
+
+        processes = max(1, args.client_processes)
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            started = time.perf_counter()
+            futures = [
+                pool.submit(
+                    client_process, base_url, weights, agent_ids,
+                    max(1, args.concurrency // processes), args.requests // processes,
+                    args.warmup // processes, f"{args.seed}-{n}",
+                )
+                for n in range(processes)
+            ]
+            parts = [future.result() for future in futures]
+            elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    latencies = {name: [] for name in weights}
+    statuses = {name: Counter() for name in weights}
+    for part_latencies, part_statuses in parts:
+        for name in weights:
+            latencies[name].extend(part_latencies[name])
+            statuses[name].update(part_statuses[name])
+    return latencies, {name: dict(counts) for name, counts in statuses.items()}, elapsed
+
+
+def is_error(status):
+    """Transport failures and 5xx count as errors; 429 from an exhausted demo quota does not."""
+    return not status.isdigit() or int(status) >= 500
+
+
+def compare(result, baseline, max_regression):
+    """List the regressions of ``result`` against ``baseline`` beyond max_regression percent."""
+    regressions = []
+    limit = 1 + max_regression / 100.0
+    old, new = baseline["results"]["throughput_rps"], result["results"]["throughput_rps"]
+    if old and new * limit < old:
+        regressions.append(f"throughput {old} -> {new} rps")
+    for name, stats in result["results"]["endpoints"].items():
+        before = baseline["results"]["endpoints"].get(name)
+        if before and before["p95_ms"] and stats["p95_ms"] > before["p95_ms"] * limit:
+            regressions.append(f"{name} p95 {before['p95_ms']} -> {stats['p95_ms']} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("inprocess", "uvicorn"), default="inprocess")
+    parser.add_argument("--agents", type=int, default=10_000)
+    parser.add_argument("--jobs", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42, help="dataset and workload seed")
+    parser.add_argument("--concurrency", type=int, default=32, help="requests in flight")
+    parser.add_argument("--requests", type=int, default=5000, help="measured requests")
+    parser.add_argument("--warmup", type=int, default=500, help="unmeasured requests first")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="operation weights")
+    parser.add_argument("--workers", type=int, default=4, help="uvicorn worker processes")
+    parser.add_argument("--client-processes", type=int, default=2, help="load generator processes (uvicorn mode)")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "agenthub-bench"),
+                        help="where seeded databases are cached")
+    parser.add_argument("--reseed", action="store_true", help="regenerate the cached dataset")
+    parser.add_argument("--output", help="also write the JSON result to this file")
+    parser.add_argument("--baseline", help="earlier JSON result to compare against")
+    parser.add_argument("--max-regression", type=float, default=10.0, help="allowed regression in percent")
+    args = parser.parse_args()
+
+    weights = parse_mix(args.mix)
+    db_path, agent_ids, seed_seconds = prepare_database(args)
+    os.environ["DATABASE_PATH"] = db_path
+
+    if args.mode == "inprocess":
+        latencies, statuses, elapsed = run_inprocess(args, db_path, weights, agent_ids)
+    else:
+        latencies, statuses, elapsed = run_uvicorn(args, db_path, weights, agent_ids)
+
+    total = sum(len(samples) for samples in latencies.values())
+    errors = sum(count for counts in statuses.values() for status, count in counts.items() if is_error(status))
+    endpoints = {}
+    for name in weights:
+        endpoints[name] = {
+            **summarize(latencies[name]),
+            "errors": sum(count for status, count in statuses[name].items() if is_error(status)),
+            "status_codes": dict(sorted(statuses[name].items())),
+        }
+    result = {
+        "benchmark": "load",
+        "run": run_info(),
+        "config": {
+            key: value for key, value in vars(args).items()
+            if key not in ("data_dir", "reseed", "output", "baseline", "max_regression")
+        },
+        "dataset": {"agents": args.agents, "jobs": args.jobs, "seed_seconds": seed_seconds},
+        "results": {
+            "requests": total,
+            "errors": errors,
+            "elapsed_seconds": round(elapsed, 3),
+            "throughput_rps": round(total / elapsed, 1) if elapsed else 0.0,
+            "endpoints": endpoints,
+        },
+    }
+
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    shutil.rmtree(os.path.dirname(db_path), ignore_errors=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != result["config"]:
+            print("WARNING: baseline was run with a different configuration", file=sys.stderr)
+        regressions = compare(result, baseline, args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark: encoding agents rows as a JSON response body.
+
+Compares the previous path (dict(row), json.loads of the JSON columns, an
+AgentResponse per row, jsonable_encoder and json.dumps) with the fast path in
+serialization.py, which encodes trusted rows directly and splices the JSON
+columns in as text. Rows are fetched once up front, so only serialization is
+timed.
+
+Usage:
+    python benchmarks/bench_serialization.py [--rows 100] [--rounds 200]
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+
+from common import BACKEND_DIR
+
+
+def seed(db_path, rows):
+    """Insert agents with realistic JSON columns."""
+    conn = sqlite3.connect(db_path)
+    now = time.strftime("%Y-%m-%dT%H:%M:%S")
+    input_schema = json.dumps({
+        "type": "object",
+        "properties": {
+            "topic": {"type": "string", "description": "What to research"},
+            "depth": {"type": "integer", "minimum": 1, "maximum": 5},
+        },
+        "required": ["topic"],
+    })
+    crewai_config = json.dumps({
+        "agents": [{"role": "Researcher", "goal": "Find sources", "backstory": "Diligent analyst"}],
+        "tasks": [{"description": "Research the topic", "expected_output": "A summary"}],
+    })
+    conn.executemany(
+        """
+        INSERT INTO agents (
+            id, name, description, short_description, creator, creator_wallet,
+            price, category, tags, is_active, is_approved, demo_limit,
+            created_at, updated_at, input_schema, crewai_config
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1, 1, 3, ?, ?, ?, ?)
+        """,
+        [
+            (str(uuid.uuid4()), f"Research Agent {i}",
+             "Finds, reads and summarizes sources on any topic. " * 4,
+             "Summarizes research", "bench", "addr_bench_" + "x" * 40,
+             1000000 + i, "research", json.dumps(["research", "summaries", f"tag{i % 7}"]),
+             now, now, input_schema, crewai_config)
+            for i in range(rows)
+        ],
+    )
+    conn.commit()
+    conn.close()
+
+
+def measure(fn, rows, rounds):
+    """Best-of-three throughput of fn(rows) in rows per second."""
+    fn(rows)  # warm up
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            fn(rows)
+        best = min(best, time.perf_counter() - start)
+    return len(rows) * rounds / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100, help="rows per response (page size)")
+    parser.add_argument("--rounds", type=int, default=200, help="responses encoded per timing run")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="agenthub-bench-")
+    os.environ["DATABASE_PATH"] = os.path.join(workdir, "bench.db")
+    sys.path.insert(0, BACKEND_DIR)
+
+    from fastapi.encoders import jsonable_encoder
+
+    import main as app_main
+    import serialization
+    from database import create_connection
+
+    seed(os.environ["DATABASE_PATH"], args.rows)
+    conn = create_connection()
+    legacy_columns = ", ".join(serialization.AGENT_RESPONSE_FIELDS)
+    legacy_rows = conn.execute(f"SELECT {legacy_columns} FROM agents").fetchall()
+    fast_rows = conn.execute(f"SELECT {serialization.agent_select_columns()} FROM agents").fetchall()
+    conn.close()
+
+    def previous(rows):
+        agents = []
+        for row in rows:
+            agent_data = dict(row)
+            agent_data["tags"] = json.loads(agent_data["tags"]) if agent_data["tags"] else []
+            agent_data["input_schema"] = json.loads(agent_data["input_schema"]) if agent_data["input_schema"] else {}
+            agent_data["crewai_config"] = json.loads(agent_data["crewai_config"]) if agent_data["crewai_config"] else {}
+            agents.append(app_main.AgentResponse(**agent_data))
+        return json.dumps(
+            jsonable_encoder(agents), ensure_ascii=False, allow_nan=False, separators=(",", ":"),
+        ).encode("utf-8")
+
+    def fast(rows):
+        return serialization.encode_agents(rows)
+
+    assert json.loads(previous(legacy_rows)) == json.loads(fast(fast_rows))
+
+    before = measure(previous, legacy_rows, args.rounds)
+    after = measure(fast, fast_rows, args.rounds)
+    print(json.dumps({
+        "rows_per_response": args.rows,
+        "before_rows_per_sec": round(before),
+        "after_rows_per_sec": round(after),
+        "speedup": round(after / before, 1),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
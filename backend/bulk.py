@@ -0,0 +1,185 @@
+"""
+Incremental parsing of bulk upload bodies.
+
+Both parsers consume the request body chunk by chunk and yield one record at
+a time, so memory use is bounded by the largest single record rather than by
+the size of the upload. A record over BULK_IMPORT_MAX_RECORD_BYTES is read
+past without being kept and reported as an error for its index; only a
+malformed JSON array stops parsing.
+"""
+
+import codecs
+import json
+from typing import Any, AsyncIterator, Optional, Tuple
+
+from config import settings
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+class BulkParseError(Exception):
+    """The body cannot be parsed any further (e.g. a malformed JSON array)."""
+
+# Parsed records are yielded as (value, error); exactly one of them is None
+ParsedRecord = Tuple[Any, Any]
+
+RECORD_TOO_LARGE = "Record exceeds the maximum record size"
+
+def _too_large(length: int) -> bool:
+    return length > settings.BULK_IMPORT_MAX_RECORD_BYTES
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[ParsedRecord]:
+    """Yield one parsed value per non-blank line; bad lines yield an error and parsing continues."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    skipping = False  # in a line already known to be too large, dropped up to its newline
+    async for chunk in chunks:
+        text = decoder.decode(chunk)
+        if skipping:
+            newline = text.find("\n")
+            if newline < 0:
+                continue
+            yield None, RECORD_TOO_LARGE
+            text = text[newline + 1:]
+            skipping = False
+        buffer += text
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            if line.strip():
+                yield _parse_line(line)
+        if _too_large(len(buffer)):
+            buffer = ""
+            skipping = True
+    buffer += decoder.decode(b"", final=True)
+    if skipping:
+        yield None, RECORD_TOO_LARGE
+    elif buffer.strip():
+        yield _parse_line(buffer)
+
+def _parse_line(line: str) -> ParsedRecord:
+    if _too_large(len(line)):
+        return None, RECORD_TOO_LARGE
+    try:
+        return json.loads(line), None
+    except ValueError as e:
+        return None, f"Invalid JSON: {e}"
+
+class _ValueSkipper:
+    """Finds where a JSON value ends, fed a piece at a time, without keeping it."""
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text: str) -> Optional[int]:
+        """The index in ``text`` just past the value, or None if it goes on past ``text``."""
+        for index, char in enumerate(text):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                    if self.depth == 0:
+                        return index + 1
+            elif char == '"':
+                self.in_string = True
+            elif char in "[{":
+                self.depth += 1
+            elif char in "]}":
+                if self.depth == 0:
+                    return index  # the array's end, after a bare scalar
+                self.depth -= 1
+                if self.depth == 0:
+                    return index + 1
+            elif self.depth == 0 and char in ", \t\r\n":
+                return index
+        return None
+
+async def iter_json_array(chunks: AsyncIterator[bytes]) -> AsyncIterator[ParsedRecord]:
+    """
+    Yield the elements of a top-level JSON array as they arrive.
+
+    A value is only accepted once a delimiter follows it (or the body ends),
+    so a number split across two chunks is never read half-way through.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    json_decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    state = "start"  # start -> value -> separator -> ... -> done
+    finished = False
+    iterator = chunks.__aiter__()
+
+    while True:
+        # Skip whitespace
+        while pos < len(buffer) and buffer[pos] in " \t\r\n":
+            pos += 1
+
+        if pos < len(buffer):
+            char = buffer[pos]
+            if state == "start":
+                if char != "[":
+                    raise BulkParseError("Expected a JSON array")
+                pos += 1
+                state = "first"
+                continue
+            if state == "separator":
+                if char == ",":
+                    pos += 1
+                    state = "value"
+                    continue
+                if char == "]":
+                    pos += 1
+                    state = "done"
+                    continue
+                raise BulkParseError(f"Expected ',' or ']' at offset {pos}")
+            if state == "first" and char == "]":
+                pos += 1
+                state = "done"
+                continue
+            if state in ("first", "value"):
+                try:
+                    value, end = json_decoder.raw_decode(buffer, pos)
+                except ValueError as e:
+                    if finished:
+                        raise BulkParseError(f"Invalid JSON: {e}")
+                else:
+                    # A number is only complete once a delimiter follows it
+                    if finished or (end < len(buffer) and buffer[end] in " \t\r\n,]"):
+                        yield (None, RECORD_TOO_LARGE) if _too_large(end - pos) else (value, None)
+                        pos = end
+                        state = "separator"
+                        continue
+            if state == "done":
+                raise BulkParseError("Unexpected data after the JSON array")
+
+        if finished:
+            if state != "done":
+                raise BulkParseError("Unexpected end of JSON array")
+            return
+
+        # Need more input: drop what has been consumed and read the next chunk
+        buffer = buffer[pos:]
+        pos = 0
+        if state in ("first", "value") and _too_large(len(buffer)):
+            # Too large to parse: read past the value without keeping it and go on after it
+            skipper = _ValueSkipper()
+            end = skipper.feed(buffer)
+            while end is None:
+                try:
+                    buffer = decoder.decode(await iterator.__anext__())
+                except StopAsyncIteration:
+                    raise BulkParseError("Unexpected end of JSON array")
+                end = skipper.feed(buffer)
+            buffer = buffer[end:]
+            yield None, RECORD_TOO_LARGE
+            state = "separator"
+            continue
+        try:
+            chunk = await iterator.__anext__()
+            buffer += decoder.decode(chunk)
+        except StopAsyncIteration:
+            buffer += decoder.decode(b"", final=True)
+            finished = True
@@ -0,0 +1,146 @@
+"""
+In-process response cache for AgentHub catalog reads.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, NamedTuple, Optional
+
+from config import settings
+
+class CachedResponse(NamedTuple):
+    """An encoded response body together with its validator and extra headers."""
+    body: bytes
+    etag: str
+    headers: Dict[str, str]
+    expires_at: float
+
+def make_etag(body: bytes) -> str:
+    """Strong ETag derived from the encoded body."""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Evaluate an If-None-Match header against an ETag (weak comparison)."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+class ResponseCache:
+    """
+    Size-bounded LRU cache with a per-entry TTL.
+
+    Keys are tuples whose first element is a namespace (e.g. ``"agents"`` for
+    listings, ``"agent"`` for single agents) so related entries can be dropped
+    together. Every invalidation bumps a generation counter; a value computed
+    before an invalidation is not stored, which keeps a slow read from
+    re-populating the cache with data a concurrent write just replaced.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key: Hashable, body: bytes, headers: Optional[Dict[str, str]] = None,
+            generation: Optional[int] = None) -> CachedResponse:
+        """
+        Store an encoded body and return the resulting entry.
+
+        Pass the ``generation`` observed before the value was computed; if an
+        invalidation happened since, the entry is returned but not stored.
+        """
+        entry = CachedResponse(
+            body=body,
+            etag=make_etag(body),
+            headers=headers or {},
+            expires_at=time.monotonic() + self.ttl_seconds,
+        )
+        if not self.enabled:
+            return entry
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return entry
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self.generation += 1
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def invalidate_namespace(self, namespace: str):
+        """Drop every entry whose key starts with ``namespace``."""
+        with self._lock:
+            self.generation += 1
+            stale = [key for key in self._entries if key[0] == namespace]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+response_cache = ResponseCache(
+    settings.RESPONSE_CACHE_MAX_ENTRIES,
+    settings.RESPONSE_CACHE_TTL_SECONDS,
+)
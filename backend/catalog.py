@@ -0,0 +1,429 @@
+"""
+Memory-resident snapshot of the public catalog (active, approved agents).
+
+With CATALOG_SNAPSHOT_ENABLED, each process keeps an immutable CatalogSnapshot
+and serves list_agents and get_agent for the public catalog from it, without
+a database round trip. Agents are held in listing order by their
+(created_at, id) key, with a sorted key list per category and per tag, and
+each agent's JSON for the full and card views is encoded once, when it
+enters the snapshot.
+
+Triggers on agents append the id of every changed agent to catalog_changes,
+whose AUTOINCREMENT counter in sqlite_sequence is the catalog's change
+counter. A background thread reads the counter every
+CATALOG_SNAPSHOT_POLL_SECONDS; when it has moved, only the changed agents are
+re-read and a patched copy of the snapshot replaces the current one, sharing
+every list the changes did not touch. The snapshot is rebuilt from scratch at
+start, after more than CATALOG_SNAPSHOT_PATCH_LIMIT changed agents, or when
+the change log was pruned past its position.
+
+Readers may see a change up to one poll interval late; writes made through
+this process wake the thread straight away.
+"""
+
+import heapq
+import sqlite3
+import threading
+import time
+from bisect import bisect_left, insort
+from functools import lru_cache
+from itertools import groupby, islice
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from config import settings
+from database import create_connection
+from serialization import AGENT_CARD_FIELDS, AGENT_RESPONSE_FIELDS, agent_select_columns, row_encoder
+
+# (created_at, id): agents are listed newest first, i.e. by this key descending
+Key = Tuple[str, str]
+
+class CatalogAgent(NamedTuple):
+    key: Key
+    category: Optional[str]
+    tags: Tuple[str, ...]  # normalized, as in agent_tags
+    row: tuple  # column values in AGENT_RESPONSE_FIELDS order
+    full: bytes  # JSON for the full view
+    card: bytes  # JSON for the card view
+
+_CATALOG_QUERY = f"SELECT {agent_select_columns()} FROM agents WHERE is_active = 1 AND is_approved = 1"
+_ID = AGENT_RESPONSE_FIELDS.index("id")
+_CREATED_AT = AGENT_RESPONSE_FIELDS.index("created_at")
+_CATEGORY = AGENT_RESPONSE_FIELDS.index("category")
+# SQLite's default limit on host parameters in older builds
+_MAX_PARAMS = 999
+
+@lru_cache(maxsize=64)
+def _projection(fields: Tuple[str, ...]) -> Callable[[tuple], tuple]:
+    indexes = tuple(AGENT_RESPONSE_FIELDS.index(field) for field in fields)
+    return lambda row: tuple([row[n] for n in indexes])
+
+def _make_agent(row: Sequence, tags: Iterable[str]) -> CatalogAgent:
+    values = tuple(row)
+    return CatalogAgent(
+        key=(values[_CREATED_AT] or "", values[_ID]),
+        category=values[_CATEGORY],
+        tags=tuple(sorted(tags)),
+        row=values,
+        full=row_encoder(AGENT_RESPONSE_FIELDS)(values).encode("utf-8"),
+        card=row_encoder(AGENT_CARD_FIELDS)(_projection(AGENT_CARD_FIELDS)(values)).encode("utf-8"),
+    )
+
+def _descending(keys: Sequence[Key], before: Optional[Key] = None) -> Iterator[Key]:
+    """``keys`` (sorted ascending) from the end, starting below ``before``."""
+    end = bisect_left(keys, before) if before is not None else len(keys)
+    return (keys[n] for n in range(end - 1, -1, -1))
+
+def _remove(keys: List[Key], key: Key):
+    n = bisect_left(keys, key)
+    if n < len(keys) and keys[n] == key:
+        del keys[n]
+
+class CatalogSnapshot:
+    """
+    An immutable view of the public catalog as of change counter ``seq``.
+
+    Key lists are sorted ascending; pages are read from their end. patched()
+    returns a new snapshot and leaves this one untouched, so readers never
+    need a lock.
+    """
+
+    __slots__ = ("seq", "agents", "order", "by_category", "by_tag")
+
+    def __init__(self, seq: int, agents: Dict[str, CatalogAgent], order: List[Key],
+                 by_category: Dict[str, List[Key]], by_tag: Dict[str, List[Key]]):
+        self.seq = seq
+        self.agents = agents
+        self.order = order
+        self.by_category = by_category
+        self.by_tag = by_tag
+
+    @classmethod
+    def build(cls, seq: int, agents: Iterable[CatalogAgent]) -> "CatalogSnapshot":
+        by_id = {agent.key[1]: agent for agent in agents}
+        order = sorted(agent.key for agent in by_id.values())
+        by_category: Dict[str, List[Key]] = {}
+        by_tag: Dict[str, List[Key]] = {}
+        # Appending in key order keeps every list sorted
+        for key in order:
+            agent = by_id[key[1]]
+            if agent.category is not None:
+                by_category.setdefault(agent.category, []).append(key)
+            for tag in agent.tags:
+                by_tag.setdefault(tag, []).append(key)
+        return cls(seq, by_id, order, by_category, by_tag)
+
+    def patched(self, seq: int, changes: Dict[str, Optional[CatalogAgent]]) -> "CatalogSnapshot":
+        """A copy with ``changes`` applied: agent id -> its new state, or None if it left the catalog."""
+        agents = dict(self.agents)
+        order = list(self.order)
+        indexes = {"category": dict(self.by_category), "tag": dict(self.by_tag)}
+        copied = set()
+
+        def keys_for(kind: str, name: str) -> List[Key]:
+            # Copy a shared list the first time this patch changes it
+            index = indexes[kind]
+            if (kind, name) not in copied:
+                index[name] = list(index.get(name, ()))
+                copied.add((kind, name))
+            return index[name]
+
+        for agent_id, agent in changes.items():
+            old = agents.pop(agent_id, None)
+            if old is not None:
+                _remove(order, old.key)
+                if old.category is not None:
+                    _remove(keys_for("category", old.category), old.key)
+                for tag in old.tags:
+                    _remove(keys_for("tag", tag), old.key)
+            if agent is not None:
+                agents[agent_id] = agent
+                insort(order, agent.key)
+                if agent.category is not None:
+                    insort(keys_for("category", agent.category), agent.key)
+                for tag in agent.tags:
+                    insort(keys_for("tag", tag), agent.key)
+        for kind, name in copied:
+            if not indexes[kind][name]:
+                del indexes[kind][name]
+        return CatalogSnapshot(seq, agents, order, indexes["category"], indexes["tag"])
+
+    def newest(self, category: Optional[str] = None, tags: Sequence[str] = (), tag_match: str = "any",
+               before: Optional[Key] = None) -> Iterator[CatalogAgent]:
+        """
+        Agents in ``category`` with any (or all) of ``tags``, newest first, older than ``before``.
+
+        Lazy: a page only walks as far back as it needs to, so a tag query
+        costs about offset + limit steps instead of sorting every match.
+        """
+        agents = self.agents
+        if not tags:
+            keys = self.by_category.get(category, ()) if category else self.order
+            return (agents[key[1]] for key in _descending(keys, before))
+        lists = [self.by_tag.get(tag, ()) for tag in tags]
+        if tag_match == "all":
+            # Walk the rarest tag and check the others on each agent
+            wanted = set(tags)
+            matched = (agents[key[1]] for key in _descending(min(lists, key=len), before))
+            matched = (agent for agent in matched if wanted.issubset(agent.tags))
+        else:
+            merged = heapq.merge(*(_descending(keys, before) for keys in lists), reverse=True)
+            # An agent with several of the tags comes out of the merge once per tag, adjacently
+            matched = (agents[key[1]] for key, _ in groupby(merged))
+        if category:
+            matched = (agent for agent in matched if agent.category == category)
+        return matched
+
+    def page(self, category: Optional[str] = None, tags: Sequence[str] = (), tag_match: str = "any",
+             before: Optional[Key] = None, offset: int = 0, limit: int = 50) -> List[CatalogAgent]:
+        """Agents as list_agents' ORDER BY created_at DESC, id DESC LIMIT/OFFSET would return them."""
+        stop = offset + limit if limit >= 0 else None  # SQLite treats a negative LIMIT as none
+        return list(islice(self.newest(category, tags, tag_match, before), offset, stop))
+
+    @staticmethod
+    def encode(agents: Sequence[CatalogAgent], fields: Tuple[str, ...] = AGENT_RESPONSE_FIELDS) -> bytes:
+        """Encode agents as a JSON array, splicing in their pre-encoded JSON for the standard views."""
+        if fields == AGENT_RESPONSE_FIELDS:
+            parts = [agent.full for agent in agents]
+        elif fields == AGENT_CARD_FIELDS:
+            parts = [agent.card for agent in agents]
+        else:
+            encode, project = row_encoder(fields), _projection(fields)
+            parts = [encode(project(agent.row)).encode("utf-8") for agent in agents]
+        return b"[" + b",".join(parts) + b"]"
+
+def change_counter(conn) -> int:
+    """The catalog's change counter: it moves on every insert, update and delete of an agent."""
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'catalog_changes'").fetchone()
+    return row[0] if row else 0
+
+class CatalogSnapshots:
+    """
+    Keeps ``snapshot`` current from a background thread.
+
+    The thread owns a dedicated connection, like the job engine's workers.
+    ``snapshot`` is None until the first build finishes (and when disabled);
+    callers then read from the database as usual.
+    """
+
+    def __init__(self, poll_interval: float, patch_limit: int, change_log_size: int):
+        self.poll_interval = poll_interval
+        self.patch_limit = max(1, patch_limit)
+        self.change_log_size = max(self.patch_limit, change_log_size)
+        self.snapshot: Optional[CatalogSnapshot] = None
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._woken = False
+        self._thread: Optional[threading.Thread] = None
+        self._pruned_through = 0
+        # Stats
+        self.rebuilds = 0
+        self.patches = 0
+        self.errors = 0
+        self.last_refresh_seconds: Optional[float] = None
+        self.last_refreshed: Optional[float] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="agenthub-catalog", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def notify(self):
+        """Refresh now rather than at the next poll, because this process changed an agent."""
+        with self._cond:
+            self._woken = True
+            self._cond.notify()
+
+    def _run(self):
+        conn = create_connection()
+        try:
+            while not self._stopping:
+                try:
+                    self.refresh(conn)
+                    self._prune(conn)
+                except sqlite3.Error as e:
+                    conn.rollback()
+                    self.errors += 1
+                    print(f"Catalog snapshot refresh failed: {e}")
+                with self._cond:
+                    if not self._stopping and not self._woken:
+                        self._cond.wait(self.poll_interval)
+                    self._woken = False
+        finally:
+            conn.close()
+
+    def refresh(self, conn) -> str:
+        """Bring the snapshot up to date; returns "unchanged", "patched" or "rebuilt"."""
+        started = time.perf_counter()
+        # One read transaction, so the counter, the change log and the rows agree
+        conn.execute("BEGIN")
+        try:
+            seq = change_counter(conn)
+            current = self.snapshot
+            if current is not None and current.seq == seq:
+                return "unchanged"
+            changed_ids = self._changed_since(conn, current.seq, seq) if current is not None else None
+            if changed_ids is None:
+                snapshot = CatalogSnapshot.build(seq, self._load(conn))
+                result = "rebuilt"
+            else:
+                changes = dict.fromkeys(changed_ids)
+                for agent in self._load(conn, changed_ids):
+                    changes[agent.key[1]] = agent
+                snapshot = current.patched(seq, changes)
+                result = "patched"
+        finally:
+            conn.commit()
+        self.snapshot = snapshot
+        if result == "rebuilt":
+            self.rebuilds += 1
+        else:
+            self.patches += 1
+        self.last_refresh_seconds = time.perf_counter() - started
+        self.last_refreshed = time.time()
+        return result
+
+    def _changed_since(self, conn, since: int, seq: int) -> Optional[List[str]]:
+        """Ids of agents changed after ``since``, or None if a full rebuild is needed."""
+        rows = conn.execute(
+            "SELECT seq, agent_id FROM catalog_changes WHERE seq > ? AND seq <= ? ORDER BY seq",
+            (since, seq),
+        ).fetchall()
+        if not rows or rows[0][0] != since + 1:
+            return None  # the entries we need were pruned
+        changed_ids = list(dict.fromkeys(row[1] for row in rows))
+        if len(changed_ids) > self.patch_limit:
+            return None
+        return changed_ids
+
+    def _load(self, conn, agent_ids: Optional[List[str]] = None) -> List[CatalogAgent]:
+        """Catalog agents with their tags: all of them, or those among ``agent_ids``."""
+        if agent_ids is None:
+            rows = conn.execute(_CATALOG_QUERY).fetchall()
+            tag_rows = conn.execute("""
+                SELECT t.agent_id, t.tag FROM agent_tags t JOIN agents a ON a.id = t.agent_id
+                WHERE a.is_active = 1 AND a.is_approved = 1
+            """).fetchall()
+        else:
+            rows, tag_rows = [], []
+            for n in range(0, len(agent_ids), _MAX_PARAMS):
+                chunk = agent_ids[n:n + _MAX_PARAMS]
+                placeholders = ", ".join("?" for _ in chunk)
+                rows += conn.execute(f"{_CATALOG_QUERY} AND id IN ({placeholders})", chunk).fetchall()
+                tag_rows += conn.execute(
+                    f"SELECT agent_id, tag FROM agent_tags WHERE agent_id IN ({placeholders})", chunk
+                ).fetchall()
+        tags: Dict[str, List[str]] = {}
+        for agent_id, tag in tag_rows:
+            tags.setdefault(agent_id, []).append(tag)
+        return [_make_agent(row, tags.get(row[_ID], ())) for row in rows]
+
+    def _prune(self, conn):
+        """Drop change log entries every process has long since applied."""
+        snapshot = self.snapshot
+        if snapshot is None or snapshot.seq - self._pruned_through <= self.change_log_size:
+            return
+        through = snapshot.seq - self.change_log_size
+        conn.execute("DELETE FROM catalog_changes WHERE seq <= ?", (through,))
+        conn.commit()
+        self._pruned_through = through
+
+    def stats(self) -> dict:
+        snapshot = self.snapshot
+        return {
+            "ready": snapshot is not None,
+            "seq": snapshot.seq if snapshot else None,
+            "agents": len(snapshot.agents) if snapshot else 0,
+            "categories": len(snapshot.by_category) if snapshot else 0,
+            "tags": len(snapshot.by_tag) if snapshot else 0,
+            "rebuilds": self.rebuilds,
+            "patches": self.patches,
+            "errors": self.errors,
+            "last_refresh_seconds": self.last_refresh_seconds,
+            "last_refreshed": self.last_refreshed,
+        }
+
+class CatalogChangeWatcher:
+    """
+    Calls ``on_change`` when the change counter moves.
+
+    Agents written by another process (an approval, an edit from the admin
+    tools, another API worker) cannot invalidate this process's response
+    cache; a background thread reads the counter every ``poll_interval``
+    seconds instead, so such writes are noticed within one interval rather
+    than when cache entries expire.
+    """
+
+    def __init__(self, poll_interval: float, on_change: Callable[[], None]):
+        self.poll_interval = poll_interval
+        self.on_change = on_change
+        self.seq: Optional[int] = None
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        # Stats
+        self.changes = 0
+        self.errors = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="agenthub-catalog-watch", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        conn = create_connection()
+        try:
+            while not self._stopping:
+                try:
+                    self.check(conn)
+                except sqlite3.Error as e:
+                    self.errors += 1
+                    print(f"Catalog change check failed: {e}")
+                with self._cond:
+                    if not self._stopping:
+                        self._cond.wait(self.poll_interval)
+        finally:
+            conn.close()
+
+    def check(self, conn) -> bool:
+        """Call ``on_change`` if the counter moved since the last check; the first check only reads it."""
+        seq = change_counter(conn)
+        previous, self.seq = self.seq, seq
+        if previous is None or previous == seq:
+            return False
+        self.changes += 1
+        self.on_change()
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "running": self._thread is not None,
+            "seq": self.seq,
+            "changes": self.changes,
+            "errors": self.errors,
+        }
+
+catalog_snapshots = CatalogSnapshots(
+    poll_interval=settings.CATALOG_SNAPSHOT_POLL_SECONDS,
+    patch_limit=settings.CATALOG_SNAPSHOT_PATCH_LIMIT,
+    change_log_size=settings.CATALOG_CHANGE_LOG_SIZE,
+)
@@ -0,0 +1,213 @@
+"""
+Compression of stored job payloads and of HTTP responses.
+
+Job input and output are stored as JSON text; large ones are stored as a
+zlib-compressed BLOB behind a marker prefix instead. Rows written before
+compression existed are plain text and read back unchanged, so readers only
+need to go through unpack_text()/unpack_json().
+
+CompressionMiddleware gzip- or brotli-encodes responses (brotli if the
+optional ``brotli`` package is installed) according to the request's
+Accept-Encoding, skipping small bodies and Server-Sent Events.
+"""
+
+import json
+import zlib
+from typing import Any, Optional, Union
+
+from config import settings
+from metrics import http_compression_bytes
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+# Stored payloads starting with this are zlib data; JSON text never starts with a NUL byte
+PAYLOAD_MARKER = b"\x00z1"
+
+def pack_text(text: str) -> Union[str, bytes]:
+    """Return JSON text as-is, or compressed behind the marker if it is large and compresses well."""
+    minimum = settings.PAYLOAD_COMPRESSION_MIN_BYTES
+    if minimum <= 0 or len(text) < minimum:
+        return text
+    data = text.encode("utf-8")
+    compressed = zlib.compress(data, settings.PAYLOAD_COMPRESSION_LEVEL)
+    if len(compressed) + len(PAYLOAD_MARKER) >= len(data) * 0.9:
+        return text
+    return PAYLOAD_MARKER + compressed
+
+def pack_json(value: Any) -> Union[str, bytes]:
+    """Serialize a payload for an agent_jobs input/output column."""
+    return pack_text(json.dumps(value))
+
+def unpack_text(stored: Union[str, bytes, None]) -> Optional[str]:
+    """JSON text of a stored payload, whichever way it was written."""
+    if isinstance(stored, bytes):
+        if stored.startswith(PAYLOAD_MARKER):
+            return zlib.decompress(stored[len(PAYLOAD_MARKER):]).decode("utf-8")
+        return stored.decode("utf-8")
+    return stored
+
+def unpack_json(stored: Union[str, bytes, None]) -> Any:
+    """Decoded value of a stored payload; None for NULL or empty columns."""
+    text = unpack_text(stored)
+    return json.loads(text) if text else None
+
+_COMPRESSIBLE_TYPES = {
+    "application/json", "application/x-ndjson", "application/javascript",
+    "application/xml", "image/svg+xml",
+}
+
+def _compressible(content_type: str) -> bool:
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    if media_type == "text/event-stream":
+        # Events must reach the client as soon as they are sent
+        return False
+    return media_type.startswith("text/") or media_type.endswith("+json") or media_type in _COMPRESSIBLE_TYPES
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick "br" or "gzip" from an Accept-Encoding header, or None for identity."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            accepted[coding] = quality
+    wildcard = accepted.get("*", 0.0)
+    for coding in (("br", "gzip") if brotli is not None else ("gzip",)):
+        if accepted.get(coding, wildcard) > 0:
+            return coding
+    return None
+
+class _GzipEncoder:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31: gzip container
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        # A sync flush per chunk lets streamed responses reach the client as they are produced
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+class _BrotliEncoder:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        output = self._compressor.process(data)
+        return output + (self._compressor.finish() if final else self._compressor.flush())
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing response bodies per the request's Accept-Encoding.
+
+    Bodies sent in one piece are compressed only from ``minimum_size`` bytes;
+    streamed bodies (e.g. exports) are always compressed, chunk by chunk.
+
+    Every response that could be compressed carries ``Vary: Accept-Encoding``,
+    whether or not this one was, so shared caches keep the variants apart.
+    Its ETag is made weak, compressed or not and on 304s too, so a client
+    sees one validator per resource; cache.etag_matches compares weakly.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = negotiate_encoding(accept_encoding)
+
+        start_message = None
+        encoder = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, encoder, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            if passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if encoder is None:
+                headers = {name.lower(): value for name, value in start_message["headers"]}
+                status = start_message["status"]
+                # A 304 stands for the 200 it revalidates, which had a compressible body
+                eligible = b"content-encoding" not in headers and (
+                    status == 304
+                    or (status != 204 and _compressible(headers.get(b"content-type", b"").decode("latin-1")))
+                )
+                if eligible:
+                    start_message["headers"] = self._headers(start_message["headers"])
+                if (
+                    not eligible
+                    or encoding is None
+                    or status == 304
+                    or (not more_body and len(body) < self.minimum_size)
+                ):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                encoder = (
+                    _BrotliEncoder(self.brotli_quality) if encoding == "br" else _GzipEncoder(self.gzip_level)
+                )
+                compressed = encoder.compress(body, final=not more_body)
+                start_message["headers"] = self._headers(start_message["headers"], encoding,
+                                                         None if more_body else len(compressed))
+                await send(start_message)
+            else:
+                compressed = encoder.compress(body, final=not more_body)
+            http_compression_bytes.inc((encoding, "in"), len(body))
+            http_compression_bytes.inc((encoding, "out"), len(compressed))
+            await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    def _headers(raw_headers, encoding: Optional[str] = None, content_length: Optional[int] = None):
+        """Vary and a weak ETag; with ``encoding``, also the headers of the compressed body."""
+        headers = []
+        vary = None
+        for name, value in raw_headers:
+            lowered = name.lower()
+            if lowered == b"content-length" and encoding is not None:
+                continue
+            if lowered == b"vary":
+                vary = value
+                continue
+            if lowered == b"etag" and not value.startswith(b"W/"):
+                value = b"W/" + value
+            headers.append((name, value))
+        if vary is None:
+            vary = b"Accept-Encoding"
+        elif b"accept-encoding" not in vary.lower():
+            vary += b", Accept-Encoding"
+        headers.append((b"vary", vary))
+        if encoding is not None:
+            headers.append((b"content-encoding", encoding.encode("latin-1")))
+            if content_length is not None:
+                headers.append((b"content-length", str(content_length).encode("latin-1")))
+        return headers
@@ -16,6 +16,31 @@ class Settings:
     # Database Configuration
     DATABASE_PATH: str = os.getenv("DATABASE_PATH", "../agenthub/data/agents.db")
     
+    # Connection pool and per-connection tuning
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "8"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "5.0"))  # seconds to wait for a free connection
+    DB_BUSY_TIMEOUT_MS: int = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+    DB_CACHE_SIZE_KB: int = int(os.getenv("DB_CACHE_SIZE_KB", "65536"))  # page cache per connection
+    DB_MMAP_SIZE: int = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+    DB_STATEMENT_CACHE_SIZE: int = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))
+    # Threads running blocking database calls; 0 runs them inline on the event loop
+    DB_EXECUTOR_WORKERS: int = int(os.getenv("DB_EXECUTOR_WORKERS", str(DB_POOL_SIZE)))
+    
+    # Schema migrations: backfills of existing rows run in batches, pausing so other writers get the lock
+    MIGRATION_BATCH_SIZE: int = int(os.getenv("MIGRATION_BATCH_SIZE", "5000"))  # rows per transaction
+    MIGRATION_BATCH_PAUSE: float = float(os.getenv("MIGRATION_BATCH_PAUSE", "0.01"))  # seconds between batches
+    
+    # Response cache for catalog reads (0 entries or 0 TTL disables it)
+    RESPONSE_CACHE_MAX_ENTRIES: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2048"))
+    RESPONSE_CACHE_TTL_SECONDS: float = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "30"))
+    RESPONSE_CACHE_CHECK_SECONDS: float = float(os.getenv("RESPONSE_CACHE_CHECK_SECONDS", "1.0"))  # how late agents written by other processes are noticed (0 disables)
+    
+    # In-memory snapshot of the public catalog (active, approved agents), refreshed from catalog_changes
+    CATALOG_SNAPSHOT_ENABLED: bool = os.getenv("CATALOG_SNAPSHOT_ENABLED", "false").lower() == "true"
+    CATALOG_SNAPSHOT_POLL_SECONDS: float = float(os.getenv("CATALOG_SNAPSHOT_POLL_SECONDS", "1.0"))  # how stale it can get
+    CATALOG_SNAPSHOT_PATCH_LIMIT: int = int(os.getenv("CATALOG_SNAPSHOT_PATCH_LIMIT", "1000"))  # more changed agents than this rebuild it
+    CATALOG_CHANGE_LOG_SIZE: int = int(os.getenv("CATALOG_CHANGE_LOG_SIZE", "10000"))  # catalog_changes rows kept (at most migrations.CATALOG_CHANGE_LOG_MAX)
+    
     # CORS Configuration
     ALLOWED_ORIGINS: List[str] = [
         "http://localhost:3000",  # Next.js dev server
@@ -26,9 +51,75 @@ class Settings:
     DEFAULT_PAGE_SIZE: int = 50
     MAX_PAGE_SIZE: int = 100
     
+    # Bulk import
+    BULK_IMPORT_CHUNK_SIZE: int = int(os.getenv("BULK_IMPORT_CHUNK_SIZE", "500"))  # rows per transaction
+    BULK_IMPORT_MAX_RECORD_BYTES: int = int(os.getenv("BULK_IMPORT_MAX_RECORD_BYTES", str(1024 * 1024)))
+    BULK_IMPORT_RESULTS_MEMORY_BYTES: int = int(os.getenv("BULK_IMPORT_RESULTS_MEMORY_BYTES", str(1024 * 1024)))  # results kept in memory before spilling to a temp file
+    
+    # Export
+    EXPORT_CHUNK_SIZE: int = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))  # rows fetched per round trip
+    
     # Agent defaults
     DEFAULT_DEMO_LIMIT: int = 3
     
+    # Background job engine (0 workers disables it in this process)
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", "2"))
+    JOB_MAX_PER_AGENT: int = int(os.getenv("JOB_MAX_PER_AGENT", "2"))  # concurrent running jobs per agent
+    JOB_POLL_INTERVAL: float = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))  # seconds
+    JOB_HEARTBEAT_SECONDS: float = float(os.getenv("JOB_HEARTBEAT_SECONDS", "10"))  # how often running jobs are marked alive
+    JOB_STALE_SECONDS: float = float(os.getenv("JOB_STALE_SECONDS", "60"))  # requeue 'running' jobs without a heartbeat for this long
+    
+    # Job event streaming
+    SSE_HEARTBEAT_SECONDS: float = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+    JOB_EVENT_HISTORY: int = int(os.getenv("JOB_EVENT_HISTORY", "64"))  # buffered events per job for resume
+    JOB_EVENT_RETENTION_SECONDS: float = float(os.getenv("JOB_EVENT_RETENTION_SECONDS", "300"))
+    
+    # Compression: job input/output columns, and HTTP responses negotiated via Accept-Encoding
+    PAYLOAD_COMPRESSION_MIN_BYTES: int = int(os.getenv("PAYLOAD_COMPRESSION_MIN_BYTES", "1024"))  # 0 stores all payloads as text
+    PAYLOAD_COMPRESSION_LEVEL: int = int(os.getenv("PAYLOAD_COMPRESSION_LEVEL", "6"))
+    RESPONSE_COMPRESSION_ENABLED: bool = os.getenv("RESPONSE_COMPRESSION_ENABLED", "true").lower() == "true"
+    RESPONSE_COMPRESSION_MIN_BYTES: int = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+    RESPONSE_GZIP_LEVEL: int = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+    RESPONSE_BROTLI_QUALITY: int = int(os.getenv("RESPONSE_BROTLI_QUALITY", "4"))  # used when brotli is installed
+    
+    # Idempotency-Key handling for agent creation and demos
+    IDEMPOTENCY_TTL_SECONDS: float = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))  # how long responses are replayed
+    IDEMPOTENCY_LOCK_SECONDS: float = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))  # after this, an unfinished key is retried
+    
+    # Rate limiting and admission control (limits are class=requests per second/burst per client)
+    RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+    RATE_LIMITS: str = os.getenv("RATE_LIMITS", "read=50/200,write=2/20,demo=1/10,job=2/20,export=0.2/3")
+    RATE_LIMIT_MAX_CLIENTS: int = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "65536"))  # tracked per route class
+    RATE_LIMIT_WALLET_HEADER: str = os.getenv("RATE_LIMIT_WALLET_HEADER", "X-Wallet-Address")  # also limit per wallet when sent
+    RATE_LIMIT_TRUST_FORWARDED: bool = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() == "true"  # client IP from X-Forwarded-For
+    MAX_CONCURRENT_REQUESTS: int = int(os.getenv("MAX_CONCURRENT_REQUESTS", "256"))  # per process; 0 disables
+    
+    # Job retention: selector=days pairs, where a selector is "demo" or a final status (completed, failed)
+    RETENTION_ENABLED: bool = os.getenv("RETENTION_ENABLED", "false").lower() == "true"
+    RETENTION_POLICIES: str = os.getenv("RETENTION_POLICIES", "demo=30,failed=90,completed=365")
+    RETENTION_ARCHIVE: bool = os.getenv("RETENTION_ARCHIVE", "true").lower() == "true"  # copy to agent_jobs_archive before deleting
+    RETENTION_ARCHIVE_PATH: str = os.getenv("RETENTION_ARCHIVE_PATH", "")  # separate archive database; empty uses the main one
+    RETENTION_BATCH_SIZE: int = int(os.getenv("RETENTION_BATCH_SIZE", "500"))  # jobs per transaction
+    RETENTION_BATCH_PAUSE: float = float(os.getenv("RETENTION_BATCH_PAUSE", "0.05"))  # seconds between batches
+    RETENTION_INTERVAL_SECONDS: float = float(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+    RETENTION_VACUUM_PAGES: int = int(os.getenv("RETENTION_VACUUM_PAGES", "1024"))  # pages per incremental_vacuum step
+    
+    # Input validation
+    INPUT_VALIDATOR_CACHE_SIZE: int = int(os.getenv("INPUT_VALIDATOR_CACHE_SIZE", "1024"))  # compiled input_schema validators kept
+    
+    # Metrics
+    SQL_METRICS_ENABLED: bool = os.getenv("SQL_METRICS_ENABLED", "true").lower() == "true"  # per-statement timing in /metrics
+    
+    # Production server (serve.py); 0 workers means one per CPU core
+    SERVER_HOST: str = os.getenv("SERVER_HOST", "0.0.0.0")
+    SERVER_PORT: int = int(os.getenv("SERVER_PORT", "8000"))
+    SERVER_WORKERS: int = int(os.getenv("SERVER_WORKERS", "0"))
+    SERVER_BACKLOG: int = int(os.getenv("SERVER_BACKLOG", "2048"))  # pending connections queued by the kernel
+    SERVER_KEEP_ALIVE_SECONDS: int = int(os.getenv("SERVER_KEEP_ALIVE_SECONDS", "75"))  # longer than a proxy's idle timeout
+    SERVER_GRACEFUL_TIMEOUT: int = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", "30"))  # seconds to drain on SIGTERM
+    # Create/upgrade the schema when main is imported; serve.py does it once and turns this off for its workers
+    INIT_DATABASE: bool = os.getenv("INIT_DATABASE", "true").lower() == "true"
+    
     # Development settings
     DEBUG: bool = os.getenv("DEBUG", "true").lower() == "true"
     
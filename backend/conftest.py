@@ -0,0 +1,98 @@
+"""
+Shared set-up for the backend tests; run them with ``python -m pytest``.
+
+Settings are read once, when config is first imported, so the environment
+every test relies on is set here, before any test module imports the app:
+a throwaway database, no per-client rate limiting (all requests come from
+the same test client) and no background job workers.
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+WORKDIR = tempfile.mkdtemp(prefix="agenthub-test-")
+os.environ["DATABASE_PATH"] = os.path.join(WORKDIR, "test.db")
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+os.environ["JOB_WORKERS"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import settings
+
+# Drives a running server over HTTP; run it by hand with ``python test_api.py``
+collect_ignore = ["test_api.py"]
+
+AGENT_DEFAULTS = {
+    "name": "Test Agent",
+    "description": "Test agent",
+    "short_description": "Test",
+    "creator": "Test",
+    "creator_wallet": "addr_test",
+    "price": 1000000,
+    "category": "testing",
+    "tags": [],
+    "is_active": 1,
+    "is_approved": 1,
+    "demo_limit": 3,
+    "created_at": "2024-01-01T00:00:00",
+    "updated_at": "2024-01-01T00:00:00",
+    "input_schema": {},
+    "crewai_config": {},
+}
+
+def connect(path=None) -> sqlite3.Connection:
+    """A plain connection to the test database (or ``path``) returning rows by name."""
+    conn = sqlite3.connect(path or settings.DATABASE_PATH)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def insert_agent(conn, **fields) -> str:
+    """Insert an active, approved agent, with ``fields`` overriding the defaults, and return its id."""
+    row = {"id": str(uuid.uuid4()), **AGENT_DEFAULTS, **fields}
+    for name in ("tags", "input_schema", "crewai_config"):
+        if not isinstance(row[name], str):
+            row[name] = json.dumps(row[name])
+    conn.execute(
+        f"INSERT INTO agents ({', '.join(row)}) VALUES ({', '.join('?' for _ in row)})",
+        list(row.values()),
+    )
+    conn.commit()
+    return row["id"]
+
+@pytest.fixture(scope="session")
+def app():
+    import main
+    return main.app
+
+@pytest.fixture(scope="session")
+def client(app):
+    from fastapi.testclient import TestClient
+    return TestClient(app)
+
+@pytest.fixture
+def db():
+    conn = connect()
+    yield conn
+    conn.close()
+
+@pytest.fixture
+def create_agent(db):
+    """Factory inserting an active, approved agent straight into the database."""
+    return lambda **fields: insert_agent(db, **fields)
+
+@pytest.fixture
+def scratch_database():
+    """Point the settings at a new database file, named by the test; restored afterwards."""
+    saved = settings.DATABASE_PATH
+
+    def use(name: str) -> str:
+        settings.DATABASE_PATH = os.path.join(WORKDIR, f"{name}.db")
+        return settings.DATABASE_PATH
+
+    yield use
+    settings.DATABASE_PATH = saved
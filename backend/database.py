@@ -2,85 +2,420 @@
 Database utilities and initialization for AgentHub backend.
 """
 
+import asyncio
+import functools
+import re
 import sqlite3
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from config import settings
+from metrics import db_acquire_duration, sql_duration, sql_fetch_seconds, sql_rows
+from migrations import AGENT_TAGS_BACKFILL, CATALOG_FACETS_REBUILD, LATEST_VERSION, migrate, schema_version
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, schema init is not serialized
+    fcntl = None
+
+@contextmanager
+def schema_lock():
+    """Exclusive lock on a file next to the database, so only one process runs the DDL at a time."""
+    if fcntl is None:
+        yield
+        return
+    with open(f"{settings.DATABASE_PATH}.init-lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
 
 def init_database():
-    """Initialize the database with required tables."""
+    """Create or upgrade the schema; a single version check when it is already current."""
     # Ensure the data directory exists
     db_dir = os.path.dirname(settings.DATABASE_PATH)
-    if not os.path.exists(db_dir):
+    if db_dir and not os.path.exists(db_dir):
         os.makedirs(db_dir)
     
-    conn = sqlite3.connect(settings.DATABASE_PATH)
+    conn = create_connection()
     try:
-        # Create agents table if it doesn't exist
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS agents (
-                id TEXT PRIMARY KEY,
-                name TEXT NOT NULL,
-                description TEXT,
-                short_description TEXT,
-                creator TEXT NOT NULL,
-                creator_wallet TEXT NOT NULL,
-                price INTEGER NOT NULL,
-                category TEXT,
-                tags TEXT, -- JSON array
-                avatar TEXT,
-                is_active BOOLEAN DEFAULT TRUE,
-                is_approved BOOLEAN DEFAULT FALSE,
-                demo_limit INTEGER DEFAULT 3,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                nft_token_id TEXT,
-                input_schema TEXT, -- JSON
-                crewai_config TEXT -- JSON
-            )
-        """)
-        
-        # Create agent_jobs table for demo and job tracking
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS agent_jobs (
-                id TEXT PRIMARY KEY,
-                agent_id TEXT NOT NULL,
-                user_wallet TEXT NOT NULL,
-                status TEXT DEFAULT 'queued',
-                input TEXT, -- JSON
-                output TEXT, -- JSON
-                error TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                completed_at TIMESTAMP,
-                is_demo BOOLEAN DEFAULT FALSE,
-                FOREIGN KEY (agent_id) REFERENCES agents (id)
-            )
-        """)
-        
-        # Create indexes for better query performance
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_agents_category ON agents(category)")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_agents_creator ON agents(creator_wallet)")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_agents_active_approved ON agents(is_active, is_approved)")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_agent ON agent_jobs(agent_id)")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_user ON agent_jobs(user_wallet)")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_demo ON agent_jobs(is_demo)")
-        
-        conn.commit()
+        if schema_version(conn) == LATEST_VERSION:
+            return
+        with schema_lock():
+            # Another process may have migrated while we waited for the lock
+            migrate(conn)
         print("Database initialized successfully")
-        
     except sqlite3.Error as e:
         print(f"Database initialization error: {e}")
         raise
     finally:
         conn.close()
 
+def rebuild_search_index(conn):
+    """Rebuild agents_fts from the agents table."""
+    conn.execute("INSERT INTO agents_fts (agents_fts) VALUES ('rebuild')")
+
+def rebuild_catalog_facets(conn):
+    """Recount catalog_facets from the agents table."""
+    conn.execute("DELETE FROM catalog_facets")
+    conn.execute(CATALOG_FACETS_REBUILD)
+
+def backfill_agent_tags(conn, batch_size: int = 1000):
+    """
+    Populate agent_tags for existing agents, one rowid range per transaction.
+
+    Committing after every batch keeps each write lock short, so the backfill
+    can run against a live database without locking writers out. Re-running
+    it is harmless.
+    """
+    last_rowid = 0
+    total = 0
+    while True:
+        bounds = conn.execute(
+            "SELECT max(rowid) FROM (SELECT rowid FROM agents WHERE rowid > ? ORDER BY rowid LIMIT ?)",
+            (last_rowid, batch_size),
+        ).fetchone()
+        if bounds[0] is None:
+            break
+        cursor = conn.execute(AGENT_TAGS_BACKFILL, (last_rowid, bounds[0]))
+        conn.commit()
+        total += cursor.rowcount
+        last_rowid = bounds[0]
+    return total
+
+_STATEMENT_TABLE = re.compile(
+    r"\b(?:FROM|INTO|UPDATE|TABLE|INDEX|TRIGGER|ON)\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?(?!OF\b)(\w+)",
+    re.IGNORECASE,
+)
+
+@functools.lru_cache(maxsize=1024)
+def statement_label(sql: str) -> str:
+    """Low-cardinality metrics label for a statement, e.g. ``SELECT agents``."""
+    words = sql.split(None, 1)
+    if not words:
+        return "EMPTY"
+    verb = words[0].upper()
+    if verb in ("BEGIN", "COMMIT", "ROLLBACK", "PRAGMA", "SAVEPOINT", "RELEASE", "CREATE", "DROP"):
+        return verb
+    table = _STATEMENT_TABLE.search(sql)
+    return f"{verb} {table.group(1)}" if table else verb
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that records statement time, fetch time and row counts in metrics."""
+
+    _label = "UNKNOWN"
+
+    def execute(self, sql, parameters=()):
+        self._label = label = statement_label(sql)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            sql_duration.observe(time.perf_counter() - started, (label,))
+            if self.description is None and self.rowcount > 0:
+                sql_rows.inc((label,), self.rowcount)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._label = label = statement_label(sql)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            sql_duration.observe(time.perf_counter() - started, (label,))
+            if self.rowcount > 0:
+                sql_rows.inc((label,), self.rowcount)
+
+    def _fetched(self, started: float, count: int):
+        labels = (self._label,)
+        sql_fetch_seconds.inc(labels, time.perf_counter() - started)
+        if count:
+            sql_rows.inc(labels, count)
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(started, 0)
+            raise
+        self._fetched(started, 1)
+        return row
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows))
+        return rows
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors, including those of execute(), are instrumented."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+def create_connection():
+    """Open a new connection with the pragmas every pooled connection shares."""
+    conn = sqlite3.connect(
+        settings.DATABASE_PATH,
+        check_same_thread=False,  # pooled connections move between threads
+        cached_statements=settings.DB_STATEMENT_CACHE_SIZE,
+        factory=InstrumentedConnection if settings.SQL_METRICS_ENABLED else sqlite3.Connection,
+    )
+    conn.row_factory = sqlite3.Row  # Enable dict-like access to rows
+    conn.execute(f"PRAGMA busy_timeout = {int(settings.DB_BUSY_TIMEOUT_MS)}")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    # Negative cache_size is interpreted by SQLite as KiB rather than pages
+    conn.execute(f"PRAGMA cache_size = -{int(settings.DB_CACHE_SIZE_KB)}")
+    conn.execute(f"PRAGMA mmap_size = {int(settings.DB_MMAP_SIZE)}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+class ConnectionPool:
+    """Bounded pool of pre-configured SQLite connections.
+
+    Idle connections are reused LIFO so the most recently used (and therefore
+    warmest) page cache is handed out first. When every connection is checked
+    out, callers wait up to ``timeout`` seconds for one to be released.
+    """
+
+    def __init__(self, size: int, timeout: float):
+        self.size = max(1, size)
+        self.timeout = timeout
+        self._idle = []
+        self._created = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        # Stats
+        self.hits = 0  # served from an idle connection
+        self.misses = 0  # had to open a new connection
+        self.waits = 0  # had to wait for a connection to be released
+        self.timeouts = 0
+        self.wait_time = 0.0
+
+    def acquire(self):
+        """Check out a connection, opening or waiting for one as needed."""
+        started = time.perf_counter()
+        try:
+            return self._acquire()
+        finally:
+            db_acquire_duration.observe(time.perf_counter() - started)
+
+    def _acquire(self):
+        with self._cond:
+            if self._closed:
+                raise sqlite3.OperationalError("Connection pool is closed")
+            if self._idle:
+                self.hits += 1
+                return self._idle.pop()
+            if self._created < self.size:
+                self._created += 1
+                self.misses += 1
+            else:
+                self.waits += 1
+                started = time.perf_counter()
+                deadline = started + self.timeout
+                while not self._idle:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0 or not self._cond.wait(remaining):
+                        if self._idle:
+                            break
+                        self.wait_time += time.perf_counter() - started
+                        self.timeouts += 1
+                        raise sqlite3.OperationalError(
+                            "Timed out waiting for a database connection"
+                        )
+                self.wait_time += time.perf_counter() - started
+                return self._idle.pop()
+
+        try:
+            return create_connection()
+        except Exception:
+            with self._cond:
+                self._created -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn):
+        """Return a connection to the pool, rolling back any open transaction."""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self.discard(conn)
+            return
+        with self._cond:
+            if self._closed:
+                self._created -= 1
+                conn.close()
+                return
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def discard(self, conn):
+        """Close a connection that should not be reused."""
+        try:
+            conn.close()
+        finally:
+            with self._cond:
+                self._created -= 1
+                self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """Close all idle connections; checked-out ones are closed on release."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            conn.close()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "size": self.size,
+                "open": self._created,
+                "idle": len(self._idle),
+                "in_use": self._created - len(self._idle),
+                "hits": self.hits,
+                "misses": self.misses,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "wait_time_seconds": round(self.wait_time, 6),
+            }
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """Return the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(settings.DB_POOL_SIZE, settings.DB_POOL_TIMEOUT)
+    return _pool
+
+def close_pool():
+    """Close the process-wide pool (used on application shutdown)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
 def get_db_connection():
-    """Get a database connection with proper configuration."""
+    """Get a pooled database connection; hand it back with release_db_connection()."""
+    return get_pool().acquire()
+
+def release_db_connection(conn):
+    """Return a connection obtained from get_db_connection() to the pool."""
+    get_pool().release(conn)
+
+def get_pool_stats() -> dict:
+    """Hit/miss/wait counters for the connection pool."""
+    return get_pool().stats()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_db_executor() -> ThreadPoolExecutor:
+    """Return the thread pool that runs blocking database work."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.DB_EXECUTOR_WORKERS,
+                    thread_name_prefix="agenthub-db",
+                )
+    return _executor
+
+def shutdown_db_executor():
+    """Wait for queued database work to finish and stop the executor."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+def _call_with_connection(fn, args, kwargs):
+    with get_pool().connection() as conn:
+        return fn(conn, *args, **kwargs)
+
+async def run_db(fn, *args, **kwargs):
+    """
+    Run ``fn(conn, *args, **kwargs)`` with a pooled connection off the event loop.
+
+    The executor is sized to the connection pool, so each worker thread
+    effectively owns one connection and never waits on the pool. Setting
+    DB_EXECUTOR_WORKERS to 0 runs the call inline on the event loop.
+    """
+    if settings.DB_EXECUTOR_WORKERS <= 0:
+        return _call_with_connection(fn, args, kwargs)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_db_executor(), functools.partial(_call_with_connection, fn, args, kwargs)
+    )
+
+async def stream_query(query: str, params=(), chunk_size: int = 1000, encode=None):
+    """
+    Yield the result of a query as lists of up to ``chunk_size`` rows.
+
+    The query runs on a dedicated connection rather than a pooled one, so a
+    long export does not hold a request connection, and each chunk is
+    fetched on the database executor. Only one chunk is in memory at a time,
+    and the whole export reads from one consistent snapshot. With ``encode``,
+    each chunk is passed through it on the executor as well, and its result
+    is yielded instead.
+    """
+    loop = asyncio.get_running_loop()
+    executor = get_db_executor() if settings.DB_EXECUTOR_WORKERS > 0 else None
+    conn = await loop.run_in_executor(executor, create_connection)
     try:
-        conn = sqlite3.connect(settings.DATABASE_PATH)
-        conn.row_factory = sqlite3.Row  # Enable dict-like access to rows
-        return conn
-    except sqlite3.Error as e:
-        raise Exception(f"Database connection error: {str(e)}")
+        cursor = await loop.run_in_executor(executor, conn.execute, query, params)
+
+        def fetch():
+            rows = cursor.fetchmany(chunk_size)
+            return (encode(rows) if encode is not None else rows) if rows else None
+
+        while True:
+            chunk = await loop.run_in_executor(executor, fetch)
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        await loop.run_in_executor(executor, conn.close)
 
 if __name__ == "__main__":
     init_database()
\ No newline at end of file
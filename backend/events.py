@@ -0,0 +1,139 @@
+"""
+In-process publish/subscribe of job events for streaming to clients.
+
+The job engine publishes status transitions and partial output from its
+worker threads; Server-Sent Events handlers subscribe from the event loop.
+Each job keeps a short, bounded history so a reconnecting client can resume
+from the last event id it saw.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from config import settings
+from serialization import dumps
+
+class JobEvent(NamedTuple):
+    id: int
+    event: str
+    data: str  # JSON, encoded once at publish time
+    final: bool
+
+    def encode(self) -> bytes:
+        """Render the event in text/event-stream format."""
+        return f"id: {self.id}\nevent: {self.event}\ndata: {self.data}\n\n".encode("utf-8")
+
+class _Subscriber:
+    __slots__ = ("loop", "queue")
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+class _Channel:
+    __slots__ = ("history", "next_id", "subscribers", "last_activity")
+
+    def __init__(self, history_size: int):
+        self.history = deque(maxlen=history_size)
+        self.next_id = 1
+        self.subscribers = set()
+        self.last_activity = time.monotonic()
+
+class JobEventBroker:
+    """
+    Fan out job events to asyncio subscribers from any thread.
+
+    An idle subscription costs one small queue and no task of its own, so a
+    worker can hold thousands of them. A channel without subscribers is kept
+    for ``retention_seconds`` after its last event so late or reconnecting
+    subscribers still see the outcome.
+    """
+
+    def __init__(self, history_size: int, retention_seconds: float):
+        self.history_size = history_size
+        self.retention_seconds = retention_seconds
+        self._channels: Dict[str, _Channel] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def publish(self, job_id: str, event: str, payload: dict, final: bool = False) -> JobEvent:
+        """Record an event for a job and deliver it to current subscribers."""
+        data = dumps(payload).decode("utf-8")
+        with self._lock:
+            self._sweep()
+            channel = self._channels.get(job_id)
+            if channel is None:
+                channel = self._channels[job_id] = _Channel(self.history_size)
+            job_event = JobEvent(channel.next_id, event, data, final)
+            channel.next_id += 1
+            channel.history.append(job_event)
+            channel.last_activity = time.monotonic()
+            subscribers = list(channel.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.queue.put_nowait, job_event)
+            except RuntimeError:
+                # The subscriber's event loop has shut down
+                self.unsubscribe(job_id, subscriber)
+        return job_event
+
+    def subscribe(self, job_id: str, last_event_id: Optional[int] = None) -> Tuple[List[JobEvent], _Subscriber]:
+        """
+        Subscribe the running event loop to a job's events.
+
+        Returns the buffered events newer than ``last_event_id`` (all buffered
+        events if None) and a subscriber whose queue receives later events.
+        """
+        subscriber = _Subscriber(asyncio.get_running_loop())
+        with self._lock:
+            channel = self._channels.get(job_id)
+            if channel is None:
+                channel = self._channels[job_id] = _Channel(self.history_size)
+            backlog = [
+                job_event for job_event in channel.history
+                if last_event_id is None or job_event.id > last_event_id
+            ]
+            channel.subscribers.add(subscriber)
+            channel.last_activity = time.monotonic()
+        return backlog, subscriber
+
+    def unsubscribe(self, job_id: str, subscriber: _Subscriber):
+        with self._lock:
+            channel = self._channels.get(job_id)
+            if channel is not None:
+                channel.subscribers.discard(subscriber)
+                channel.last_activity = time.monotonic()
+
+    def has_events(self, job_id: str) -> bool:
+        """Whether this process has published anything for the job."""
+        with self._lock:
+            channel = self._channels.get(job_id)
+            return channel is not None and channel.next_id > 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "channels": len(self._channels),
+                "subscribers": sum(len(c.subscribers) for c in self._channels.values()),
+            }
+
+    def _sweep(self):
+        """Drop channels nobody has touched for retention_seconds (lock held)."""
+        now = time.monotonic()
+        if now - self._last_sweep < 1.0:
+            return
+        self._last_sweep = now
+        expired = [
+            job_id for job_id, channel in self._channels.items()
+            if not channel.subscribers and now - channel.last_activity > self.retention_seconds
+        ]
+        for job_id in expired:
+            del self._channels[job_id]
+
+job_events = JobEventBroker(
+    settings.JOB_EVENT_HISTORY,
+    settings.JOB_EVENT_RETENTION_SECONDS,
+)
@@ -0,0 +1,102 @@
+"""
+Row encoders for streaming table exports as NDJSON or CSV.
+"""
+
+import csv
+import functools
+import io
+import json
+import zlib
+from typing import AsyncIterator, Callable, Iterable, List, Optional, Sequence
+
+from compression import unpack_text
+from serialization import dumps
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+AGENT_EXPORT_COLUMNS = (
+    "id", "name", "description", "short_description", "creator", "creator_wallet",
+    "price", "category", "tags", "avatar", "is_active", "is_approved", "demo_limit",
+    "created_at", "updated_at", "nft_token_id", "input_schema", "crewai_config",
+)
+AGENT_JSON_COLUMNS = ("tags", "input_schema", "crewai_config")
+AGENT_BOOL_COLUMNS = ("is_active", "is_approved")
+
+JOB_EXPORT_COLUMNS = (
+    "id", "agent_id", "user_wallet", "status", "input", "output", "error",
+    "created_at", "started_at", "completed_at", "is_demo",
+)
+JOB_JSON_COLUMNS = ("input", "output")
+JOB_BOOL_COLUMNS = ("is_demo",)
+
+def _stored_text(stored) -> Optional[str]:
+    """A stored JSON cell as text; None if it cannot be decompressed or decoded."""
+    try:
+        return unpack_text(stored)
+    except (zlib.error, UnicodeDecodeError):
+        return None
+
+def _stored_value(stored):
+    """A stored JSON cell's value; its raw text if that is not valid JSON."""
+    text = _stored_text(stored)
+    if not text:
+        return None
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+def _ndjson_chunk(rows: Iterable, json_columns: Sequence[str], bool_columns: Sequence[str]) -> bytes:
+    lines = []
+    for row in rows:
+        record = dict(row)
+        for column in json_columns:
+            record[column] = _stored_value(record[column])
+        for column in bool_columns:
+            record[column] = bool(record[column])
+        lines.append(dumps(record))
+    lines.append(b"")
+    return b"\n".join(lines)
+
+def _csv_chunk(rows: Iterable, json_indexes: Sequence[int]) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        values = list(row)
+        for index in json_indexes:
+            values[index] = _stored_text(values[index])
+        writer.writerow(values)
+    return buffer.getvalue().encode("utf-8")
+
+def chunk_encoder(export_format: str, columns: Sequence[str], json_columns: Sequence[str],
+                  bool_columns: Sequence[str]) -> Callable[[List], bytes]:
+    """
+    The function encoding one chunk of rows (selected in ``columns`` order).
+
+    NDJSON decodes the JSON columns into nested values; CSV keeps them as JSON
+    text in their cells (decompressed if stored compressed). A cell that
+    cannot be decoded is exported as its raw text, or null (an empty CSV
+    cell), so one bad row cannot cut the export short.
+    """
+    if export_format == "csv":
+        json_indexes = [columns.index(column) for column in json_columns]
+        return functools.partial(_csv_chunk, json_indexes=json_indexes)
+    return functools.partial(_ndjson_chunk, json_columns=json_columns, bool_columns=bool_columns)
+
+async def encode_rows(chunks: AsyncIterator[bytes], export_format: str,
+                      columns: Sequence[str]) -> AsyncIterator[bytes]:
+    """
+    The export body: chunks already encoded by chunk_encoder, after a header row for CSV.
+
+    Encoding decompresses and re-serializes every row, so stream_query runs it
+    on the database executor along with the fetch, not on the event loop.
+    """
+    if export_format == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(columns)
+        yield buffer.getvalue().encode("utf-8")
+    async for chunk in chunks:
+        yield chunk
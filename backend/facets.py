@@ -0,0 +1,128 @@
+"""
+Facet counts for the marketplace filters: agents per category, per tag and
+per price bucket for a combination of list_agents filters.
+
+Each facet ignores its own filter, so a filter panel can show what the
+alternatives would return: category counts ignore ``category``, and tag
+counts ignore the tags unless tag_match is ``all`` (then every further tag
+narrows the result, and the counts say by how much). The price histogram
+and the total apply every filter.
+
+Counts for the public catalog, overall and per tag, are kept up to date by
+triggers in catalog_facets (see migrations.py). Facets of the public
+catalog filtered by category and at most one tag are summed from there,
+in time that does not grow with the number of agents. Other combinations
+(several tags, tag_match=all tag counts, non-public listings) are counted
+in SQL over the matching agents, starting from agent_tags or the
+idx_agents_facets covering index.
+"""
+
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from migrations import PRICE_BUCKETS, price_bucket_sql
+
+MAX_TAG_LIMIT = 1000
+
+# (category or '', price bucket edge) -> number of agents
+Grid = Dict[Tuple[str, int], int]
+
+def _tagged(tags: Sequence[str], tag_match: str) -> Tuple[str, list]:
+    """Subquery for the ids of agents with any (or all) of ``tags``, as list_agents filters them."""
+    sql = f"SELECT agent_id FROM agent_tags WHERE tag IN ({', '.join('?' for _ in tags)}) GROUP BY agent_id"
+    params = list(tags)
+    if tag_match == "all":
+        sql += " HAVING COUNT(*) = ?"
+        params.append(len(tags))
+    return sql, params
+
+def _stored_grid(conn, tag: str = "") -> Grid:
+    rows = conn.execute("SELECT category, bucket, count FROM catalog_facets WHERE tag = ?", (tag,))
+    return {(category, bucket): count for category, bucket, count in rows}
+
+def _counted_grid(conn, tags: Sequence[str], tag_match: str, is_active: bool, is_approved: bool) -> Grid:
+    params: list = []
+    if tags:
+        # Start from the tag index and fetch the matching agents by primary key
+        tagged, params = _tagged(tags, tag_match)
+        source = f"({tagged}) AS tagged CROSS JOIN agents ON agents.id = tagged.agent_id"
+    else:
+        source = "agents"
+    rows = conn.execute(f"""
+        SELECT coalesce(category, ''), {price_bucket_sql("price")}, COUNT(*)
+        FROM {source} WHERE is_active = ? AND is_approved = ?
+        GROUP BY 1, 2
+    """, params + [is_active, is_approved])
+    return {(category, bucket): count for category, bucket, count in rows}
+
+def _stored_tags(conn, category: Optional[str], limit: int) -> List[tuple]:
+    query = "SELECT tag, SUM(count) AS n FROM catalog_facets WHERE tag != ''"
+    params: list = []
+    if category:
+        query += " AND category = ?"
+        params.append(category)
+    query += " GROUP BY tag ORDER BY n DESC, tag LIMIT ?"
+    return conn.execute(query, params + [limit]).fetchall()
+
+def _counted_tags(conn, category: Optional[str], tags: Sequence[str], is_active: bool, is_approved: bool,
+                  limit: int) -> List[tuple]:
+    params: list = []
+    if tags:
+        tagged, params = _tagged(tags, "all")
+        source = f"""
+            ({tagged}) AS tagged
+            CROSS JOIN agents a ON a.id = tagged.agent_id
+            CROSS JOIN agent_tags t ON t.agent_id = a.id
+        """
+    else:
+        source = "agents a JOIN agent_tags t ON t.agent_id = a.id"
+    query = f"SELECT t.tag, COUNT(*) AS n FROM {source} WHERE a.is_active = ? AND a.is_approved = ?"
+    params.extend([is_active, is_approved])
+    if category:
+        query += " AND a.category = ?"
+        params.append(category)
+    query += " GROUP BY t.tag ORDER BY n DESC, t.tag LIMIT ?"
+    return conn.execute(query, params + [limit]).fetchall()
+
+def agent_facets(conn, category: Optional[str] = None, tags: Sequence[str] = (), tag_match: str = "any",
+                 is_active: bool = True, is_approved: bool = True, tag_limit: int = 50) -> dict:
+    """
+    Facet counts for the agents list_agents would return with these filters.
+
+    ``tags`` must already be normalized. Categories and tags are listed most
+    common first; agents without a category count towards the total and
+    the histogram only. Price buckets cover [min, max) lovelace, and the
+    last one has no upper bound.
+    """
+    public = bool(is_active and is_approved)
+    if public and len(tags) <= 1:
+        # With a single tag, any and all match the same agents
+        grid = _stored_grid(conn, tags[0] if tags else "")
+    else:
+        grid = _counted_grid(conn, tags, tag_match, is_active, is_approved)
+    categories: Counter = Counter()
+    prices: Counter = Counter()
+    for (agent_category, bucket), count in grid.items():
+        categories[agent_category] += count
+        if not category or agent_category == category:
+            prices[bucket] += count
+
+    # With tag_match=any the selected tags are alternatives, so they do not narrow the tag counts
+    narrowing = tags if tag_match == "all" else ()
+    if public and not narrowing:
+        tag_counts = _stored_tags(conn, category, tag_limit)
+    else:
+        tag_counts = _counted_tags(conn, category, narrowing, is_active, is_approved, tag_limit)
+
+    upper_edges = PRICE_BUCKETS[1:] + (None,)
+    return {
+        "total": sum(prices.values()),
+        "categories": [
+            {"value": name, "count": count}
+            for name, count in sorted(categories.items(), key=lambda item: (-item[1], item[0])) if name
+        ],
+        "tags": [{"value": tag, "count": count} for tag, count in tag_counts],
+        "price": [
+            {"min": low, "max": high, "count": prices.get(low, 0)} for low, high in zip(PRICE_BUCKETS, upper_edges)
+        ],
+    }
@@ -0,0 +1,371 @@
+"""
+Generate deterministic synthetic marketplace data for scale testing.
+
+Fills the agents and agent_jobs tables created by init_database with data
+shaped like a real marketplace: a few categories and tags hold most agents
+(Zipf), a few agents and wallets account for most jobs (power law), and JSON
+payload sizes are log-normally distributed. The same arguments and seed always
+produce the same rows.
+
+Jobs draw their input and output from PAYLOAD_TEMPLATES payloads of each
+kind, packed once up front, so the cost per job is building one row tuple.
+
+Rows are loaded in large transactions with secondary indexes and triggers
+dropped; they are recreated afterwards and the derived tables (search index,
+tag index, facet counts, demo counters) are rebuilt in one pass each.
+
+Usage:
+    python generate_data.py --db data/scale.db --agents 100000 --jobs 10000000 [--seed 42] [--replace]
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from itertools import islice
+from math import log
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from compression import pack_json
+from config import settings
+import database
+
+CATEGORIES = (
+    "research", "writing", "coding", "finance", "marketing", "data", "support", "design",
+    "legal", "education", "sales", "health", "travel", "gaming", "music", "security",
+    "productivity", "translation", "social", "defi",
+)
+TAGS = (
+    "research", "summary", "report", "market", "trading", "python", "review", "translate",
+    "email", "social", "image", "audit", "contract", "cardano", "wallet", "analysis",
+    "forecast", "assistant", "support", "seo", "content", "legal", "invoice", "schedule",
+    "chatbot", "automation", "crypto", "nft", "defi", "staking", "blog", "copywriting",
+    "resume", "interview", "tutor", "math", "science", "news", "sentiment", "scraping",
+    "pdf", "spreadsheet", "sql", "javascript", "testing", "devops", "security", "compliance",
+    "tax", "budget", "portfolio", "pricing", "sales", "crm", "leads", "outreach",
+    "video", "audio", "music", "podcast", "travel", "recipes", "fitness", "health",
+    "medical", "gaming", "strategy", "planning", "notes", "meeting", "calendar", "hr",
+    "recruiting", "onboarding", "docs", "api", "data", "etl", "dashboard", "charts",
+)
+# Properties generated input_schemas draw from; example_input() satisfies any of them
+INPUT_PROPERTIES = {
+    "topic": {"type": "string", "minLength": 1},
+    "query": {"type": "string"},
+    "text": {"type": "string"},
+    "url": {"type": "string"},
+    "instructions": {"type": "string"},
+    "context": {"type": "string"},
+    "language": {"type": "string", "enum": ["en", "es", "fr", "de", "ja"]},
+    "max_results": {"type": "integer", "minimum": 1, "maximum": 50},
+}
+FREE_TEXT_INPUTS = ("topic", "query", "text", "url", "instructions", "context")
+
+# Distinct packed inputs and outputs of each kind that generated jobs share
+PAYLOAD_TEMPLATES = 4096
+_JOB_CHUNK = 10_000
+
+# Partial indexes no generated job falls into: they cost nothing to keep while
+# loading, whereas recreating one is a full scan of agent_jobs
+KEPT_INDEXES = ("idx_jobs_queued", "idx_jobs_running")
+
+# The variant and version bits uuid.UUID(version=4) sets
+_UUID4_CLEAR = ~((0xc000 << 48) | (0xf000 << 64))
+_UUID4_SET = (0x8000 << 48) | (4 << 76)
+
+# Time window the generated history covers
+START = datetime(2024, 1, 1).timestamp()
+END = datetime(2025, 12, 31).timestamp()
+
+def zipf_cum_weights(n: int, s: float = 1.1):
+    """Cumulative Zipf weights for ranks 1..n, for random.choices(cum_weights=...)."""
+    total = 0.0
+    cumulative = []
+    for rank in range(1, n + 1):
+        total += 1.0 / rank ** s
+        cumulative.append(total)
+    return cumulative
+
+def pareto_cum_weights(rng: random.Random, n: int, alpha: float = 1.16):
+    """Cumulative power-law weights (alpha 1.16 is the classic 80/20 split)."""
+    total = 0.0
+    cumulative = []
+    for _ in range(n):
+        total += rng.paretovariate(alpha)
+        cumulative.append(total)
+    return cumulative
+
+class TextSource:
+    """Deterministic filler text; slices of one corpus stand in for free text of any length."""
+
+    def __init__(self, rng: random.Random, size: int = 1 << 18):
+        words = []
+        length = 0
+        while length < size:
+            word = rng.choice(TAGS)
+            words.append(word)
+            length += len(word) + 1
+        self.corpus = " ".join(words)
+        self.rng = rng
+
+    def text(self, length: int) -> str:
+        length = max(1, min(length, len(self.corpus)))
+        start = self.rng.randrange(len(self.corpus) - length + 1)
+        return self.corpus[start:start + length]
+
+    def lognormal_text(self, median: float, sigma: float, cap: int) -> str:
+        return self.text(min(cap, int(self.rng.lognormvariate(0, sigma) * median)))
+
+def _uuid4(bits: int) -> str:
+    """str(uuid.UUID(int=bits, version=4)), without building a UUID."""
+    h = "%032x" % (bits & _UUID4_CLEAR | _UUID4_SET)
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+def _timestamp(ts: float) -> str:
+    return datetime.utcfromtimestamp(ts).isoformat()
+
+def example_input() -> dict:
+    """A job input that is valid for every generated input_schema."""
+    return {"topic": "benchmark", "query": "benchmark", "text": "benchmark", "url": "https://example.com",
+            "instructions": "benchmark", "context": "benchmark", "language": "en", "max_results": 5}
+
+def _input_schema(rng: random.Random) -> str:
+    keys = rng.sample(list(INPUT_PROPERTIES), rng.randint(1, 5))
+    properties = {
+        key: {**INPUT_PROPERTIES[key], "title": key.replace("_", " ").title(), "description": f"The {key} for this run"}
+        for key in keys
+    }
+    return json.dumps({"type": "object", "properties": properties, "required": keys[:1]})
+
+def _crewai_config(rng: random.Random, text: TextSource) -> str:
+    return json.dumps({
+        "agents": [
+            {"role": text.text(20), "goal": text.lognormal_text(80, 0.5, 400), "backstory": text.lognormal_text(200, 0.7, 2000)}
+            for _ in range(rng.randint(1, 3))
+        ],
+        "tasks": [
+            {"description": text.lognormal_text(150, 0.6, 1500), "expected_output": text.text(60)}
+            for _ in range(rng.randint(1, 4))
+        ],
+    })
+
+def agent_rows(rng: random.Random, text: TextSource, count: int, agent_ids: list, agent_created: list):
+    """Yield agents rows, recording each id and creation time for job generation."""
+    category_weights = zipf_cum_weights(len(CATEGORIES))
+    tag_weights = zipf_cum_weights(len(TAGS))
+    creators = max(1, count // 20)
+    creator_weights = pareto_cum_weights(rng, creators)
+    span = END - START
+    for i in range(count):
+        agent_id = _uuid4(rng.getrandbits(128))
+        # Catalog growth: more agents are published later in the window
+        created = START + span * rng.random() ** 0.5
+        agent_ids.append(agent_id)
+        agent_created.append(created)
+        tags = []
+        for tag in rng.choices(TAGS, cum_weights=tag_weights, k=rng.randint(1, 8)):
+            if tag not in tags:
+                tags.append(tag)
+        creator = rng.choices(range(creators), cum_weights=creator_weights)[0]
+        timestamp = _timestamp(created)
+        yield (
+            agent_id,
+            f"{tags[0].title()} {rng.choice(TAGS).title()} Agent {i}",
+            text.lognormal_text(400, 0.6, 1000),
+            text.lognormal_text(80, 0.4, 200),
+            f"creator-{creator}",
+            f"addr_creator_{creator:06d}",
+            int(rng.lognormvariate(15, 1.2)),  # lovelace, median ~3 ADA
+            rng.choices(CATEGORIES, cum_weights=category_weights)[0],
+            json.dumps(tags),
+            None if rng.random() < 0.3 else f"https://cdn.example.com/avatars/{i}.png",
+            rng.random() < 0.95,  # is_active
+            rng.random() < 0.8,  # is_approved
+            rng.choice((0, 3, 3, 3, 5, 10)),
+            timestamp,
+            timestamp,
+            None,
+            _input_schema(rng),
+            _crewai_config(rng, text),
+        )
+
+def payload_templates(rng: random.Random, text: TextSource, count: int = PAYLOAD_TEMPLATES):
+    """
+    Packed job inputs, demo outputs and paid outputs for job_rows to draw from.
+
+    Building and compressing a payload per job dominated generation time, so
+    ``count`` of each are built once, with the same log-normal sizes, and
+    every job stores one of them.
+    """
+    inputs, demo_outputs, outputs = [], [], []
+    for _ in range(count):
+        job_input = {key: text.lognormal_text(60, 1.0, 4000) for key in rng.sample(FREE_TEXT_INPUTS, rng.randint(1, 3))}
+        if rng.random() < 0.3:
+            job_input["max_results"] = rng.randint(1, 50)
+        inputs.append(pack_json(job_input))
+        demo_outputs.append(pack_json({"result": text.lognormal_text(300, 1.1, 64_000)}))
+        outputs.append(pack_json({"result": text.lognormal_text(1500, 1.1, 64_000)}))
+    return inputs, demo_outputs, outputs
+
+def job_rows(rng: random.Random, text: TextSource, count: int, agent_ids: list, agent_created: list,
+             agent_weights: list, wallets: int, wallet_weights: list):
+    """Yield agent_jobs rows with power-law agent and wallet activity."""
+    inputs, demo_outputs, outputs = payload_templates(rng, text)
+    templates = len(inputs)
+    errors = ("Agent timed out", "Upstream model error", "Invalid tool response")
+    agents = [(agent_id, created, END - created) for agent_id, created in zip(agent_ids, agent_created)]
+    wallet_names = [f"addr_user_{wallet:07d}" for wallet in range(wallets)]
+    random, getrandbits, utcfromtimestamp = rng.random, rng.getrandbits, datetime.utcfromtimestamp
+    for offset in range(0, count, _JOB_CHUNK):
+        # Weighted picks are drawn a chunk at a time: one choices() call per row costs more than the row
+        size = min(_JOB_CHUNK, count - offset)
+        picked_agents = rng.choices(agents, cum_weights=agent_weights, k=size)
+        picked_wallets = rng.choices(wallet_names, cum_weights=wallet_weights, k=size)
+        for (agent_id, published, remaining), wallet in zip(picked_agents, picked_wallets):
+            created = published + remaining * random()
+            is_demo = random() < 0.3
+            if random() < 0.08:
+                status, output, error = "failed", None, errors[int(random() * len(errors))]
+            else:
+                status, output, error = "completed", (demo_outputs if is_demo else outputs)[int(random() * templates)], None
+            # Exponential queue and run times, 2 s and 20 s on average
+            started = created - 2.0 * log(1.0 - random())
+            completed = started - 20.0 * log(1.0 - random())
+            yield (
+                _uuid4(getrandbits(128)),
+                agent_id,
+                wallet,
+                status,
+                inputs[int(random() * templates)],
+                output,
+                error,
+                utcfromtimestamp(created).isoformat(),
+                utcfromtimestamp(started).isoformat(),
+                utcfromtimestamp(completed).isoformat(),
+                is_demo,
+            )
+
+def _drop_indexes_and_triggers(conn):
+    """Drop secondary indexes and triggers on the loaded tables; return the SQL to recreate them."""
+    saved = conn.execute(f"""
+        SELECT type, name, sql FROM sqlite_master
+        WHERE type IN ('index', 'trigger') AND tbl_name IN ('agents', 'agent_jobs') AND sql IS NOT NULL
+          AND name NOT IN ({", ".join("?" for _ in KEPT_INDEXES)})
+        ORDER BY type = 'trigger', name
+    """, KEPT_INDEXES).fetchall()
+    for kind, name, _ in saved:
+        conn.execute(f"DROP {kind.upper()} {name}")
+    return [sql for _, _, sql in saved]
+
+def _load(conn, sql: str, rows, batch_size: int, label: str, total: int):
+    started = time.perf_counter()
+    done = 0
+    while True:
+        # executemany pulls each batch straight from the generator; no list of rows is built
+        before = conn.total_changes
+        conn.executemany(sql, islice(rows, batch_size))
+        conn.commit()
+        inserted = conn.total_changes - before
+        if not inserted:
+            break
+        done += inserted
+        elapsed = time.perf_counter() - started
+        print(f"  {label}: {done}/{total} ({done / elapsed:,.0f} rows/s)")
+    return time.perf_counter() - started
+
+def generate(db_path: str, agents: int, jobs: int, wallets: int = None, seed: int = 42,
+             batch_size: int = 50_000, cache_size_kb: int = 1 << 20) -> dict:
+    """Create the schema at ``db_path`` if needed and load synthetic data; return timings."""
+    timings = {}
+    settings.DATABASE_PATH = db_path
+    database.init_database()
+    database.close_pool()
+
+    wallets = wallets or max(100, jobs // 25)
+    rng = random.Random(seed)
+    text = TextSource(random.Random(seed + 1))
+
+    conn = sqlite3.connect(db_path)
+    try:
+        if conn.execute("SELECT EXISTS (SELECT 1 FROM agents)").fetchone()[0]:
+            raise SystemExit(f"{db_path} already contains agents; use --replace to start over")
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute(f"PRAGMA cache_size = -{int(cache_size_kb)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        recreate = _drop_indexes_and_triggers(conn)
+        conn.commit()
+
+        agent_ids, agent_created = [], []
+        timings["agents_seconds"] = _load(conn, """
+            INSERT INTO agents (
+                id, name, description, short_description, creator, creator_wallet,
+                price, category, tags, avatar, is_active, is_approved, demo_limit,
+                created_at, updated_at, nft_token_id, input_schema, crewai_config
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, agent_rows(rng, text, agents, agent_ids, agent_created), batch_size, "agents", agents)
+
+        if agents and jobs:
+            agent_weights = pareto_cum_weights(rng, agents)
+            wallet_weights = pareto_cum_weights(rng, wallets)
+            timings["jobs_seconds"] = _load(conn, """
+                INSERT INTO agent_jobs (
+                    id, agent_id, user_wallet, status, input, output, error,
+                    created_at, started_at, completed_at, is_demo
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, job_rows(rng, text, jobs, agent_ids, agent_created, agent_weights, wallets, wallet_weights),
+                batch_size, "jobs", jobs)
+
+        started = time.perf_counter()
+        for sql in recreate:
+            conn.execute(sql)
+        conn.commit()
+        timings["indexes_seconds"] = time.perf_counter() - started
+
+        # Derived tables, each rebuilt in one pass instead of row-by-row by triggers
+        started = time.perf_counter()
+        database.rebuild_search_index(conn)
+        conn.execute("DELETE FROM agent_tags")
+        database.backfill_agent_tags(conn, batch_size=max(1, agents))
+        database.rebuild_catalog_facets(conn)
+        conn.execute("DELETE FROM demo_usage")
+        conn.execute("""
+            INSERT INTO demo_usage (agent_id, user_wallet, count)
+            SELECT agent_id, user_wallet, COUNT(*) FROM agent_jobs
+            WHERE is_demo = 1
+            GROUP BY agent_id, user_wallet
+        """)
+        conn.commit()
+        timings["derived_seconds"] = time.perf_counter() - started
+
+        conn.execute("PRAGMA journal_mode = WAL")
+    finally:
+        conn.close()
+    return {key: round(value, 2) for key, value in timings.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=settings.DATABASE_PATH, help="database file to fill")
+    parser.add_argument("--agents", type=int, default=10_000)
+    parser.add_argument("--jobs", type=int, default=200_000)
+    parser.add_argument("--wallets", type=int, default=None, help="distinct user wallets (default: jobs / 25)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=50_000, help="rows per transaction")
+    parser.add_argument("--replace", action="store_true", help="delete an existing database first")
+    args = parser.parse_args()
+
+    if args.replace:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+
+    started = time.perf_counter()
+    timings = generate(args.db, args.agents, args.jobs, args.wallets, args.seed, args.batch_size)
+    print(f"Generated {args.agents} agents and {args.jobs} jobs in {time.perf_counter() - started:.1f}s: {timings}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Idempotency-Key support for POST endpoints.
+
+The first request with a given key runs the handler and stores its response
+(status and body) in idempotency_keys; later requests with the same key get
+the stored response back without running the handler again. Concurrent
+requests with the same key in one process wait on the first one's future,
+and a row claimed as pending makes other processes answer 409 until the
+first request finishes.
+
+Keys are scoped per endpoint (and per agent for demos), expire after
+IDEMPOTENCY_TTL_SECONDS, and are bound to a fingerprint of the request body:
+reusing a key for a different request is rejected with 422. Responses with a
+5xx status are not stored, so those requests can be retried.
+"""
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import time
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from fastapi import HTTPException, Response
+from pydantic import BaseModel
+
+from config import settings
+from database import run_db
+from serialization import dumps
+
+MAX_KEY_LENGTH = 255
+
+# (status code, JSON body); error bodies hold the HTTPException detail
+StoredResponse = Tuple[int, bytes]
+
+def request_fingerprint(payload: Any) -> bytes:
+    """Digest of a request body, to detect a key reused for a different request."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).digest()
+
+class IdempotencyStore:
+    """Stored responses in SQLite plus this process's in-flight requests."""
+
+    def __init__(self, ttl_seconds: float, lock_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.lock_seconds = lock_seconds
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._last_purge = 0.0
+        # Stats
+        self.executions = 0
+        self.replays = 0
+        self.coalesced = 0
+        self.conflicts = 0
+
+    async def run(self, scope: str, key: str, payload: Any,
+                  handler: Callable[[], Awaitable[BaseModel]], status_code: int = 200) -> Response:
+        """Run ``handler`` once per (scope, key) and return its (possibly replayed) response."""
+        if not key or len(key) > MAX_KEY_LENGTH or not key.isprintable():
+            raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} printable characters")
+        fingerprint = request_fingerprint(payload)
+        name = (scope, key)
+
+        pending = self._inflight.get(name)
+        if pending is not None:
+            self.coalesced += 1
+            stored_fingerprint, stored = await asyncio.shield(pending)
+            return self._replay(stored_fingerprint, stored, fingerprint)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[name] = future
+        claimed = False
+        try:
+            state, row = await run_db(self._claim, scope, key, fingerprint, time.time())
+            if state == "stored":
+                future.set_result((row["fingerprint"], (row["status_code"], row["body"])))
+                return self._replay(row["fingerprint"], (row["status_code"], row["body"]), fingerprint)
+            if state == "busy":
+                if row["fingerprint"] != fingerprint:
+                    raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+                self.conflicts += 1
+                raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+            claimed = True
+
+            self.executions += 1
+            try:
+                result = await handler()
+            except HTTPException as e:
+                if e.status_code >= 500:
+                    raise
+                stored = (e.status_code, dumps(e.detail))
+                await run_db(self._store, scope, key, stored)
+                claimed = False
+                future.set_result((fingerprint, stored))
+                raise
+            stored = (status_code, dumps(result.model_dump(mode="json")))
+            await run_db(self._store, scope, key, stored)
+            claimed = False
+            future.set_result((fingerprint, stored))
+            return Response(content=stored[1], status_code=status_code, media_type="application/json")
+        except BaseException as e:
+            if not future.done():
+                if isinstance(e, Exception):
+                    future.set_exception(e)
+                    future.exception()  # waiters re-raise it; don't log it as unretrieved
+                else:
+                    future.cancel()
+            if claimed:
+                # Let a retry run the request instead of waiting out the lock
+                await asyncio.shield(run_db(self._release, scope, key))
+            raise
+        finally:
+            self._inflight.pop(name, None)
+
+    def _replay(self, stored_fingerprint: bytes, stored: StoredResponse, fingerprint: bytes) -> Response:
+        if stored_fingerprint != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+        self.replays += 1
+        status_code, body = stored
+        if status_code >= 400:
+            raise HTTPException(status_code=status_code, detail=json.loads(body), headers={"Idempotent-Replayed": "true"})
+        return Response(content=body, status_code=status_code, media_type="application/json",
+                        headers={"Idempotent-Replayed": "true"})
+
+    def _claim(self, conn, scope: str, key: str, fingerprint: bytes, now: float):
+        """Return ("stored", row), ("busy", row) or ("claimed", None), inserting a pending row for a new key."""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT fingerprint, status_code, body, created_at FROM idempotency_keys WHERE scope = ? AND key = ?",
+                (scope, key),
+            ).fetchone()
+            if row is not None and row["created_at"] >= now - self.ttl_seconds:
+                if row["status_code"] is not None:
+                    conn.commit()
+                    return "stored", row
+                if row["created_at"] >= now - self.lock_seconds:
+                    conn.commit()
+                    return "busy", row
+            # New, expired, or abandoned by a process that died mid-request
+            conn.execute("""
+                INSERT INTO idempotency_keys (scope, key, fingerprint, status_code, body, created_at)
+                VALUES (?, ?, ?, NULL, NULL, ?)
+                ON CONFLICT (scope, key) DO UPDATE SET
+                    fingerprint = excluded.fingerprint, status_code = NULL, body = NULL, created_at = excluded.created_at
+            """, (scope, key, fingerprint, now))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        if now - self._last_purge > 60:
+            self._last_purge = now
+            self._purge(conn, now)
+        return "claimed", None
+
+    def _store(self, conn, scope: str, key: str, stored: StoredResponse):
+        conn.execute(
+            "UPDATE idempotency_keys SET status_code = ?, body = ? WHERE scope = ? AND key = ?",
+            (stored[0], stored[1], scope, key),
+        )
+        conn.commit()
+
+    def _release(self, conn, scope: str, key: str):
+        conn.execute("DELETE FROM idempotency_keys WHERE scope = ? AND key = ? AND status_code IS NULL", (scope, key))
+        conn.commit()
+
+    def _purge(self, conn, now: float):
+        """Drop expired keys; runs at most once a minute per process."""
+        try:
+            conn.execute("DELETE FROM idempotency_keys WHERE created_at < ?", (now - self.ttl_seconds,))
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"Failed to purge expired idempotency keys: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._inflight),
+            "executions": self.executions,
+            "replays": self.replays,
+            "coalesced": self.coalesced,
+            "conflicts": self.conflicts,
+        }
+
+idempotent_requests = IdempotencyStore(settings.IDEMPOTENCY_TTL_SECONDS, settings.IDEMPOTENCY_LOCK_SECONDS)
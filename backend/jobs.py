@@ -0,0 +1,338 @@
+"""
+Background job execution engine for AgentHub.
+
+Jobs are rows in agent_jobs. POST /api/agents/{agent_id}/start inserts a
+'queued' row; worker threads claim queued rows atomically, run them through an
+executor and write the outcome back. Because claiming is a single UPDATE in
+SQLite, several engines (e.g. one per uvicorn worker process) can share a
+database without running a job twice. The claiming worker's id is stored on
+the row, and its engine refreshes heartbeat_at while the job runs; a job is
+only requeued once its heartbeat has expired, i.e. its process has died.
+"""
+
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from compression import pack_json, unpack_json
+from config import settings
+from database import create_connection
+from events import job_events
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+def stub_executor(agent: dict, job_input: dict, progress: Callable[[dict], None]) -> dict:
+    """Local stand-in for real agent execution; echoes its input."""
+    progress({"message": "Stub executor received the input."})
+    return {
+        "message": "Job completed by the local stub executor.",
+        "agent_name": agent["name"],
+        "input_received": job_input,
+    }
+
+def enqueue_job(conn, agent_id: str, user_wallet: str, job_input: dict) -> dict:
+    """Insert a queued job and return its id and creation time."""
+    job_id = str(uuid.uuid4())
+    current_time = datetime.utcnow().isoformat()
+    conn.execute("""
+        INSERT INTO agent_jobs (id, agent_id, user_wallet, status, input, created_at, is_demo)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (job_id, agent_id, user_wallet, JOB_QUEUED, pack_json(job_input), current_time, False))
+    conn.commit()
+    job_events.publish(job_id, "status", {"job_id": job_id, "status": JOB_QUEUED})
+    return {"job_id": job_id, "created_at": current_time}
+
+def claim_next_job(conn, worker_id: str, max_per_agent: int) -> Optional[sqlite3.Row]:
+    """
+    Atomically move the oldest eligible queued job to 'running'.
+
+    A job is eligible when its agent has fewer than ``max_per_agent`` jobs
+    already running. Returns the claimed row, or None if nothing is eligible.
+    """
+    # Cheap read first so idle workers don't take the write lock on every poll
+    if conn.execute("SELECT 1 FROM agent_jobs WHERE status = 'queued' LIMIT 1").fetchone() is None:
+        return None
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("""
+            UPDATE agent_jobs
+            SET status = 'running', started_at = ?1, heartbeat_at = ?1, worker_id = ?2
+            WHERE id = (
+                SELECT j.id FROM agent_jobs j
+                WHERE j.status = 'queued'
+                  AND (SELECT COUNT(*) FROM agent_jobs r
+                       WHERE r.agent_id = j.agent_id AND r.status = 'running') < ?3
+                ORDER BY j.created_at
+                LIMIT 1
+            ) AND status = 'queued'
+            RETURNING id, agent_id, user_wallet, input
+        """, (datetime.utcnow().isoformat(), worker_id, max_per_agent)).fetchone()
+        conn.commit()
+        return row
+    except Exception:
+        conn.rollback()
+        raise
+
+def heartbeat_jobs(conn, jobs: Iterable[Tuple[str, str]]) -> int:
+    """Mark running jobs, given as (job_id, worker_id) pairs, as alive while that worker still has them."""
+    now = datetime.utcnow().isoformat()
+    rows = [(now, job_id, worker_id) for job_id, worker_id in jobs]
+    if not rows:
+        return 0
+    cursor = conn.executemany("""
+        UPDATE agent_jobs SET heartbeat_at = ?
+        WHERE id = ? AND worker_id = ? AND status = 'running'
+    """, rows)
+    conn.commit()
+    return cursor.rowcount
+
+def requeue_stale_jobs(conn, older_than_seconds: float) -> int:
+    """Put 'running' jobs whose worker vanished (e.g. crashed) back on the queue."""
+    cutoff = (datetime.utcnow() - timedelta(seconds=older_than_seconds)).isoformat()
+    # Jobs claimed before heartbeats were recorded go by their start time
+    cursor = conn.execute("""
+        UPDATE agent_jobs SET status = 'queued', started_at = NULL, heartbeat_at = NULL, worker_id = NULL
+        WHERE status = 'running' AND coalesce(heartbeat_at, started_at) < ?
+    """, (cutoff,))
+    conn.commit()
+    return cursor.rowcount
+
+class JobEngine:
+    """
+    A pool of worker threads that claim and run queued jobs.
+
+    Executors are called as ``executor(agent, job_input, progress)`` and may
+    call ``progress(partial_output)`` any number of times; status transitions
+    and partial output are published to ``events.job_events``.
+
+    Each worker owns its own SQLite connection rather than borrowing from the
+    request pool, so long agent runs never starve HTTP handlers. Workers sleep
+    on a condition variable and are woken by notify() when this process
+    enqueues a job; ``poll_interval`` bounds how long a job enqueued by another
+    process can wait.
+
+    A further thread refreshes the heartbeat of this engine's running jobs
+    every ``heartbeat_interval`` seconds and requeues jobs, from any process,
+    whose heartbeat is older than ``stale_seconds``.
+    """
+
+    def __init__(self, workers: int, max_per_agent: int, poll_interval: float,
+                 executor: Callable[[dict, dict, Callable[[dict], None]], dict] = stub_executor,
+                 heartbeat_interval: float = 10.0, stale_seconds: float = 60.0):
+        self.workers = workers
+        self.max_per_agent = max(1, max_per_agent)
+        self.poll_interval = poll_interval
+        self.executor = executor
+        self.heartbeat_interval = heartbeat_interval
+        # A live job misses a few heartbeats at most before it counts as abandoned
+        self.stale_seconds = max(stale_seconds, 3 * heartbeat_interval)
+        self._cond = threading.Condition()
+        self._heartbeat_cond = threading.Condition()
+        self._stopping = False
+        self._heartbeat_stopping = False
+        self._threads = []
+        self._heartbeat_thread: Optional[threading.Thread] = None
+        self._running: Dict[str, str] = {}  # job id -> worker id, for jobs this process is executing
+        # Stats
+        self.completed = 0
+        self.failed = 0
+        self.requeued = 0
+
+    def start(self):
+        if self._threads:
+            return
+        self._stopping = False
+        self._heartbeat_stopping = False
+        conn = create_connection()
+        try:
+            self._requeue_stale(conn)
+        finally:
+            conn.close()
+        worker_ids = [f"{uuid.uuid4().hex[:8]}-{n}" for n in range(self.workers)]
+        for n, worker_id in enumerate(worker_ids):
+            thread = threading.Thread(
+                target=self._run_worker,
+                args=(worker_id,),
+                name=f"agenthub-job-{n}",
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+        self._heartbeat_thread = threading.Thread(target=self._run_heartbeat, name="agenthub-job-heartbeat",
+                                                  daemon=True)
+        self._heartbeat_thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Signal workers to exit once their current job finishes, and join them."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        # Jobs still running keep their heartbeat until their workers are done
+        with self._heartbeat_cond:
+            self._heartbeat_stopping = True
+            self._heartbeat_cond.notify_all()
+        if self._heartbeat_thread is not None:
+            self._heartbeat_thread.join(timeout)
+            self._heartbeat_thread = None
+
+    def notify(self):
+        """Wake one idle worker because a job was enqueued."""
+        with self._cond:
+            self._cond.notify()
+
+    def owns(self, job_id: str) -> bool:
+        """Whether a worker in this process is running the job, so its events are published here."""
+        return job_id in self._running
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._threads),
+            "max_per_agent": self.max_per_agent,
+            "completed": self.completed,
+            "failed": self.failed,
+            "requeued": self.requeued,
+        }
+
+    def _requeue_stale(self, conn):
+        requeued = requeue_stale_jobs(conn, self.stale_seconds)
+        if requeued:
+            self.requeued += requeued
+            print(f"Requeued {requeued} stale jobs")
+
+    def _run_heartbeat(self):
+        conn = create_connection()
+        try:
+            while True:
+                with self._heartbeat_cond:
+                    if not self._heartbeat_stopping:
+                        self._heartbeat_cond.wait(self.heartbeat_interval)
+                if self._heartbeat_stopping:
+                    break
+                try:
+                    # Only jobs a worker is still executing: one whose result could not be
+                    # recorded, or whose worker failed, stops beating and is requeued
+                    heartbeat_jobs(conn, list(self._running.items()))
+                    self._requeue_stale(conn)
+                except sqlite3.Error as e:
+                    conn.rollback()
+                    print(f"Job heartbeat failed: {e}")
+        finally:
+            conn.close()
+
+    def _run_worker(self, worker_id: str):
+        conn = create_connection()
+        try:
+            while not self._stopping:
+                try:
+                    job = claim_next_job(conn, worker_id, self.max_per_agent)
+                except sqlite3.Error as e:
+                    print(f"Job worker {worker_id} failed to claim a job: {e}")
+                    job = None
+                if job is None:
+                    with self._cond:
+                        if not self._stopping:
+                            self._cond.wait(self.poll_interval)
+                    continue
+                try:
+                    self._execute(conn, job, worker_id)
+                except Exception as e:
+                    # The job is left 'running' without a heartbeat, so it is requeued
+                    conn.rollback()
+                    print(f"Job worker {worker_id} failed running job {job['id']}: {e!r}")
+                # A finished job may unblock another job for the same agent
+                self.notify()
+        finally:
+            conn.close()
+
+    def _execute(self, conn, job, worker_id: str):
+        job_id = job["id"]
+        self._running[job_id] = worker_id
+        try:
+            self._run_job(conn, job, worker_id)
+        finally:
+            self._running.pop(job_id, None)
+
+    def _run_job(self, conn, job, worker_id: str):
+        job_id = job["id"]
+        job_events.publish(job_id, "status", {"job_id": job_id, "status": JOB_RUNNING})
+        
+        def progress(partial: dict):
+            job_events.publish(job_id, "progress", {"job_id": job_id, "output": partial})
+        
+        try:
+            agent = conn.execute(
+                "SELECT id, name, input_schema, crewai_config FROM agents WHERE id = ?",
+                (job["agent_id"],),
+            ).fetchone()
+            if agent is None:
+                raise LookupError("Agent no longer exists")
+            job_input = unpack_json(job["input"]) or {}
+            output = self.executor(dict(agent), job_input, progress)
+        except Exception as e:
+            self._finish(conn, job_id, worker_id, JOB_FAILED, error=str(e) or e.__class__.__name__)
+        else:
+            self._finish(conn, job_id, worker_id, JOB_COMPLETED, output=output)
+
+    def _finish(self, conn, job_id: str, worker_id: str, status: str, output: Optional[dict] = None,
+                error: Optional[str] = None) -> bool:
+        """Record the outcome, then publish it; False if it could not be recorded."""
+        try:
+            packed_output = pack_json(output) if output is not None else None
+        except (TypeError, ValueError) as e:
+            status, output, packed_output = JOB_FAILED, None, None
+            error = f"Job output is not JSON-serializable: {e}"
+        for attempt in range(3):
+            try:
+                # Only while the job is still ours: once requeued, another worker may be running it
+                cursor = conn.execute("""
+                    UPDATE agent_jobs SET status = ?, output = ?, error = ?, completed_at = ?
+                    WHERE id = ? AND status = 'running' AND worker_id = ?
+                """, (
+                    status,
+                    packed_output,
+                    error,
+                    datetime.utcnow().isoformat(),
+                    job_id,
+                    worker_id,
+                ))
+                conn.commit()
+                break
+            except Exception as e:
+                conn.rollback()
+                print(f"Failed to record result of job {job_id}: {e}")
+                time.sleep(0.1 * (attempt + 1))
+        else:
+            # Still 'running' in the database; once _execute returns the job gets no more
+            # heartbeats, so it is requeued after stale_seconds
+            return False
+        if cursor.rowcount == 0:
+            print(f"Job {job_id} was requeued while it ran; discarding its result")
+            return False
+        payload = {"job_id": job_id, "status": status}
+        if output is not None:
+            payload["output"] = output
+        if error is not None:
+            payload["error"] = error
+        job_events.publish(job_id, "status", payload, final=True)
+        if status == JOB_COMPLETED:
+            self.completed += 1
+        else:
+            self.failed += 1
+        return True
+
+job_engine = JobEngine(
+    settings.JOB_WORKERS,
+    settings.JOB_MAX_PER_AGENT,
+    settings.JOB_POLL_INTERVAL,
+    heartbeat_interval=settings.JOB_HEARTBEAT_SECONDS,
+    stale_seconds=settings.JOB_STALE_SECONDS,
+)
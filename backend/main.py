@@ -3,21 +3,50 @@ FastAPI application for AgentHub marketplace backend.
 Provides API endpoints for agent management and marketplace functionality.
 """
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from typing import List, Optional
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import List, Optional, Tuple
 import sqlite3
+import base64
 import json
+import re
+import asyncio
+import tempfile
 import uuid
 from datetime import datetime
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError, field_validator
 
+from bulk import NDJSON_CONTENT_TYPES, BulkParseError, iter_json_array, iter_ndjson
+from cache import CachedResponse, etag_matches, make_etag, response_cache
+from catalog import CatalogChangeWatcher, catalog_snapshots
+from compression import CompressionMiddleware, pack_json, unpack_json
 from config import settings
-from database import get_db_connection, init_database
+from events import job_events
+from facets import MAX_TAG_LIMIT, agent_facets
+from database import close_pool, get_pool_stats, init_database, run_db, shutdown_db_executor, stream_query
+from idempotency import idempotent_requests
+from export import (
+    AGENT_BOOL_COLUMNS,
+    AGENT_EXPORT_COLUMNS,
+    AGENT_JSON_COLUMNS,
+    EXPORT_FORMATS,
+    JOB_BOOL_COLUMNS,
+    JOB_EXPORT_COLUMNS,
+    JOB_JSON_COLUMNS,
+    chunk_encoder,
+    encode_rows,
+)
+from jobs import JOB_COMPLETED, JOB_FAILED, enqueue_job, job_engine
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsMiddleware, registry as metrics_registry
+from ratelimit import RateLimiter, RateLimitMiddleware, parse_limits
+from retention import retention_worker
+from serialization import AGENT_RESPONSE_FIELDS, AGENT_VIEWS, agent_select_columns, dumps, encode_agent, encode_agents
+from validation import InputValidationError, SchemaError, compile_schema, input_validators, validate_input
 
-# Initialize database on startup
-init_database()
+# Initialize database on startup (serve.py does this once, before starting workers)
+if settings.INIT_DATABASE:
+    init_database()
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -26,6 +55,16 @@ app = FastAPI(
     version=settings.API_VERSION
 )
 
+# Innermost middleware, so rejections still get CORS headers and metrics
+rate_limiter = RateLimiter(
+    parse_limits(settings.RATE_LIMITS) if settings.RATE_LIMIT_ENABLED else {},
+    max_clients=settings.RATE_LIMIT_MAX_CLIENTS,
+    max_concurrency=settings.MAX_CONCURRENT_REQUESTS,
+    wallet_header=settings.RATE_LIMIT_WALLET_HEADER,
+    trust_forwarded=settings.RATE_LIMIT_TRUST_FORWARDED,
+)
+app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
+
 # Add CORS middleware for frontend integration
 app.add_middleware(
     CORSMiddleware,
@@ -33,8 +72,20 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
+if settings.RESPONSE_COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.RESPONSE_COMPRESSION_MIN_BYTES,
+        gzip_level=settings.RESPONSE_GZIP_LEVEL,
+        brotli_quality=settings.RESPONSE_BROTLI_QUALITY,
+    )
+
+# Outermost, so latency includes the other middleware
+app.add_middleware(MetricsMiddleware)
+
 # Pydantic models for request/response validation
 class AgentBase(BaseModel):
     name: str = Field(..., min_length=1, max_length=100)
@@ -51,7 +102,15 @@ class AgentBase(BaseModel):
     crewai_config: dict = Field(default_factory=dict)
 
 class AgentCreate(AgentBase):
-    pass
+    @field_validator("input_schema")
+    @classmethod
+    def input_schema_compiles(cls, value: dict) -> dict:
+        """Reject schemas that job inputs could not be validated against."""
+        try:
+            compile_schema(value)
+        except SchemaError as e:
+            raise ValueError(f"Invalid input_schema: {e}")
+        return value
 
 class AgentResponse(AgentBase):
     id: str
@@ -61,6 +120,21 @@ class AgentResponse(AgentBase):
     updated_at: str
     nft_token_id: Optional[str] = None
 
+class FacetCount(BaseModel):
+    value: str
+    count: int
+
+class PriceBucket(BaseModel):
+    min: int
+    max: Optional[int] = None
+    count: int
+
+class AgentFacetsResponse(BaseModel):
+    total: int
+    categories: List[FacetCount]
+    tags: List[FacetCount]
+    price: List[PriceBucket]
+
 class ErrorResponse(BaseModel):
     error: str
     detail: str
@@ -78,6 +152,143 @@ class DemoResponse(BaseModel):
     demo_count: int
     demo_limit: int
 
+# Catalog reads select rows in AgentResponse field order and encode them directly
+AGENT_COLUMNS = agent_select_columns()
+
+# Column weights for bm25(): name, short_description, description, tags
+SEARCH_RANK_WEIGHTS = (10.0, 5.0, 1.0, 3.0)
+
+def _encode_cursor(created_at: str, agent_id: str) -> str:
+    """Encode a (created_at, id) keyset position as an opaque cursor."""
+    raw = json.dumps([created_at, agent_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_cursor(cursor: str):
+    """Decode a cursor produced by _encode_cursor, or raise a 400."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        position = json.loads(raw)
+        if not isinstance(position, list) or len(position) != 2:
+            raise ValueError
+        created_at, agent_id = position
+        if not isinstance(created_at, str) or not isinstance(agent_id, str):
+            raise ValueError
+        datetime.fromisoformat(created_at)
+        return created_at, agent_id
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _cached_response(request: Request, cached: CachedResponse) -> Response:
+    """Serve a cached body, or a bodiless 304 if the client already has it."""
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache", **cached.headers}
+    if etag_matches(request.headers.get("if-none-match"), cached.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+def invalidate_agent_cache(agent_id: Optional[str] = None):
+    """Drop cached catalog reads after this process creates or imports agents."""
+    response_cache.invalidate_namespace("agents")
+    if agent_id:
+        response_cache.invalidate(("agent", agent_id))
+    catalog_snapshots.notify()
+
+def _agents_changed_elsewhere():
+    """Drop every cached catalog read: which agents another process changed is not known here."""
+    response_cache.invalidate_namespace("agents")
+    response_cache.invalidate_namespace("agent")
+
+catalog_watcher = CatalogChangeWatcher(settings.RESPONSE_CACHE_CHECK_SECONDS, _agents_changed_elsewhere)
+
+def _fts_query(q: str) -> str:
+    """
+    Turn free text into an FTS5 query: every word must match, as a prefix.
+
+    Words are quoted so FTS5 operators and punctuation in user input are
+    treated as plain text.
+    """
+    terms = re.findall(r"\w+", q)
+    return " ".join(f'"{term}"*' for term in terms)
+
+def _agent_fields(fields: Optional[str], view: str) -> Tuple[str, ...]:
+    """
+    Resolve the `fields` and `view` parameters to the agent fields to return.
+    
+    Explicit fields win over the view and are returned in AgentResponse order,
+    so equivalent requests share a cache entry.
+    """
+    if fields:
+        requested = {field.strip() for field in fields.split(",") if field.strip()}
+        unknown = requested.difference(AGENT_RESPONSE_FIELDS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+        if requested:
+            return tuple(field for field in AGENT_RESPONSE_FIELDS if field in requested)
+    if view not in AGENT_VIEWS:
+        raise HTTPException(status_code=400, detail=f"view must be one of: {', '.join(AGENT_VIEWS)}")
+    return AGENT_VIEWS[view]
+
+def _normalize_tags(tags: Optional[List[str]]) -> List[str]:
+    """Lower-case, trim and de-duplicate tag filters; accepts comma-separated values."""
+    normalized = []
+    for value in tags or []:
+        for tag in value.split(","):
+            tag = tag.strip().lower()
+            if tag and tag not in normalized:
+                normalized.append(tag)
+    return normalized
+
+class JobRequest(BaseModel):
+    input: dict = Field(default_factory=dict)
+    user_wallet: str = Field(..., min_length=1)
+
+class JobResponse(BaseModel):
+    job_id: str
+    agent_id: str
+    status: str
+    created_at: str
+
+class JobStatusResponse(JobResponse):
+    started_at: Optional[str] = None
+    completed_at: Optional[str] = None
+    error: Optional[str] = None
+
+class JobResultResponse(BaseModel):
+    job_id: str
+    agent_id: str
+    status: str
+    output: Optional[dict] = None
+    error: Optional[str] = None
+
+INSERT_AGENT_SQL = """
+    INSERT INTO agents (
+        id, name, description, short_description, creator, creator_wallet,
+        price, category, tags, avatar, is_active, is_approved, demo_limit,
+        created_at, updated_at, input_schema, crewai_config
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def _agent_insert_params(agent: AgentCreate, agent_id: str, current_time: str) -> tuple:
+    """Parameters for INSERT_AGENT_SQL for a newly created agent."""
+    return (
+        agent_id,
+        agent.name,
+        agent.description,
+        agent.short_description,
+        agent.creator,
+        agent.creator_wallet,
+        agent.price,
+        agent.category,
+        json.dumps(agent.tags),
+        agent.avatar,
+        True,  # is_active
+        False,  # is_approved (requires admin approval)
+        agent.demo_limit,
+        current_time,
+        current_time,
+        json.dumps(agent.input_schema),
+        json.dumps(agent.crewai_config)
+    )
+
 # Global exception handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
@@ -101,18 +312,113 @@ async def global_exception_handler(request, exc):
         ).dict()
     )
 
+@app.on_event("startup")
+async def startup():
+    """Start background job workers and, if enabled, the cache, retention and catalog snapshot workers."""
+    if settings.JOB_WORKERS > 0:
+        job_engine.start()
+    if response_cache.enabled and settings.RESPONSE_CACHE_CHECK_SECONDS > 0:
+        catalog_watcher.start()
+    if settings.CATALOG_SNAPSHOT_ENABLED:
+        catalog_snapshots.start()
+    if settings.RETENTION_ENABLED:
+        retention_worker.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Stop background workers and the database executor, and close pooled connections."""
+    retention_worker.stop(timeout=5)
+    catalog_watcher.stop(timeout=5)
+    catalog_snapshots.stop(timeout=5)
+    job_engine.stop(timeout=settings.JOB_POLL_INTERVAL + 5)
+    shutdown_db_executor()
+    close_pool()
+
 @app.get("/")
 async def root():
     """Health check endpoint."""
     return {"message": "AgentHub API is running", "version": "1.0.0"}
 
+@app.get("/api/stats")
+async def stats():
+    """Runtime statistics for the backend's shared resources."""
+    return {
+        "db_pool": get_pool_stats(),
+        "response_cache": response_cache.stats(),
+        "catalog_watcher": catalog_watcher.stats(),
+        "catalog_snapshot": catalog_snapshots.stats(),
+        "jobs": job_engine.stats(),
+        "job_events": job_events.stats(),
+        "input_validators": input_validators.stats(),
+        "retention": retention_worker.stats(),
+        "idempotency": idempotent_requests.stats(),
+        "rate_limiter": rate_limiter.stats(),
+    }
+
+def _collect_runtime_metrics():
+    """Expose the counters kept by the pool, response cache, job engine, retention worker and catalog snapshot."""
+    pool = get_pool_stats()
+    cache = response_cache.stats()
+    jobs = job_engine.stats()
+    retention = retention_worker.stats()
+    yield ("agenthub_db_pool_connections", "gauge", "Pooled database connections by state.", [
+        ("agenthub_db_pool_connections", {"state": "idle"}, pool["idle"]),
+        ("agenthub_db_pool_connections", {"state": "in_use"}, pool["in_use"]),
+    ])
+    yield ("agenthub_db_pool_timeouts_total", "counter", "Pool checkouts that timed out.", [
+        ("agenthub_db_pool_timeouts_total", {}, pool["timeouts"]),
+    ])
+    yield ("agenthub_response_cache_lookups_total", "counter", "Response cache lookups by result.", [
+        ("agenthub_response_cache_lookups_total", {"result": "hit"}, cache["hits"]),
+        ("agenthub_response_cache_lookups_total", {"result": "miss"}, cache["misses"]),
+    ])
+    yield ("agenthub_jobs_finished_total", "counter", "Background jobs finished by this process.", [
+        ("agenthub_jobs_finished_total", {"status": JOB_COMPLETED}, jobs["completed"]),
+        ("agenthub_jobs_finished_total", {"status": JOB_FAILED}, jobs["failed"]),
+    ])
+    yield ("agenthub_retention_running", "gauge", "Whether a retention run is in progress.", [
+        ("agenthub_retention_running", {}, int(retention["running"])),
+    ])
+    yield ("agenthub_retention_run_rows", "gauge", "Jobs removed so far by the current or last retention run.", [
+        ("agenthub_retention_run_rows", {}, retention["run_rows"]),
+    ])
+    if retention["last_run_started"] is not None:
+        yield ("agenthub_retention_last_run_timestamp_seconds", "gauge", "Start time of the last retention run.", [
+            ("agenthub_retention_last_run_timestamp_seconds", {}, retention["last_run_started"]),
+        ])
+    catalog = catalog_snapshots.stats()
+    if catalog["ready"]:
+        yield ("agenthub_catalog_snapshot_agents", "gauge", "Agents in this process's catalog snapshot.", [
+            ("agenthub_catalog_snapshot_agents", {}, catalog["agents"]),
+        ])
+        yield ("agenthub_catalog_snapshot_refreshes_total", "counter", "Catalog snapshot refreshes by kind.", [
+            ("agenthub_catalog_snapshot_refreshes_total", {"kind": "rebuild"}, catalog["rebuilds"]),
+            ("agenthub_catalog_snapshot_refreshes_total", {"kind": "patch"}, catalog["patches"]),
+        ])
+        yield ("agenthub_catalog_snapshot_last_refresh_timestamp_seconds", "gauge", "When the catalog snapshot last changed.", [
+            ("agenthub_catalog_snapshot_last_refresh_timestamp_seconds", {}, catalog["last_refreshed"]),
+        ])
+
+metrics_registry.add_collector(_collect_runtime_metrics)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics in text exposition format."""
+    return Response(content=metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
+
 @app.get("/api/agents", response_model=List[AgentResponse])
 async def list_agents(
+    request: Request,
     category: Optional[str] = None,
     is_active: bool = True,
     is_approved: bool = True,
     limit: int = settings.DEFAULT_PAGE_SIZE,
-    offset: int = 0
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    tags: Optional[List[str]] = Query(None),
+    tag_match: str = "any",
+    fields: Optional[str] = None,
+    view: str = "full"
 ):
     """
     List all available agents with optional filtering.
@@ -122,169 +428,438 @@ async def list_agents(
     - **is_approved**: Filter by approval status (default: True)
     - **limit**: Maximum number of agents to return (default: 50)
     - **offset**: Number of agents to skip (default: 0)
+    - **cursor**: Opaque position from a previous page's `X-Next-Cursor` header;
+      pages after it cost the same regardless of depth
+    - **tags**: Filter by tag (repeat the parameter or comma-separate values)
+    - **tag_match**: `any` (default) matches agents with at least one of the tags,
+      `all` only agents that have every tag
+    - **fields**: Comma-separated agent fields to return (e.g. `id,name,price`)
+    - **view**: `full` (default) or `card` (id, name, short_description, price,
+      category, avatar); ignored when `fields` is given
+    
+    When more results may follow, the `X-Next-Cursor` response header holds the
+    cursor for the next page. Responses carry an `ETag`; repeat requests with a
+    matching `If-None-Match` get a 304.
     """
     # Validate pagination parameters
     if limit > settings.MAX_PAGE_SIZE:
         raise HTTPException(status_code=400, detail=f"Limit cannot exceed {settings.MAX_PAGE_SIZE}")
     if offset < 0:
         raise HTTPException(status_code=400, detail="Offset cannot be negative")
+    if cursor and offset:
+        raise HTTPException(status_code=400, detail="Use either cursor or offset, not both")
+    if tag_match not in ("any", "all"):
+        raise HTTPException(status_code=400, detail="tag_match must be 'any' or 'all'")
+    tag_filter = _normalize_tags(tags)
+    agent_fields = _agent_fields(fields, view)
     
-    conn = get_db_connection()
-    try:
-        # Build query with filters
-        query = """
-            SELECT id, name, description, short_description, creator, creator_wallet,
-                   price, category, tags, avatar, is_active, is_approved, demo_limit,
-                   created_at, updated_at, nft_token_id, input_schema, crewai_config
-            FROM agents 
-            WHERE is_active = ? AND is_approved = ?
+    snapshot = catalog_snapshots.snapshot
+    if snapshot is not None and is_active and is_approved:
+        # Public catalog: served from the in-memory snapshot
+        page = snapshot.page(category, tag_filter, tag_match, _decode_cursor(cursor) if cursor else None, offset, limit)
+        body = snapshot.encode(page, agent_fields)
+        headers = {}
+        if page and len(page) == limit:
+            headers["X-Next-Cursor"] = _encode_cursor(*page[-1].key)
+        return _cached_response(request, CachedResponse(body, make_etag(body), headers, 0.0))
+    
+    cache_key = (
+        "agents", category or None, is_active, is_approved, limit, offset, cursor or None,
+        tuple(tag_filter), tag_match if tag_filter else None, agent_fields,
+    )
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return _cached_response(request, cached)
+    generation = response_cache.generation
+    
+    # Build query with filters
+    params = []
+    if tag_filter:
+        # Drive the query from the tag index: look up matching agent ids first,
+        # then fetch those agents by primary key (CROSS JOIN fixes the order)
+        placeholders = ", ".join("?" for _ in tag_filter)
+        source = f"""
+            (SELECT agent_id FROM agent_tags WHERE tag IN ({placeholders}) GROUP BY agent_id
         """
-        params = [is_active, is_approved]
-        
-        if category:
-            query += " AND category = ?"
-            params.append(category)
-        
-        query += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
-        params.extend([limit, offset])
-        
-        cursor = conn.execute(query, params)
-        rows = cursor.fetchall()
-        
-        agents = []
-        for row in rows:
-            agent_data = dict(row)
-            # Parse JSON fields
-            agent_data['tags'] = json.loads(agent_data['tags']) if agent_data['tags'] else []
-            agent_data['input_schema'] = json.loads(agent_data['input_schema']) if agent_data['input_schema'] else {}
-            agent_data['crewai_config'] = json.loads(agent_data['crewai_config']) if agent_data['crewai_config'] else {}
-            agents.append(AgentResponse(**agent_data))
-        
-        return agents
-        
+        params.extend(tag_filter)
+        if tag_match == "all":
+            source += " HAVING COUNT(*) = ?"
+            params.append(len(tag_filter))
+        source += ") AS tagged CROSS JOIN agents ON agents.id = tagged.agent_id"
+    else:
+        source = "agents"
+    
+    # Keyset columns go last, after the projected fields, for the next cursor
+    query = f"""
+        SELECT {agent_select_columns(agent_fields)}, created_at AS cursor_created_at, id AS cursor_id
+        FROM {source} WHERE is_active = ? AND is_approved = ?
+    """
+    params.extend([is_active, is_approved])
+    
+    if category:
+        query += " AND category = ?"
+        params.append(category)
+    
+    if cursor:
+        # Keyset pagination: seek straight to the position in the listing index
+        query += " AND (created_at, id) < (?, ?)"
+        params.extend(_decode_cursor(cursor))
+    
+    query += " ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?"
+    params.extend([limit, offset])
+    
+    def fetch(conn):
+        rows = conn.execute(query, params).fetchall()
+        return rows, encode_agents(rows, agent_fields)
+    
+    try:
+        rows, body = await run_db(fetch)
     except sqlite3.Error as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    finally:
-        conn.close()
+    
+    headers = {}
+    if rows and len(rows) == limit:
+        last = rows[-1]
+        headers["X-Next-Cursor"] = _encode_cursor(last["cursor_created_at"], last["cursor_id"])
+    cached = response_cache.set(cache_key, body, headers, generation)
+    return _cached_response(request, cached)
+
+@app.get("/api/agents/search", response_model=List[AgentResponse])
+async def search_agents(
+    request: Request,
+    q: str,
+    category: Optional[str] = None,
+    is_active: bool = True,
+    is_approved: bool = True,
+    limit: int = settings.DEFAULT_PAGE_SIZE,
+    offset: int = 0,
+    fields: Optional[str] = None,
+    view: str = "full"
+):
+    """
+    Full-text search over agent name, descriptions and tags, best matches first.
+    
+    - **q**: Search text; every word must match (as a prefix)
+    - **category**: Filter by agent category
+    - **is_active**: Filter by active status (default: True)
+    - **is_approved**: Filter by approval status (default: True)
+    - **limit**: Maximum number of agents to return (default: 50)
+    - **offset**: Number of agents to skip (default: 0)
+    - **fields** / **view**: Narrow the returned fields, as for `GET /api/agents`
+    """
+    if limit > settings.MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"Limit cannot exceed {settings.MAX_PAGE_SIZE}")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="Offset cannot be negative")
+    agent_fields = _agent_fields(fields, view)
+    match = _fts_query(q)
+    if not match:
+        raise HTTPException(status_code=400, detail="Search query must contain at least one word")
+    
+    cache_key = (
+        "agents", "search", match, category or None, is_active, is_approved, limit, offset, agent_fields,
+    )
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return _cached_response(request, cached)
+    generation = response_cache.generation
+    
+    columns = agent_select_columns(agent_fields, alias="a")
+    weights = ", ".join(str(weight) for weight in SEARCH_RANK_WEIGHTS)
+    query = f"""
+        SELECT {columns}
+        FROM agents_fts JOIN agents a ON a.rowid = agents_fts.rowid
+        WHERE agents_fts MATCH ? AND a.is_active = ? AND a.is_approved = ?
+    """
+    params = [match, is_active, is_approved]
+    if category:
+        query += " AND a.category = ?"
+        params.append(category)
+    query += f" ORDER BY bm25(agents_fts, {weights}) LIMIT ? OFFSET ?"
+    params.extend([limit, offset])
+    
+    def fetch(conn):
+        return encode_agents(conn.execute(query, params), agent_fields)
+    
+    try:
+        body = await run_db(fetch)
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    
+    cached = response_cache.set(cache_key, body, generation=generation)
+    return _cached_response(request, cached)
+
+@app.get("/api/agents/facets", response_model=AgentFacetsResponse)
+async def get_agent_facets(
+    request: Request,
+    category: Optional[str] = None,
+    is_active: bool = True,
+    is_approved: bool = True,
+    tags: Optional[List[str]] = Query(None),
+    tag_match: str = "any",
+    tag_limit: int = 50
+):
+    """
+    Agent counts per category, per tag and per price bucket for a filter combination.
+    
+    Takes the filters of `GET /api/agents`. Category counts ignore `category`
+    and tag counts ignore `tags` unless `tag_match` is `all`, so they show
+    what choosing another value would return; `total` and the `price`
+    histogram (lovelace, `[min, max)`) apply every filter.
+    
+    - **tag_limit**: Number of most common tags to return (default: 50)
+    """
+    if tag_match not in ("any", "all"):
+        raise HTTPException(status_code=400, detail="tag_match must be 'any' or 'all'")
+    if not 1 <= tag_limit <= MAX_TAG_LIMIT:
+        raise HTTPException(status_code=400, detail=f"tag_limit must be between 1 and {MAX_TAG_LIMIT}")
+    tag_filter = _normalize_tags(tags)
+    
+    cache_key = (
+        "agents", "facets", category or None, is_active, is_approved,
+        tuple(tag_filter), tag_match if tag_filter else None, tag_limit,
+    )
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return _cached_response(request, cached)
+    generation = response_cache.generation
+    
+    def fetch(conn):
+        return agent_facets(conn, category, tag_filter, tag_match, is_active, is_approved, tag_limit)
+    
+    try:
+        facets = await run_db(fetch)
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    
+    cached = response_cache.set(cache_key, dumps(facets), generation=generation)
+    return _cached_response(request, cached)
 
 @app.get("/api/agents/{agent_id}", response_model=AgentResponse)
-async def get_agent(agent_id: str):
+async def get_agent(agent_id: str, request: Request):
     """
     Get detailed information about a specific agent.
     
     - **agent_id**: Unique identifier for the agent
     """
-    conn = get_db_connection()
+    snapshot = catalog_snapshots.snapshot
+    agent = snapshot.agents.get(agent_id) if snapshot is not None else None
+    if agent is not None:
+        return _cached_response(request, CachedResponse(agent.full, make_etag(agent.full), {}, 0.0))
+    
+    cache_key = ("agent", agent_id)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return _cached_response(request, cached)
+    generation = response_cache.generation
+    
+    def fetch(conn):
+        row = conn.execute(
+            f"SELECT {AGENT_COLUMNS} FROM agents WHERE id = ?", (agent_id,)
+        ).fetchone()
+        return encode_agent(row) if row else None
+    
     try:
-        cursor = conn.execute("""
-            SELECT id, name, description, short_description, creator, creator_wallet,
-                   price, category, tags, avatar, is_active, is_approved, demo_limit,
-                   created_at, updated_at, nft_token_id, input_schema, crewai_config
-            FROM agents 
-            WHERE id = ?
-        """, (agent_id,))
-        
-        row = cursor.fetchone()
-        if not row:
-            raise HTTPException(status_code=404, detail="Agent not found")
-        
-        agent_data = dict(row)
-        # Parse JSON fields
-        agent_data['tags'] = json.loads(agent_data['tags']) if agent_data['tags'] else []
-        agent_data['input_schema'] = json.loads(agent_data['input_schema']) if agent_data['input_schema'] else {}
-        agent_data['crewai_config'] = json.loads(agent_data['crewai_config']) if agent_data['crewai_config'] else {}
-        
-        return AgentResponse(**agent_data)
-        
+        body = await run_db(fetch)
     except sqlite3.Error as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    finally:
-        conn.close()
+    
+    if body is None:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    cached = response_cache.set(cache_key, body, generation=generation)
+    return _cached_response(request, cached)
 
 @app.post("/api/agents", response_model=AgentResponse)
-async def create_agent(agent: AgentCreate):
+async def create_agent(agent: AgentCreate, idempotency_key: Optional[str] = Header(None)):
     """
     Create a new agent in the marketplace.
     
     - **agent**: Agent data including name, description, creator info, price, etc.
+    - **Idempotency-Key** (header): Retries with the same key return the first
+      response instead of creating another agent
     """
-    conn = get_db_connection()
-    try:
-        # Generate unique ID and timestamps
-        agent_id = str(uuid.uuid4())
-        current_time = datetime.utcnow().isoformat()
-        
-        # Insert new agent
-        cursor = conn.execute("""
-            INSERT INTO agents (
-                id, name, description, short_description, creator, creator_wallet,
-                price, category, tags, avatar, is_active, is_approved, demo_limit,
-                created_at, updated_at, input_schema, crewai_config
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            agent_id,
-            agent.name,
-            agent.description,
-            agent.short_description,
-            agent.creator,
-            agent.creator_wallet,
-            agent.price,
-            agent.category,
-            json.dumps(agent.tags),
-            agent.avatar,
-            True,  # is_active
-            False,  # is_approved (requires admin approval)
-            agent.demo_limit,
-            current_time,
-            current_time,
-            json.dumps(agent.input_schema),
-            json.dumps(agent.crewai_config)
-        ))
-        
-        conn.commit()
-        
-        # Return the created agent
-        return AgentResponse(
-            id=agent_id,
-            name=agent.name,
-            description=agent.description,
-            short_description=agent.short_description,
-            creator=agent.creator,
-            creator_wallet=agent.creator_wallet,
-            price=agent.price,
-            category=agent.category,
-            tags=agent.tags,
-            avatar=agent.avatar,
-            is_active=True,
-            is_approved=False,
-            demo_limit=agent.demo_limit,
-            created_at=current_time,
-            updated_at=current_time,
-            nft_token_id=None,
-            input_schema=agent.input_schema,
-            crewai_config=agent.crewai_config
+    if idempotency_key is not None:
+        return await idempotent_requests.run(
+            "create_agent", idempotency_key, agent.model_dump(), lambda: _create_agent(agent),
         )
-        
+    return await _create_agent(agent)
+
+async def _create_agent(agent: AgentCreate) -> AgentResponse:
+    # Generate unique ID and timestamps
+    agent_id = str(uuid.uuid4())
+    current_time = datetime.utcnow().isoformat()
+    
+    def insert(conn):
+        conn.execute(INSERT_AGENT_SQL, _agent_insert_params(agent, agent_id, current_time))
+        conn.commit()
+    
+    try:
+        await run_db(insert)
     except sqlite3.Error as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid agent data: {str(e)}")
-    finally:
-        conn.close()
+    invalidate_agent_cache(agent_id)
+    
+    # Return the created agent
+    return AgentResponse(
+        id=agent_id,
+        name=agent.name,
+        description=agent.description,
+        short_description=agent.short_description,
+        creator=agent.creator,
+        creator_wallet=agent.creator_wallet,
+        price=agent.price,
+        category=agent.category,
+        tags=agent.tags,
+        avatar=agent.avatar,
+        is_active=True,
+        is_approved=False,
+        demo_limit=agent.demo_limit,
+        created_at=current_time,
+        updated_at=current_time,
+        nft_token_id=None,
+        input_schema=agent.input_schema,
+        crewai_config=agent.crewai_config
+    )
+
+def _validation_message(error: ValidationError) -> str:
+    """Flatten a pydantic ValidationError into one line."""
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc']) or 'record'}: {item['msg']}"
+        for item in error.errors()
+    )
+
+def _ndjson_line(payload: dict) -> bytes:
+    return (json.dumps(payload, separators=(",", ":")) + "\n").encode("utf-8")
+
+@app.post("/api/agents/bulk")
+async def bulk_create_agents(request: Request):
+    """
+    Create many agents from one upload.
+    
+    The body is either a JSON array of agent objects or newline-delimited JSON
+    (`Content-Type: application/x-ndjson`), one agent per line. Records are
+    validated as they stream in and inserted in chunked transactions, so the
+    upload size does not affect memory use.
+    
+    The response is NDJSON: one line per record in input order,
+    `{"index", "status": "created", "id"}` or `{"index", "status": "error", "error"}`,
+    then a final `{"summary": {"created", "failed"}}` line. A body that cannot
+    be parsed further ends with an error line for the index where parsing
+    stopped; chunks that were committed before it stay committed. Result lines
+    are spooled to a temporary file while the upload is processed, then
+    streamed back.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    records = iter_ndjson if content_type in NDJSON_CONTENT_TYPES else iter_json_array
+    chunk_size = max(1, settings.BULK_IMPORT_CHUNK_SIZE)
+    
+    def insert_chunk(conn, rows):
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(INSERT_AGENT_SQL, rows)
+        conn.commit()
+    
+    async def flush(pending):
+        """Insert the valid records of a chunk; yields result lines for all of them, in input order."""
+        db_error = None
+        rows = [params for _, params, _ in pending if params is not None]
+        if rows:
+            try:
+                await run_db(insert_chunk, rows)
+            except sqlite3.Error as e:
+                db_error = f"Database error: {str(e)}"
+            else:
+                invalidate_agent_cache()
+        for index, params, error in pending:
+            error = error or (db_error if params is not None else None)
+            if error is not None:
+                yield {"index": index, "status": "error", "error": error}
+            else:
+                yield {"index": index, "status": "created", "id": params[0]}
+    
+    async def results():
+        created = failed = 0
+        pending = []  # (index, insert params or None, error or None)
+        index = -1
+        parse_error = None
+        try:
+            async for value, error in records(request.stream()):
+                index += 1
+                if error is None:
+                    try:
+                        agent = AgentCreate.model_validate(value)
+                    except ValidationError as e:
+                        error = _validation_message(e)
+                if error is not None:
+                    pending.append((index, None, error))
+                else:
+                    current_time = datetime.utcnow().isoformat()
+                    pending.append((index, _agent_insert_params(agent, str(uuid.uuid4()), current_time), None))
+                if len(pending) >= chunk_size:
+                    async for result in flush(pending):
+                        created += result["status"] == "created"
+                        failed += result["status"] == "error"
+                        yield _ndjson_line(result)
+                    pending = []
+        except BulkParseError as e:
+            parse_error = {"index": index + 1, "status": "error", "error": str(e)}
+        
+        if pending:
+            async for result in flush(pending):
+                created += result["status"] == "created"
+                failed += result["status"] == "error"
+                yield _ndjson_line(result)
+        if parse_error is not None:
+            failed += 1
+            yield _ndjson_line(parse_error)
+        yield _ndjson_line({"summary": {"created": created, "failed": failed}})
+    
+    # The whole body is consumed before responding: the streaming response
+    # listens on the same ASGI receive channel for client disconnects.
+    spool = tempfile.SpooledTemporaryFile(max_size=settings.BULK_IMPORT_RESULTS_MEMORY_BYTES)
+    try:
+        async for line in results():
+            spool.write(line)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    
+    def replay():
+        with spool:
+            yield from spool
+    
+    return StreamingResponse(replay(), media_type="application/x-ndjson")
+
+def _check_input(agent_row, job_input: dict):
+    """Reject input that does not match the agent's input_schema with a 422."""
+    try:
+        validate_input(agent_row["id"], agent_row["updated_at"], agent_row["input_schema"], job_input)
+    except InputValidationError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid input: {e}")
 
 @app.post("/api/agents/{agent_id}/demo", response_model=DemoResponse)
-async def demo_agent(agent_id: str, demo_request: DemoRequest):
+async def demo_agent(agent_id: str, demo_request: DemoRequest, idempotency_key: Optional[str] = Header(None)):
     """
     Start a demo session for an agent with limited functionality.
     
     - **agent_id**: Unique identifier for the agent
     - **demo_request**: Demo input parameters and optional user wallet
+    - **Idempotency-Key** (header): Retries with the same key return the first
+      response without using another demo
     """
-    conn = get_db_connection()
-    try:
+    if idempotency_key is not None:
+        return await idempotent_requests.run(
+            f"demo:{agent_id}", idempotency_key, demo_request.model_dump(), lambda: _demo_agent(agent_id, demo_request),
+        )
+    return await _demo_agent(agent_id, demo_request)
+
+async def _demo_agent(agent_id: str, demo_request: DemoRequest) -> DemoResponse:
+    def run_demo(conn):
         # First, verify the agent exists and is active
         cursor = conn.execute("""
-            SELECT id, name, demo_limit, is_active, is_approved, input_schema, crewai_config
+            SELECT id, name, demo_limit, is_active, is_approved, input_schema, crewai_config, updated_at
             FROM agents 
             WHERE id = ? AND is_active = 1 AND is_approved = 1
         """, (agent_id,))
@@ -292,27 +867,31 @@ async def demo_agent(agent_id: str, demo_request: DemoRequest):
         agent_row = cursor.fetchone()
         if not agent_row:
             raise HTTPException(status_code=404, detail="Agent not found or not available")
+        _check_input(agent_row, demo_request.input)
         
         agent_data = dict(agent_row)
         demo_limit = agent_data['demo_limit']
         
-        # Check demo usage if user wallet is provided
+        # Claim a demo slot if user wallet is provided. The conditional upsert
+        # only increments while count < demo_limit, and it shares a transaction
+        # with the job insert, so concurrent demos cannot overshoot the limit.
         demo_count = 0
+        conn.execute("BEGIN IMMEDIATE")
         if demo_request.user_wallet:
-            cursor = conn.execute("""
-                SELECT COUNT(*) as count
-                FROM agent_jobs 
-                WHERE agent_id = ? AND user_wallet = ? AND is_demo = 1
-            """, (agent_id, demo_request.user_wallet))
-            
-            count_row = cursor.fetchone()
-            demo_count = count_row['count'] if count_row else 0
+            claimed = conn.execute("""
+                INSERT INTO demo_usage (agent_id, user_wallet, count)
+                SELECT ?, ?, 1 WHERE ? > 0
+                ON CONFLICT (agent_id, user_wallet) DO UPDATE SET count = count + 1
+                WHERE count < ?
+                RETURNING count
+            """, (agent_id, demo_request.user_wallet, demo_limit, demo_limit)).fetchall()
             
-            if demo_count >= demo_limit:
+            if not claimed:
                 raise HTTPException(
                     status_code=429, 
-                    detail=f"Demo limit reached. You have used {demo_count}/{demo_limit} demos for this agent."
+                    detail=f"Demo limit reached. You have used {demo_limit}/{demo_limit} demos for this agent."
                 )
+            demo_count = claimed[0]['count'] - 1
         
         # Create a demo job
         job_id = str(uuid.uuid4())
@@ -328,7 +907,7 @@ async def demo_agent(agent_id: str, demo_request: DemoRequest):
         }
         
         # Insert demo job record
-        cursor = conn.execute("""
+        conn.execute("""
             INSERT INTO agent_jobs (
                 id, agent_id, user_wallet, status, input, output, 
                 created_at, completed_at, is_demo
@@ -338,8 +917,8 @@ async def demo_agent(agent_id: str, demo_request: DemoRequest):
             agent_id,
             demo_request.user_wallet or "anonymous",
             "completed",
-            json.dumps(demo_request.input),
-            json.dumps(demo_output),
+            pack_json(demo_request.input),
+            pack_json(demo_output),
             current_time,
             current_time,
             True  # is_demo
@@ -355,15 +934,294 @@ async def demo_agent(agent_id: str, demo_request: DemoRequest):
             demo_count=demo_count + 1,
             demo_limit=demo_limit
         )
-        
+    
+    try:
+        return await run_db(run_demo)
     except sqlite3.Error as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Demo execution error: {str(e)}")
-    finally:
-        conn.close()
+
+@app.post("/api/agents/{agent_id}/start", response_model=JobResponse, status_code=202)
+async def start_job(agent_id: str, job_request: JobRequest):
+    """
+    Queue a full agent run. The job executes in the background; poll its
+    status and fetch its result with the job id returned here.
+    
+    - **agent_id**: Unique identifier for the agent
+    - **job_request**: Job input and the requesting user's wallet
+    """
+    def enqueue(conn):
+        agent_row = conn.execute(
+            "SELECT id, input_schema, updated_at FROM agents WHERE id = ? AND is_active = 1 AND is_approved = 1",
+            (agent_id,),
+        ).fetchone()
+        if not agent_row:
+            raise HTTPException(status_code=404, detail="Agent not found or not available")
+        _check_input(agent_row, job_request.input)
+        return enqueue_job(conn, agent_id, job_request.user_wallet, job_request.input)
+    
+    try:
+        job = await run_db(enqueue)
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    job_engine.notify()
+    
+    return JobResponse(
+        job_id=job["job_id"],
+        agent_id=agent_id,
+        status="queued",
+        created_at=job["created_at"],
+    )
+
+async def _fetch_job(agent_id: str, job_id: str, columns: str):
+    """Load one job of an agent, or raise a 404."""
+    def fetch(conn):
+        return conn.execute(
+            f"SELECT {columns} FROM agent_jobs WHERE id = ? AND agent_id = ?",
+            (job_id, agent_id),
+        ).fetchone()
+    
+    try:
+        row = await run_db(fetch)
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    if row is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return row
+
+@app.get("/api/agents/{agent_id}/status/{job_id}", response_model=JobStatusResponse)
+async def get_job_status(agent_id: str, job_id: str):
+    """
+    Get the current state of a job: queued, running, completed or failed.
+    
+    - **agent_id**: Unique identifier for the agent
+    - **job_id**: Identifier returned by the start endpoint
+    """
+    row = await _fetch_job(
+        agent_id, job_id, "id, agent_id, status, created_at, started_at, completed_at, error"
+    )
+    return JobStatusResponse(
+        job_id=row["id"],
+        agent_id=row["agent_id"],
+        status=row["status"],
+        created_at=row["created_at"],
+        started_at=row["started_at"],
+        completed_at=row["completed_at"],
+        error=row["error"],
+    )
+
+@app.get("/api/agents/{agent_id}/result/{job_id}", response_model=JobResultResponse)
+async def get_job_result(agent_id: str, job_id: str):
+    """
+    Get the output of a finished job. `output` is null while the job is
+    still queued or running; failed jobs report `error` instead.
+    
+    - **agent_id**: Unique identifier for the agent
+    - **job_id**: Identifier returned by the start endpoint
+    """
+    row = await _fetch_job(agent_id, job_id, "id, agent_id, status, output, error")
+    output = None
+    if row["status"] == JOB_COMPLETED and row["output"]:
+        output = unpack_json(row["output"])
+    return JobResultResponse(
+        job_id=row["id"],
+        agent_id=row["agent_id"],
+        status=row["status"],
+        output=output,
+        error=row["error"] if row["status"] == JOB_FAILED else None,
+    )
+
+def _job_snapshot(row) -> dict:
+    """Status event payload built from an agent_jobs row."""
+    payload = {"job_id": row["id"], "status": row["status"]}
+    if row["status"] == JOB_COMPLETED and row["output"]:
+        payload["output"] = unpack_json(row["output"])
+    if row["status"] == JOB_FAILED:
+        payload["error"] = row["error"]
+    return payload
+
+def _event_status(job_event, status: str) -> str:
+    """The job status after a published event: a status event's, otherwise unchanged."""
+    if job_event.event != "status":
+        return status
+    return json.loads(job_event.data)["status"]
+
+def _sse(event: str, payload: dict) -> bytes:
+    """An id-less SSE event, so it does not move the client's resume position."""
+    return f"event: {event}\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n".encode("utf-8")
+
+@app.get("/api/agents/{agent_id}/events/{job_id}")
+async def stream_job_events(agent_id: str, job_id: str, request: Request,
+                            last_event_id: Optional[int] = None):
+    """
+    Stream a job's status transitions and partial output as Server-Sent Events.
+    
+    Events are `status` (queued, running, then completed or failed with the
+    output or error) and `progress` (partial output). The stream ends after
+    the final status. Comment heartbeats are sent while the job is idle.
+    Reconnecting clients resume after the `Last-Event-ID` header (or the
+    `last_event_id` query parameter).
+    
+    - **agent_id**: Unique identifier for the agent
+    - **job_id**: Identifier returned by the start endpoint
+    """
+    header_id = request.headers.get("last-event-id")
+    if header_id:
+        try:
+            last_event_id = int(header_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    
+    columns = "id, agent_id, status, output, error"
+    row = await _fetch_job(agent_id, job_id, columns)
+    # Subscribe before deciding what to replay so no event can slip between
+    backlog, subscriber = job_events.subscribe(job_id, last_event_id)
+    
+    async def stream():
+        try:
+            yield b"retry: 3000\n\n"
+            status = row["status"]  # the last status the client has been sent
+            if backlog:
+                for job_event in backlog:
+                    yield job_event.encode()
+                    if job_event.final:
+                        return
+                    status = _event_status(job_event, status)
+            elif (last_event_id is None or not job_events.has_events(job_id)
+                  or status in (JOB_COMPLETED, JOB_FAILED)):
+                # Nothing buffered here (the job ran in another process, or
+                # long ago), or the job has finished: start from the stored state
+                yield _sse("status", _job_snapshot(row))
+                if status in (JOB_COMPLETED, JOB_FAILED):
+                    return
+            else:
+                status = None  # the client is up to date with this process; the database may be ahead
+            
+            while True:
+                try:
+                    job_event = await asyncio.wait_for(
+                        subscriber.queue.get(), settings.SSE_HEARTBEAT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield b": heartbeat\n\n"
+                    if not job_engine.owns(job_id):
+                        # A worker in another process may have claimed the job (this
+                        # one only published 'queued'); its progress is in the database
+                        latest = await _fetch_job(agent_id, job_id, columns)
+                        if latest["status"] != status:
+                            status = latest["status"]
+                            yield _sse("status", _job_snapshot(latest))
+                        if status in (JOB_COMPLETED, JOB_FAILED):
+                            return
+                    continue
+                yield job_event.encode()
+                if job_event.final:
+                    return
+                status = _event_status(job_event, status)
+        finally:
+            job_events.unsubscribe(job_id, subscriber)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def _export_response(query: str, params: list, export_format: str, name: str,
+                     columns, json_columns, bool_columns) -> StreamingResponse:
+    """Stream a query's rows as an NDJSON or CSV attachment."""
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported format; use one of: {', '.join(EXPORT_FORMATS)}",
+        )
+    encode = chunk_encoder(export_format, columns, json_columns, bool_columns)
+    chunks = stream_query(query, params, settings.EXPORT_CHUNK_SIZE, encode)
+    return StreamingResponse(
+        encode_rows(chunks, export_format, columns),
+        media_type=EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{export_format}"'},
+    )
+
+@app.get("/api/export/agents")
+async def export_agents(
+    format: str = "ndjson",
+    category: Optional[str] = None,
+    is_active: Optional[bool] = None,
+    is_approved: Optional[bool] = None,
+    created_after: Optional[str] = None,
+    created_before: Optional[str] = None
+):
+    """
+    Export agents as a streamed NDJSON or CSV download.
+    
+    - **format**: `ndjson` (default) or `csv`
+    - **category**: Only agents in this category
+    - **is_active** / **is_approved**: Only agents with this status
+    - **created_after** / **created_before**: ISO timestamps bounding `created_at`
+      (inclusive lower bound, exclusive upper bound)
+    """
+    query = f"SELECT {', '.join(AGENT_EXPORT_COLUMNS)} FROM agents WHERE 1 = 1"
+    params = []
+    for column, value in (("category", category), ("is_active", is_active), ("is_approved", is_approved)):
+        if value is not None:
+            query += f" AND {column} = ?"
+            params.append(value)
+    if created_after:
+        query += " AND created_at >= ?"
+        params.append(created_after)
+    if created_before:
+        query += " AND created_at < ?"
+        params.append(created_before)
+    
+    return _export_response(
+        query, params, format, "agents",
+        AGENT_EXPORT_COLUMNS, AGENT_JSON_COLUMNS, AGENT_BOOL_COLUMNS,
+    )
+
+@app.get("/api/export/jobs")
+async def export_jobs(
+    format: str = "ndjson",
+    agent_id: Optional[str] = None,
+    wallet: Optional[str] = None,
+    status: Optional[str] = None,
+    is_demo: Optional[bool] = None,
+    created_after: Optional[str] = None,
+    created_before: Optional[str] = None
+):
+    """
+    Export job history as a streamed NDJSON or CSV download.
+    
+    - **format**: `ndjson` (default) or `csv`
+    - **agent_id**: Only jobs for this agent
+    - **wallet**: Only jobs from this user wallet
+    - **status**: Only jobs in this state
+    - **is_demo**: Only demo (true) or full (false) jobs
+    - **created_after** / **created_before**: ISO timestamps bounding `created_at`
+      (inclusive lower bound, exclusive upper bound)
+    """
+    query = f"SELECT {', '.join(JOB_EXPORT_COLUMNS)} FROM agent_jobs WHERE 1 = 1"
+    params = []
+    for column, value in (
+        ("agent_id", agent_id), ("user_wallet", wallet), ("status", status), ("is_demo", is_demo)
+    ):
+        if value is not None:
+            query += f" AND {column} = ?"
+            params.append(value)
+    if created_after:
+        query += " AND created_at >= ?"
+        params.append(created_after)
+    if created_before:
+        query += " AND created_at < ?"
+        params.append(created_before)
+    
+    return _export_response(
+        query, params, format, "agent_jobs",
+        JOB_EXPORT_COLUMNS, JOB_JSON_COLUMNS, JOB_BOOL_COLUMNS,
+    )
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,246 @@
+"""
+Prometheus metrics for the AgentHub backend.
+
+Counters and histograms are sharded per thread: each thread records into its
+own arrays without taking a lock, and a scrape sums the shards. Buckets are
+fixed when a histogram is created, so recording an observation is a bisect
+and two array updates.
+"""
+
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4"  # Starlette appends the charset
+
+Labels = Tuple[str, ...]
+Sample = Tuple[str, Dict[str, str], float]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class _Sharded:
+    """Per-thread storage of one array per label combination."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str], width: int):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._width = width
+        self._local = threading.local()
+        self._shards: List[Dict[Labels, array]] = []
+        self._lock = threading.Lock()  # only taken when a thread records its first value
+
+    def _values(self, labels: Labels) -> array:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+        values = shard.get(labels)
+        if values is None:
+            values = shard[labels] = array("d", bytes(8 * self._width))
+        return values
+
+    def _merged(self) -> Dict[Labels, List[float]]:
+        with self._lock:
+            shards = list(self._shards)
+        merged: Dict[Labels, List[float]] = {}
+        for shard in shards:
+            for labels, values in list(shard.items()):
+                total = merged.get(labels)
+                if total is None:
+                    merged[labels] = list(values)
+                else:
+                    for n, value in enumerate(values):
+                        total[n] += value
+        return merged
+
+    def _labels(self, labels: Labels) -> Dict[str, str]:
+        return dict(zip(self.labelnames, labels))
+
+class Counter(_Sharded):
+    """A monotonically increasing value per label combination."""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames, 1)
+
+    def inc(self, labels: Labels = (), amount: float = 1.0):
+        self._values(labels)[0] += amount
+
+    def samples(self) -> Iterable[Sample]:
+        for labels, values in sorted(self._merged().items()):
+            yield self.name, self._labels(labels), values[0]
+
+class Gauge(Counter):
+    """A value that goes up and down, e.g. requests in flight."""
+
+    type = "gauge"
+
+    def dec(self, labels: Labels = (), amount: float = 1.0):
+        self._values(labels)[0] -= amount
+
+class Histogram(_Sharded):
+    """Observations counted into fixed buckets, plus their sum."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        # Layout: one slot per bucket, one for +Inf, then the sum
+        super().__init__(name, documentation, labelnames, len(self.bounds) + 2)
+
+    def observe(self, value: float, labels: Labels = ()):
+        values = self._values(labels)
+        values[bisect_left(self.bounds, value)] += 1
+        values[-1] += value
+
+    def samples(self) -> Iterable[Sample]:
+        for labels, values in sorted(self._merged().items()):
+            base = self._labels(labels)
+            cumulative = 0.0
+            for bound, count in zip(self.bounds + (float("inf"),), values):
+                cumulative += count
+                yield f"{self.name}_bucket", {**base, "le": _format_value(bound)}, cumulative
+            yield f"{self.name}_count", base, cumulative
+            yield f"{self.name}_sum", base, values[-1]
+
+class Registry:
+    """The set of metrics rendered by /metrics."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, Iterable[Sample]]]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, Iterable[Sample]]]]):
+        """
+        Register a function called at scrape time, for values that live elsewhere.
+
+        It yields ``(name, type, help, samples)`` for each metric family.
+        """
+        self._collectors.append(collector)
+
+    def render(self) -> bytes:
+        lines = []
+        families = [(m.name, m.type, m.documentation, m.samples()) for m in self._metrics]
+        for collector in self._collectors:
+            families.extend(collector())
+        for name, kind, documentation, samples in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        lines.append("")
+        return "\n".join(lines).encode("utf-8")
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "agenthub_http_requests_total", "HTTP requests by route, method and status code.",
+    ("route", "method", "status"),
+))
+http_request_duration = registry.register(Histogram(
+    "agenthub_http_request_duration_seconds", "HTTP request latency by route, until the response is complete.",
+    ("route", "method"), LATENCY_BUCKETS,
+))
+http_in_flight = registry.register(Gauge(
+    "agenthub_http_requests_in_flight", "HTTP requests currently being handled.",
+))
+http_compression_bytes = registry.register(Counter(
+    "agenthub_http_compression_bytes_total", "Response bytes before (in) and after (out) compression, by encoding.",
+    ("encoding", "direction"),
+))
+rate_limited = registry.register(Counter(
+    "agenthub_rate_limited_total", "Requests rejected by route class: over the client's limit (429) or overload (503).",
+    ("route_class", "reason"),
+))
+worker_startup_seconds = registry.register(Gauge(
+    "agenthub_worker_startup_seconds", "Time from worker process start until it accepted connections (serve.py workers).",
+))
+db_acquire_duration = registry.register(Histogram(
+    "agenthub_db_pool_acquire_seconds", "Time to check a connection out of the pool.", (), DB_BUCKETS,
+))
+sql_duration = registry.register(Histogram(
+    "agenthub_sql_statement_seconds", "SQL statement execution time, excluding row fetches.",
+    ("statement",), DB_BUCKETS,
+))
+sql_fetch_seconds = registry.register(Counter(
+    "agenthub_sql_fetch_seconds_total", "Time spent fetching rows of SQL results.", ("statement",),
+))
+sql_rows = registry.register(Counter(
+    "agenthub_sql_rows_total", "Rows returned by queries or changed by DML statements.", ("statement",),
+))
+retention_rows = registry.register(Counter(
+    "agenthub_retention_rows_total", "Jobs removed by retention, by policy and whether they were archived.",
+    ("policy", "action"),
+))
+retention_batch_duration = registry.register(Histogram(
+    "agenthub_retention_batch_seconds", "Time to move one retention batch, including the write lock wait.",
+))
+retention_vacuumed_pages = registry.register(Counter(
+    "agenthub_retention_vacuumed_pages_total", "Database pages released by incremental vacuum.",
+))
+
+def _route_name(scope) -> str:
+    endpoint = scope.get("endpoint")
+    return getattr(endpoint, "__name__", "unmatched")
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request counts, latency and in-flight requests.
+
+    Requests are labelled with the endpoint function's name (e.g.
+    ``list_agents``), which the router stores in the scope, so path
+    parameters never create new label values.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        http_in_flight.inc()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec()
+            route = _route_name(scope)
+            method = scope.get("method", "")
+            http_requests.inc((route, method, str(status)))
+            http_request_duration.observe(time.perf_counter() - started, (route, method))
@@ -0,0 +1,580 @@
+"""
+Versioned schema migrations for the AgentHub database.
+
+The schema version is stored in PRAGMA user_version. init_database() compares
+it with LATEST_VERSION and returns at once when they match, so a normal start
+runs no DDL at all. Otherwise the pending migrations are applied in order,
+under database.schema_lock() so only one process migrates.
+
+A migration is a DDL step, run in one transaction, plus optionally a backfill
+that fills a new table from rows that existed before it. The DDL (including
+any triggers) commits first, so rows written from then on are kept up to date
+by the app or the triggers. The backfill then walks the older rows in rowid
+ranges, one short transaction per batch, so other connections can write in
+between. Its progress is kept in schema_backfill_progress, so an interrupted
+backfill resumes where it stopped; the version is bumped in the same
+transaction as its last batch.
+
+Databases created before migrations existed (user_version 0 with tables in
+place) are adopted: every DDL step is idempotent, and a backfill is skipped
+when its table was already there.
+
+Add a migration by appending it to MIGRATIONS; never change one that has shipped.
+
+Usage:
+    python migrations.py [--dry-run] [--batch-size N]
+"""
+
+import argparse
+import json
+import sqlite3
+import time
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+from config import settings
+
+class Backfill(NamedTuple):
+    """Rows of ``source`` processed in rowid ranges after the DDL step has committed."""
+    target: str  # table being filled; skipped if it existed before the migration
+    source: str  # table walked in rowid order
+    sql: str  # processes one batch, binding the rowid range (low, high]
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[sqlite3.Connection], None]
+    scans: Tuple[str, ...] = ()  # tables the DDL reads in full (index builds), for dry-run estimates
+    backfill: Optional[Backfill] = None
+
+# Tags of an agents row as a json_each() source; rows with malformed tags index nothing
+TAGS_JSON = "CASE WHEN json_valid({tags}) THEN {tags} ELSE '[]' END"
+
+# Lower edges of the price histogram buckets, in lovelace (0, 1, 2, 5, 10, ... 10000 ADA).
+# catalog_facets stores counts per bucket, so changing them needs a new migration.
+PRICE_BUCKETS = tuple(ada * 1_000_000 for ada in (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000))
+
+def price_bucket_sql(price: str) -> str:
+    """SQL expression for the PRICE_BUCKETS edge that ``price`` falls in."""
+    cases = " ".join(f"WHEN {price} >= {edge} THEN {edge}" for edge in reversed(PRICE_BUCKETS[1:]))
+    return f"CASE {cases} ELSE 0 END"
+
+# Distinct normalized tags of an agents row, as agent_tags stores them
+_DISTINCT_TAGS = f"""
+    SELECT DISTINCT lower(trim(j.value)) AS tag FROM json_each({TAGS_JSON.format(tags="{row}.tags")}) j
+    WHERE j.type = 'text' AND trim(j.value) != ''
+"""
+
+# catalog_changes trims itself to about this many rows, whether or not any process
+# runs a catalog snapshot (which prunes it further, to CATALOG_CHANGE_LOG_SIZE)
+CATALOG_CHANGE_LOG_MAX = 100_000
+_CATALOG_CHANGE_LOG_TRIM_EVERY = 1000  # rows appended between trims
+
+CATALOG_FACETS_REBUILD = f"""
+    INSERT INTO catalog_facets (tag, category, bucket, count)
+    SELECT tag, category, bucket, COUNT(*) FROM (
+        SELECT 0, '' AS tag, coalesce(category, '') AS category, {price_bucket_sql("price")} AS bucket
+        FROM agents WHERE is_active = 1 AND is_approved = 1
+        UNION ALL
+        SELECT DISTINCT a.rowid, lower(trim(j.value)), coalesce(a.category, ''), {price_bucket_sql("a.price")}
+        FROM agents a, json_each({TAGS_JSON.format(tags="a.tags")}) j
+        WHERE a.is_active = 1 AND a.is_approved = 1 AND j.type = 'text' AND trim(j.value) != ''
+    )
+    GROUP BY tag, category, bucket
+"""
+
+AGENT_TAGS_BACKFILL = f"""
+    INSERT OR IGNORE INTO agent_tags (tag, agent_id)
+    SELECT lower(trim(j.value)), a.id
+    FROM agents a, json_each({TAGS_JSON.format(tags="a.tags")}) j
+    WHERE a.rowid > ? AND a.rowid <= ? AND j.type = 'text' AND trim(j.value) != ''
+"""
+
+def _core_tables(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS agents (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            description TEXT,
+            short_description TEXT,
+            creator TEXT NOT NULL,
+            creator_wallet TEXT NOT NULL,
+            price INTEGER NOT NULL,
+            category TEXT,
+            tags TEXT, -- JSON array
+            avatar TEXT,
+            is_active BOOLEAN DEFAULT TRUE,
+            is_approved BOOLEAN DEFAULT FALSE,
+            demo_limit INTEGER DEFAULT 3,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            nft_token_id TEXT,
+            input_schema TEXT, -- JSON
+            crewai_config TEXT -- JSON
+        )
+    """)
+    # Demo and job tracking
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS agent_jobs (
+            id TEXT PRIMARY KEY,
+            agent_id TEXT NOT NULL,
+            user_wallet TEXT NOT NULL,
+            status TEXT DEFAULT 'queued',
+            input TEXT, -- JSON
+            output TEXT, -- JSON
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completed_at TIMESTAMP,
+            is_demo BOOLEAN DEFAULT FALSE,
+            FOREIGN KEY (agent_id) REFERENCES agents (id)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_agents_category ON agents(category)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_agents_creator ON agents(creator_wallet)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_agents_active_approved ON agents(is_active, is_approved)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_agent ON agent_jobs(agent_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_user ON agent_jobs(user_wallet)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_demo ON agent_jobs(is_demo)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created ON agent_jobs(created_at)")
+
+def _listing_indexes(conn):
+    # Keyset pagination: filters first, then the (created_at, id) sort key
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_agents_listing ON agents(is_active, is_approved, created_at, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_agents_category_listing ON agents(is_active, is_approved, category, created_at, id)")
+
+def _search_index(conn):
+    """
+    agents_fts full-text index and the triggers that keep it in sync.
+
+    agents_fts is an external-content FTS5 table: it stores only the inverted
+    index and reads column text back from agents by rowid. Rowids of agents
+    are not stable across a full VACUUM, so run rebuild_search_index() after
+    one. The initial build is a single 'rebuild' rather than a batched
+    backfill: an update trigger firing for a row not yet indexed would
+    delete entries that were never added.
+    """
+    exists = _table_exists(conn, "agents_fts")
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS agents_fts USING fts5(
+            name, short_description, description, tags,
+            content='agents', content_rowid='rowid',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS agents_fts_ai AFTER INSERT ON agents BEGIN
+            INSERT INTO agents_fts (rowid, name, short_description, description, tags)
+            VALUES (new.rowid, new.name, new.short_description, new.description, new.tags);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS agents_fts_ad AFTER DELETE ON agents BEGIN
+            INSERT INTO agents_fts (agents_fts, rowid, name, short_description, description, tags)
+            VALUES ('delete', old.rowid, old.name, old.short_description, old.description, old.tags);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS agents_fts_au
+        AFTER UPDATE OF name, short_description, description, tags ON agents BEGIN
+            INSERT INTO agents_fts (agents_fts, rowid, name, short_description, description, tags)
+            VALUES ('delete', old.rowid, old.name, old.short_description, old.description, old.tags);
+            INSERT INTO agents_fts (rowid, name, short_description, description, tags)
+            VALUES (new.rowid, new.name, new.short_description, new.description, new.tags);
+        END
+    """)
+    if not exists:
+        conn.execute("INSERT INTO agents_fts (agents_fts) VALUES ('rebuild')")
+
+def _tag_index(conn):
+    """
+    agent_tags, a normalized (tag, agent_id) index over agents.tags.
+
+    Tags are stored lower-cased and trimmed. Triggers keep the table in sync
+    with inserts, tag updates and deletes on agents.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS agent_tags (
+            tag TEXT NOT NULL,
+            agent_id TEXT NOT NULL,
+            PRIMARY KEY (tag, agent_id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_agent_tags_agent ON agent_tags(agent_id)")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS agent_tags_ai AFTER INSERT ON agents BEGIN
+            INSERT OR IGNORE INTO agent_tags (tag, agent_id)
+            SELECT lower(trim(value)), new.id FROM json_each({TAGS_JSON.format(tags="new.tags")})
+            WHERE type = 'text' AND trim(value) != '';
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS agent_tags_ad AFTER DELETE ON agents BEGIN
+            DELETE FROM agent_tags WHERE agent_id = old.id;
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS agent_tags_au AFTER UPDATE OF id, tags ON agents BEGIN
+            DELETE FROM agent_tags WHERE agent_id = old.id;
+            INSERT OR IGNORE INTO agent_tags (tag, agent_id)
+            SELECT lower(trim(value)), new.id FROM json_each({TAGS_JSON.format(tags="new.tags")})
+            WHERE type = 'text' AND trim(value) != '';
+        END
+    """)
+
+def _job_engine_columns(conn):
+    _add_column_if_missing(conn, "agent_jobs", "started_at", "TIMESTAMP")
+    _add_column_if_missing(conn, "agent_jobs", "worker_id", "TEXT")
+    # Partial indexes: the queue in claim order, and running jobs per agent
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_queued ON agent_jobs(created_at) WHERE status = 'queued'")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_running ON agent_jobs(agent_id) WHERE status = 'running'")
+
+def _job_heartbeats(conn):
+    # Refreshed by the engine running the job; requeue_stale_jobs goes by it rather than started_at
+    _add_column_if_missing(conn, "agent_jobs", "heartbeat_at", "TIMESTAMP")
+
+def _demo_usage(conn):
+    """
+    demo_usage, the per (agent, wallet) demo counter.
+
+    demo_agent increments it with a conditional upsert in the same transaction
+    as the job insert, so the quota check is O(1) and cannot be raced past.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS demo_usage (
+            agent_id TEXT NOT NULL,
+            user_wallet TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (agent_id, user_wallet)
+        ) WITHOUT ROWID
+    """)
+
+def _idempotency_keys(conn):
+    # Responses replayed for requests with an Idempotency-Key
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            scope TEXT NOT NULL,
+            key TEXT NOT NULL,
+            fingerprint BLOB NOT NULL,
+            status_code INTEGER, -- NULL while the first request is running
+            body BLOB,
+            created_at REAL NOT NULL, -- unix time
+            PRIMARY KEY (scope, key)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_created ON idempotency_keys(created_at)")
+
+def _catalog_changes(conn):
+    """
+    catalog_changes, a log of the ids of changed agents, for catalog snapshots.
+
+    Its AUTOINCREMENT counter in sqlite_sequence only moves forward, so a
+    process compares it with the position of its snapshot to tell whether
+    anything changed. catalog.py prunes old entries; see also
+    _catalog_changes_trim.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS catalog_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            agent_id TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS catalog_changes_ai AFTER INSERT ON agents BEGIN
+            INSERT INTO catalog_changes (agent_id) VALUES (new.id);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS catalog_changes_au AFTER UPDATE ON agents BEGIN
+            INSERT INTO catalog_changes (agent_id) SELECT old.id WHERE old.id IS NOT new.id;
+            INSERT INTO catalog_changes (agent_id) VALUES (new.id);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS catalog_changes_ad AFTER DELETE ON agents BEGIN
+            INSERT INTO catalog_changes (agent_id) VALUES (old.id);
+        END
+    """)
+
+def _catalog_facets(conn):
+    """
+    catalog_facets, agent counts of the public catalog per tag, category and price bucket.
+
+    Each active, approved agent counts once in a row with tag '' and once
+    per tag, under its category ('' if it has none) and its PRICE_BUCKETS
+    edge. Triggers adjust the counts as agents change, so facets.py reads
+    the facets of the whole catalog, or of one tag, from a few thousand
+    rows at most, however many agents there are. As for agents_fts, the
+    initial build is a single statement: an update trigger firing for a row
+    not yet counted would subtract it.
+    """
+    exists = _table_exists(conn, "catalog_facets")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS catalog_facets (
+            tag TEXT NOT NULL,
+            category TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (tag, category, bucket)
+        ) WITHOUT ROWID
+    """)
+    # Other filter combinations are counted from this index without reading agents rows
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_agents_facets ON agents(is_active, is_approved, category, price)")
+
+    def counted(row):
+        """WHERE clause for the rows an agent counts in, if it is in the public catalog."""
+        return f"""
+            {row}.is_active = 1 AND {row}.is_approved = 1
+            AND tag IN (SELECT '' UNION ALL {_DISTINCT_TAGS.format(row=row)})
+            AND category = coalesce({row}.category, '') AND bucket = {price_bucket_sql(f"{row}.price")}
+        """
+
+    def add(row):
+        return f"""
+            INSERT INTO catalog_facets (tag, category, bucket, count)
+            SELECT tags.tag, coalesce({row}.category, ''), {price_bucket_sql(f"{row}.price")}, 1
+            FROM (SELECT '' AS tag UNION ALL {_DISTINCT_TAGS.format(row=row)}) AS tags
+            WHERE {row}.is_active = 1 AND {row}.is_approved = 1
+            ON CONFLICT (tag, category, bucket) DO UPDATE SET count = count + 1;
+        """
+
+    def remove(row):
+        return f"""
+            UPDATE catalog_facets SET count = count - 1 WHERE {counted(row)};
+            DELETE FROM catalog_facets WHERE count <= 0 AND {counted(row)};
+        """
+
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS catalog_facets_ai AFTER INSERT ON agents BEGIN {add('new')} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS catalog_facets_ad AFTER DELETE ON agents BEGIN {remove('old')} END")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS catalog_facets_au
+        AFTER UPDATE OF is_active, is_approved, category, price, tags ON agents BEGIN
+            {remove('old')}
+            {add('new')}
+        END
+    """)
+    if not exists:
+        conn.execute(CATALOG_FACETS_REBUILD)
+
+def _catalog_changes_trim(conn):
+    """
+    Bound catalog_changes without relying on a snapshot thread to prune it.
+
+    Every _CATALOG_CHANGE_LOG_TRIM_EVERY-th entry deletes the entries more
+    than CATALOG_CHANGE_LOG_MAX behind it, a range of the primary key, so
+    the cost per change stays constant. A snapshot that falls further behind
+    finds its entries gone and rebuilds, as it does after _prune.
+    """
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS catalog_changes_trim AFTER INSERT ON catalog_changes
+        WHEN new.seq % {_CATALOG_CHANGE_LOG_TRIM_EVERY} = 0 BEGIN
+            DELETE FROM catalog_changes WHERE seq <= new.seq - {CATALOG_CHANGE_LOG_MAX};
+        END
+    """)
+    conn.execute(
+        "DELETE FROM catalog_changes WHERE seq <= (SELECT max(seq) FROM catalog_changes) - ?",
+        (CATALOG_CHANGE_LOG_MAX,),
+    )
+
+MIGRATIONS = [
+    Migration(1, "agents and agent_jobs tables", _core_tables, scans=("agents", "agent_jobs")),
+    Migration(2, "keyset pagination indexes on agents", _listing_indexes, scans=("agents",)),
+    Migration(3, "agents_fts full-text index", _search_index, scans=("agents",)),
+    Migration(4, "agent_tags tag index", _tag_index,
+              backfill=Backfill("agent_tags", "agents", AGENT_TAGS_BACKFILL)),
+    Migration(5, "job engine columns and queue indexes", _job_engine_columns, scans=("agent_jobs",)),
+    # Carries over demos recorded before the counter existed
+    Migration(6, "demo_usage quota counter", _demo_usage,
+              backfill=Backfill("demo_usage", "agent_jobs", """
+                  INSERT INTO demo_usage (agent_id, user_wallet, count)
+                  SELECT agent_id, user_wallet, COUNT(*) FROM agent_jobs
+                  WHERE rowid > ? AND rowid <= ? AND is_demo = 1
+                  GROUP BY agent_id, user_wallet
+                  ON CONFLICT (agent_id, user_wallet) DO UPDATE SET count = count + excluded.count
+              """)),
+    Migration(7, "idempotency_keys table", _idempotency_keys),
+    Migration(8, "catalog_changes log for catalog snapshots", _catalog_changes),
+    Migration(9, "catalog_facets counts and facet index", _catalog_facets, scans=("agents",)),
+    Migration(10, "trim catalog_changes to a fixed size", _catalog_changes_trim),
+    Migration(11, "agent_jobs heartbeat column", _job_heartbeats),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+def schema_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def _table_exists(conn, name: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+def _add_column_if_missing(conn, table: str, column: str, declaration: str):
+    """Add a column to an existing table unless it is already there."""
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+def _backfill_progress(conn, version: int) -> Optional[Tuple[int, int]]:
+    """(last rowid done, last rowid to do) of an unfinished backfill, or None."""
+    if not _table_exists(conn, "schema_backfill_progress"):
+        return None
+    row = conn.execute(
+        "SELECT last_rowid, end_rowid FROM schema_backfill_progress WHERE version = ?", (version,)
+    ).fetchone()
+    return (row[0], row[1]) if row else None
+
+def pending_migrations(conn) -> List[Migration]:
+    version = schema_version(conn)
+    if version > LATEST_VERSION:
+        raise RuntimeError(f"Database schema version {version} is newer than this code supports ({LATEST_VERSION})")
+    return MIGRATIONS[version:]
+
+def migrate(conn, batch_size: Optional[int] = None, pause: Optional[float] = None) -> List[int]:
+    """
+    Apply the pending migrations and return their versions.
+
+    Callers hold schema_lock(); with the schema current this is one PRAGMA read.
+    """
+    batch_size = batch_size or settings.MIGRATION_BATCH_SIZE
+    pause = settings.MIGRATION_BATCH_PAUSE if pause is None else pause
+    pending = pending_migrations(conn)
+    if not pending:
+        return []
+    if pending[0].version == 1 and conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0:
+        # New database: let retention give freed pages back (VACUUM applies it, and is
+        # instant while empty). retention.py converts existing databases.
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+
+    applied = []
+    for migration in pending:
+        started = time.perf_counter()
+        rows = _apply(conn, migration, batch_size, pause)
+        elapsed = (time.perf_counter() - started) * 1000
+        backfilled = f", backfill wrote {rows} rows" if rows is not None else ""
+        print(f"Applied migration {migration.version} ({migration.description}) in {elapsed:.1f} ms{backfilled}")
+        applied.append(migration.version)
+    return applied
+
+def _apply(conn, migration: Migration, batch_size: int, pause: float) -> Optional[int]:
+    """Run one migration; return the rows its backfill wrote, or None if it had none to run."""
+    progress = _backfill_progress(conn, migration.version)
+    if progress is None:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            backfill = migration.backfill
+            if backfill is not None and _table_exists(conn, backfill.target):
+                backfill = None  # created before versioning, and already filled
+            migration.apply(conn)
+            if backfill is None:
+                conn.execute(f"PRAGMA user_version = {migration.version}")
+                conn.commit()
+                return None
+            # Rows after this one are written with the new schema in place
+            end_rowid = conn.execute(f"SELECT coalesce(max(rowid), 0) FROM {backfill.source}").fetchone()[0]
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS schema_backfill_progress (
+                    version INTEGER PRIMARY KEY,
+                    last_rowid INTEGER NOT NULL,
+                    end_rowid INTEGER NOT NULL
+                )
+            """)
+            conn.execute(
+                "INSERT INTO schema_backfill_progress (version, last_rowid, end_rowid) VALUES (?, 0, ?)",
+                (migration.version, end_rowid),
+            )
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        progress = (0, end_rowid)
+    return _run_backfill(conn, migration, progress[0], progress[1], batch_size, pause)
+
+def _run_backfill(conn, migration: Migration, last_rowid: int, end_rowid: int, batch_size: int, pause: float) -> int:
+    """Process rows (last_rowid, end_rowid] a batch per transaction; the last one bumps the version."""
+    source = migration.backfill.source
+    total = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            high = conn.execute(
+                f"SELECT max(rowid) FROM (SELECT rowid FROM {source} WHERE rowid > ? AND rowid <= ? ORDER BY rowid LIMIT ?)",
+                (last_rowid, end_rowid, batch_size),
+            ).fetchone()[0]
+            if high is None:
+                conn.execute("DELETE FROM schema_backfill_progress WHERE version = ?", (migration.version,))
+                conn.execute(f"PRAGMA user_version = {migration.version}")
+                conn.commit()
+                return total
+            total += conn.execute(migration.backfill.sql, (last_rowid, high)).rowcount
+            conn.execute(
+                "UPDATE schema_backfill_progress SET last_rowid = ? WHERE version = ?", (high, migration.version)
+            )
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        last_rowid = high
+        if pause > 0:
+            time.sleep(pause)
+
+def _count_rows(conn, table: str, after_rowid: int = 0, end_rowid: Optional[int] = None) -> int:
+    if not _table_exists(conn, table):
+        return 0
+    if end_rowid is None:
+        return conn.execute(f"SELECT COUNT(*) FROM {table} WHERE rowid > ?", (after_rowid,)).fetchone()[0]
+    return conn.execute(
+        f"SELECT COUNT(*) FROM {table} WHERE rowid > ? AND rowid <= ?", (after_rowid, end_rowid)
+    ).fetchone()[0]
+
+def plan(conn) -> List[dict]:
+    """
+    The pending migrations without applying them, with the rows each would touch.
+
+    Index builds count every row of the indexed table even if the index
+    already exists, so the estimates are upper bounds.
+    """
+    steps = []
+    for migration in pending_migrations(conn):
+        estimate = sum(_count_rows(conn, table) for table in migration.scans)
+        backfill = migration.backfill
+        if backfill is not None:
+            progress = _backfill_progress(conn, migration.version)
+            if progress is not None:
+                estimate += _count_rows(conn, backfill.source, *progress)
+            elif not _table_exists(conn, backfill.target):
+                estimate += _count_rows(conn, backfill.source)
+            else:
+                backfill = None
+        steps.append({
+            "version": migration.version,
+            "description": migration.description,
+            "estimated_rows": estimate,
+            "backfill": backfill.target if backfill else None,
+        })
+    return steps
+
+def main():
+    from database import create_connection, schema_lock
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="list pending migrations and the rows they would touch")
+    parser.add_argument("--batch-size", type=int, default=settings.MIGRATION_BATCH_SIZE, help="rows per backfill transaction")
+    args = parser.parse_args()
+
+    conn = create_connection()
+    try:
+        if args.dry_run:
+            print(json.dumps({
+                "database": settings.DATABASE_PATH,
+                "version": schema_version(conn),
+                "latest_version": LATEST_VERSION,
+                "pending": plan(conn),
+            }, indent=2))
+            return
+        with schema_lock():
+            applied = migrate(conn, batch_size=args.batch_size)
+        print(f"Schema at version {schema_version(conn)} ({len(applied)} migrations applied)")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
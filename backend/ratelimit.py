@@ -0,0 +1,219 @@
+"""
+Per-client rate limiting and admission control.
+
+RateLimitMiddleware runs before routing, so a rejected request costs a dict
+lookup and some arithmetic and never reaches a database connection. Each
+request is classified by method and path into a route class (read, write,
+demo, job, export) with its own token bucket per client IP, plus one per
+wallet when the request names it in a header. A per-process cap on requests
+in flight sheds load with 503 before anything else runs.
+"""
+
+import math
+import time
+from array import array
+from typing import Dict, Hashable, List, Optional
+
+from metrics import rate_limited
+
+EXEMPT_PATHS = frozenset({"/", "/metrics"})
+
+def parse_limits(spec: str) -> Dict[str, tuple]:
+    """Parse ``class=rate/burst`` pairs, e.g. ``read=50/100,demo=1/5`` (requests per second)."""
+    limits = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, _, value = part.partition("=")
+        rate, _, burst = value.partition("/")
+        try:
+            rate, burst = float(rate), float(burst or rate)
+        except ValueError:
+            raise ValueError(f"Invalid rate limit {part.strip()!r} (expected class=rate/burst)")
+        if rate <= 0 or burst < 1:
+            raise ValueError(f"Rate limit {part.strip()!r} needs a positive rate and a burst of at least 1")
+        limits[name.strip()] = (rate, burst)
+    return limits
+
+def route_class(method: str, path: str) -> Optional[str]:
+    """The route class a request is limited under, or None if it is exempt."""
+    if path in EXEMPT_PATHS:
+        return None
+    if path.startswith("/api/export/"):
+        return "export"
+    if method in ("GET", "HEAD"):
+        return "read"
+    if path.endswith("/demo"):
+        return "demo"
+    if path.endswith("/start"):
+        return "job"
+    return "write"
+
+class TokenBuckets:
+    """
+    Token buckets for up to ``capacity`` clients in preallocated arrays.
+
+    When the table is full, a clock hand looks at the next few slots: the
+    first client whose bucket has refilled completely is dropped (forgetting
+    it changes nothing); if they are all active, the least recently seen of
+    them is replaced. Either way a new client costs a bounded amount of work.
+    """
+
+    SCAN = 16  # slots the clock hand looks at per new client
+
+    def __init__(self, rate: float, burst: float, capacity: int):
+        self.rate = rate
+        self.burst = burst
+        self.capacity = max(1, capacity)
+        self._tokens = array("d", bytes(8 * self.capacity))
+        self._stamps = array("d", bytes(8 * self.capacity))
+        self._keys: List[Optional[Hashable]] = [None] * self.capacity
+        self._slots: Dict[Hashable, int] = {}
+        self._free = list(range(self.capacity - 1, -1, -1))
+        self._hand = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def take(self, key: Hashable, now: float) -> float:
+        """Spend one token; return 0 if allowed, else the seconds until a token is available."""
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._allocate(key, now)
+            tokens = self.burst
+        else:
+            tokens = min(self.burst, self._tokens[slot] + (now - self._stamps[slot]) * self.rate)
+        self._stamps[slot] = now
+        if tokens >= 1.0:
+            self._tokens[slot] = tokens - 1.0
+            return 0.0
+        self._tokens[slot] = tokens
+        return (1.0 - tokens) / self.rate
+
+    def _allocate(self, key: Hashable, now: float) -> int:
+        if self._free:
+            slot = self._free.pop()
+        else:
+            slot = self._victim(now)
+            del self._slots[self._keys[slot]]
+            self.evictions += 1
+        self._keys[slot] = key
+        self._slots[key] = slot
+        return slot
+
+    def _victim(self, now: float) -> int:
+        """The slot to reuse in a full table: the first idle one under the hand, else the stalest."""
+        refill_time = self.burst / self.rate
+        stalest = self._hand
+        for _ in range(min(self.SCAN, self.capacity)):
+            slot = self._hand
+            self._hand = (slot + 1) % self.capacity
+            if now - self._stamps[slot] >= refill_time:
+                return slot
+            if self._stamps[slot] < self._stamps[stalest]:
+                stalest = slot
+        return stalest
+
+def _rejection(status: int, detail: str, retry_after: float):
+    body = ('{"detail":"%s"}' % detail).encode("utf-8")
+    start = {
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("latin-1")),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode("latin-1")),
+        ],
+    }
+    return start, {"type": "http.response.body", "body": body}
+
+class RateLimiter:
+    """
+    Per-client token buckets for each route class, and a cap on requests in flight.
+
+    Over its bucket a client gets 429; with ``max_concurrency`` requests
+    already in flight in this process, new requests get 503. Both carry
+    Retry-After. Event streams are long-lived, so they do not count
+    towards the cap.
+    """
+
+    def __init__(self, limits: Dict[str, tuple], max_clients: int = 65536, max_concurrency: int = 0,
+                 wallet_header: str = "", trust_forwarded: bool = False):
+        self.buckets = {name: TokenBuckets(rate, burst, max_clients) for name, (rate, burst) in limits.items()}
+        self.max_concurrency = max_concurrency
+        self.wallet_header = wallet_header.lower().encode("latin-1")
+        self.trust_forwarded = trust_forwarded
+        self.in_flight = 0
+
+    def client_ip(self, scope) -> str:
+        if self.trust_forwarded:
+            for name, value in scope["headers"]:
+                if name == b"x-forwarded-for":
+                    return value.decode("latin-1").split(",", 1)[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    def _wallet(self, scope) -> Optional[str]:
+        if self.wallet_header:
+            for name, value in scope["headers"]:
+                if name == self.wallet_header:
+                    return value.decode("latin-1")
+        return None
+
+    def check(self, scope, name: str):
+        """Return None to admit the request, or the (start, body) messages rejecting it."""
+        buckets = self.buckets.get(name)
+        if buckets is not None:
+            now = time.monotonic()
+            wait = buckets.take(("ip", self.client_ip(scope)), now)
+            wallet = self._wallet(scope)
+            if not wait and wallet:
+                wait = buckets.take(("wallet", wallet), now)
+            if wait:
+                rate_limited.inc((name, "client"))
+                return _rejection(429, "Rate limit exceeded", wait)
+        if self.max_concurrency and self.in_flight >= self.max_concurrency:
+            rate_limited.inc((name, "overload"))
+            return _rejection(503, "Server is busy, please retry", 1)
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "clients": {name: len(buckets) for name, buckets in self.buckets.items()},
+            "evictions": sum(buckets.evictions for buckets in self.buckets.values()),
+        }
+
+class RateLimitMiddleware:
+    """ASGI middleware applying a RateLimiter before a request reaches routing."""
+
+    def __init__(self, app, limiter: RateLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        path = scope["path"]
+        name = route_class(scope["method"], path)
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        rejection = self.limiter.check(scope, name)
+        if rejection is not None:
+            await send(rejection[0])
+            await send(rejection[1])
+            return
+
+        if "/events/" in path:
+            await self.app(scope, receive, send)
+            return
+        self.limiter.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limiter.in_flight -= 1
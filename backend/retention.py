@@ -0,0 +1,317 @@
+"""
+Retention for agent_jobs.
+
+Finished jobs older than a policy's age are copied to agent_jobs_archive
+(in the main database or in a separate archive file) and deleted, a small
+batch per transaction so request handlers never wait long for the write
+lock. Afterwards the freed pages are returned to the filesystem with
+incremental vacuum.
+
+Demo quotas are counted in demo_usage, not derived from agent_jobs, so
+removing old demo jobs does not reset anyone's quota.
+
+Usage:
+    python retention.py [--dry-run]                  # apply the configured policies once
+    python retention.py --enable-incremental-vacuum  # one-off conversion of an existing database
+"""
+
+import argparse
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Optional, Tuple
+
+from config import settings
+from database import create_connection, rebuild_search_index
+from metrics import retention_batch_duration, retention_rows, retention_vacuumed_pages
+
+# Only jobs in a final state are ever removed
+TERMINAL_STATUSES = ("completed", "failed")
+
+ARCHIVE_TABLE = "agent_jobs_archive"
+
+class RetentionPolicy(NamedTuple):
+    name: str
+    statuses: Tuple[str, ...]
+    is_demo: bool
+    max_age_days: float
+
+def parse_policies(spec: str) -> List[RetentionPolicy]:
+    """
+    Parse ``selector=days`` pairs, e.g. ``demo=30,failed=90,completed=365``.
+
+    ``demo`` matches finished demo jobs; a status matches non-demo jobs in
+    that status. Selectors that are not listed are kept forever.
+    """
+    policies = []
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        selector, _, days = part.partition("=")
+        selector = selector.strip()
+        try:
+            max_age_days = float(days)
+        except ValueError:
+            raise ValueError(f"Invalid retention age in {part.strip()!r}")
+        if max_age_days <= 0:
+            raise ValueError(f"Retention age must be positive in {part.strip()!r}")
+        if selector == "demo":
+            policies.append(RetentionPolicy("demo", TERMINAL_STATUSES, True, max_age_days))
+        elif selector in TERMINAL_STATUSES:
+            policies.append(RetentionPolicy(selector, (selector,), False, max_age_days))
+        else:
+            raise ValueError(
+                f"Unknown retention selector {selector!r} (choose from demo, {', '.join(TERMINAL_STATUSES)})"
+            )
+    return policies
+
+def _ensure_archive(conn, schema: str) -> List[str]:
+    """Create the archive table if needed; return the job columns both tables share."""
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.{ARCHIVE_TABLE} (
+            id TEXT PRIMARY KEY,
+            agent_id TEXT NOT NULL,
+            user_wallet TEXT NOT NULL,
+            status TEXT,
+            input TEXT, -- JSON
+            output TEXT, -- JSON
+            error TEXT,
+            created_at TIMESTAMP,
+            completed_at TIMESTAMP,
+            is_demo BOOLEAN,
+            started_at TIMESTAMP,
+            worker_id TEXT,
+            archived_at TIMESTAMP NOT NULL
+        )
+    """)
+    conn.commit()
+    archived = {row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({ARCHIVE_TABLE})")}
+    return [row[1] for row in conn.execute("PRAGMA main.table_info(agent_jobs)") if row[1] in archived]
+
+class RetentionWorker:
+    """
+    Applies retention policies on a background thread every ``interval`` seconds.
+
+    The worker owns a dedicated connection (with the archive database attached
+    when one is configured), like the job engine's workers.
+    """
+
+    def __init__(self, policies: List[RetentionPolicy], interval: float, batch_size: int,
+                 batch_pause: float, archive: bool = True, archive_path: str = ""):
+        self.policies = policies
+        self.interval = interval
+        self.batch_size = max(1, batch_size)
+        self.batch_pause = batch_pause
+        self.archive = archive
+        self.archive_path = archive_path
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._warned_auto_vacuum = False
+        # Stats
+        self.running = False
+        self.runs = 0
+        self.last_run_started: Optional[float] = None
+        self.last_run_seconds: Optional[float] = None
+        self.run_rows = 0  # rows removed so far in the current (or last) run
+        self.total_rows = 0
+        self.vacuumed_pages = 0
+        self.errors = 0
+
+    def start(self):
+        if self._thread is not None or not self.policies:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="agenthub-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop after the current batch and join the thread."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self._thread is not None,
+            "policies": {p.name: p.max_age_days for p in self.policies},
+            "running": self.running,
+            "runs": self.runs,
+            "last_run_started": self.last_run_started,
+            "last_run_seconds": self.last_run_seconds,
+            "run_rows": self.run_rows,
+            "total_rows": self.total_rows,
+            "vacuumed_pages": self.vacuumed_pages,
+            "errors": self.errors,
+        }
+
+    def connect(self):
+        conn = create_connection()
+        if self.archive and self.archive_path:
+            conn.execute("ATTACH DATABASE ? AS archive", (self.archive_path,))
+            conn.execute("PRAGMA archive.journal_mode = WAL")
+        return conn
+
+    def _run(self):
+        conn = self.connect()
+        try:
+            while not self._stopping:
+                try:
+                    self.run_once(conn)
+                except sqlite3.Error as e:
+                    self.errors += 1
+                    print(f"Retention run failed: {e}")
+                with self._cond:
+                    if not self._stopping:
+                        self._cond.wait(self.interval)
+        finally:
+            conn.close()
+
+    def run_once(self, conn, now: Optional[datetime] = None) -> dict:
+        """Apply every policy until nothing is left to remove, then vacuum; return rows removed per policy."""
+        now = now or datetime.utcnow()
+        self.running = True
+        self.run_rows = 0
+        self.last_run_started = time.time()
+        started = time.perf_counter()
+        removed = {}
+        try:
+            schema = "archive" if self.archive_path else "main"
+            columns = _ensure_archive(conn, schema) if self.archive else None
+            for policy in self.policies:
+                cutoff = (now - timedelta(days=policy.max_age_days)).isoformat()
+                removed[policy.name] = 0
+                while not self._stopping:
+                    count = self._remove_batch(conn, policy, cutoff, schema, columns, now.isoformat())
+                    removed[policy.name] += count
+                    if count < self.batch_size:
+                        break
+                    time.sleep(self.batch_pause)
+            self._vacuum(conn)
+        finally:
+            self.running = False
+            self.runs += 1
+            self.last_run_seconds = round(time.perf_counter() - started, 3)
+        return removed
+
+    def _remove_batch(self, conn, policy: RetentionPolicy, cutoff: str, schema: str,
+                      columns: Optional[List[str]], archived_at: str) -> int:
+        started = time.perf_counter()
+        statuses = ", ".join("?" for _ in policy.statuses)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Oldest first, walking idx_jobs_created
+            rowids = [row[0] for row in conn.execute(f"""
+                SELECT rowid FROM agent_jobs
+                WHERE created_at < ? AND is_demo = ? AND status IN ({statuses})
+                ORDER BY created_at
+                LIMIT ?
+            """, (cutoff, policy.is_demo, *policy.statuses, self.batch_size))]
+            if not rowids:
+                conn.rollback()
+                return 0
+            batch = json.dumps(rowids)
+            if columns is not None:
+                # INSERT OR REPLACE: with a separate archive file the two commits are not
+                # atomic together, and a batch copied before a crash is simply copied again
+                column_list = ", ".join(columns)
+                conn.execute(f"""
+                    INSERT OR REPLACE INTO {schema}.{ARCHIVE_TABLE} ({column_list}, archived_at)
+                    SELECT {column_list}, ? FROM agent_jobs
+                    WHERE rowid IN (SELECT value FROM json_each(?))
+                """, (archived_at, batch))
+            conn.execute("DELETE FROM agent_jobs WHERE rowid IN (SELECT value FROM json_each(?))", (batch,))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        action = "archived" if columns is not None else "deleted"
+        retention_rows.inc((policy.name, action), len(rowids))
+        retention_batch_duration.observe(time.perf_counter() - started)
+        self.run_rows += len(rowids)
+        self.total_rows += len(rowids)
+        return len(rowids)
+
+    def _vacuum(self, conn):
+        """Release free pages a step at a time; a no-op unless auto_vacuum is INCREMENTAL."""
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            if not self._warned_auto_vacuum:
+                self._warned_auto_vacuum = True
+                print("auto_vacuum is not INCREMENTAL; freed pages are reused but the file will not shrink "
+                      "(run `python retention.py --enable-incremental-vacuum` once to convert)")
+            return
+        while not self._stopping:
+            free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if not free:
+                break
+            # executescript steps the pragma to completion; execute() would free a single page
+            conn.executescript(f"PRAGMA incremental_vacuum({int(settings.RETENTION_VACUUM_PAGES)})")
+            pages = free - conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if pages <= 0:
+                break
+            retention_vacuumed_pages.inc(amount=pages)
+            self.vacuumed_pages += pages
+            time.sleep(self.batch_pause)
+
+def enable_incremental_vacuum(conn):
+    """
+    Switch an existing database to auto_vacuum=INCREMENTAL.
+
+    This needs a full VACUUM, which rewrites the file and can renumber agent
+    rowids, so the search index is rebuilt afterwards.
+    """
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    rebuild_search_index(conn)
+    conn.commit()
+
+def count_eligible(conn, policies: List[RetentionPolicy], now: Optional[datetime] = None) -> dict:
+    """Rows each policy would remove right now."""
+    now = now or datetime.utcnow()
+    counts = {}
+    for policy in policies:
+        cutoff = (now - timedelta(days=policy.max_age_days)).isoformat()
+        statuses = ", ".join("?" for _ in policy.statuses)
+        counts[policy.name] = conn.execute(f"""
+            SELECT COUNT(*) FROM agent_jobs
+            WHERE created_at < ? AND is_demo = ? AND status IN ({statuses})
+        """, (cutoff, policy.is_demo, *policy.statuses)).fetchone()[0]
+    return counts
+
+retention_worker = RetentionWorker(
+    parse_policies(settings.RETENTION_POLICIES),
+    interval=settings.RETENTION_INTERVAL_SECONDS,
+    batch_size=settings.RETENTION_BATCH_SIZE,
+    batch_pause=settings.RETENTION_BATCH_PAUSE,
+    archive=settings.RETENTION_ARCHIVE,
+    archive_path=settings.RETENTION_ARCHIVE_PATH,
+)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="only count the jobs each policy would remove")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="convert the database to auto_vacuum=INCREMENTAL (runs a full VACUUM)")
+    args = parser.parse_args()
+
+    conn = retention_worker.connect()
+    try:
+        if args.enable_incremental_vacuum:
+            started = time.perf_counter()
+            enable_incremental_vacuum(conn)
+            print(f"Converted {settings.DATABASE_PATH} to incremental vacuum in {time.perf_counter() - started:.1f}s")
+        elif args.dry_run:
+            print(json.dumps(count_eligible(conn, retention_worker.policies), indent=2))
+        else:
+            removed = retention_worker.run_once(conn)
+            print(json.dumps({"removed": removed, **retention_worker.stats()}, indent=2))
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
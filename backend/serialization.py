@@ -0,0 +1,123 @@
+"""
+Fast JSON encoding of agents rows.
+
+Catalog reads used to turn every row into a dict, parse its JSON columns, build
+an AgentResponse and have FastAPI validate and encode it again. Rows coming
+out of our own database are already valid, so here each row is written
+straight to JSON text: scalar columns are encoded one by one and the JSON
+columns, normalized by SQLite's json() in the SELECT, are spliced in verbatim.
+"""
+
+import json
+from functools import lru_cache
+from typing import Callable, Iterable, Sequence, Tuple
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+# AgentResponse field order: AgentBase fields, then the server-assigned ones
+AGENT_RESPONSE_FIELDS = (
+    "name", "description", "short_description", "creator", "creator_wallet",
+    "price", "category", "tags", "avatar", "demo_limit", "input_schema", "crewai_config",
+    "id", "is_active", "is_approved", "created_at", "updated_at", "nft_token_id",
+)
+
+# JSON columns and the value served when the stored text is missing or invalid
+AGENT_JSON_DEFAULTS = {
+    "tags": "[]",
+    "input_schema": "{}",
+    "crewai_config": "{}",
+}
+# Compact projection for catalog grids
+AGENT_CARD_FIELDS = ("id", "name", "short_description", "price", "category", "avatar")
+
+AGENT_VIEWS = {
+    "full": AGENT_RESPONSE_FIELDS,
+    "card": AGENT_CARD_FIELDS,
+}
+
+AGENT_BOOL_FIELDS = frozenset({"is_active", "is_approved"})
+AGENT_INT_FIELDS = frozenset({"price", "demo_limit"})
+
+_encode_str = json.encoder.encode_basestring  # C implementation when available
+
+def dumps(content) -> bytes:
+    """Encode JSON-compatible content compactly, with orjson if it is installed."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(content)
+        except TypeError:
+            pass  # e.g. integers beyond 64 bits; let json report anything truly invalid
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+def agent_select_columns(fields: Sequence[str] = AGENT_RESPONSE_FIELDS, alias: str = "") -> str:
+    """
+    SELECT list for ``fields`` in the shape row_encoder() expects.
+
+    JSON columns are validated and minified by SQLite so they can be spliced
+    into the response without being parsed in Python.
+    """
+    prefix = f"{alias}." if alias else ""
+    columns = []
+    for field in fields:
+        default = AGENT_JSON_DEFAULTS.get(field)
+        if default is None:
+            columns.append(f"{prefix}{field}")
+        else:
+            column = f"{prefix}{field}"
+            columns.append(
+                f"CASE WHEN json_valid({column}) THEN json({column}) ELSE '{default}' END AS {field}"
+            )
+    return ", ".join(columns)
+
+def _encode_text(value) -> str:
+    return "null" if value is None else _encode_str(value)
+
+def _encode_int(value) -> str:
+    return "null" if value is None else str(int(value))
+
+def _encode_bool(value) -> str:
+    return "true" if value else "false"
+
+def _encode_raw(value) -> str:
+    return value
+
+@lru_cache(maxsize=64)
+def row_encoder(fields: Tuple[str, ...] = AGENT_RESPONSE_FIELDS) -> Callable[[Sequence], str]:
+    """
+    Return a function encoding a row selected with agent_select_columns(fields) as a JSON object.
+
+    Columns beyond ``fields`` (e.g. keyset columns for a cursor) are ignored.
+    """
+    encoders = []
+    for n, field in enumerate(fields):
+        if field in AGENT_JSON_DEFAULTS:
+            encode = _encode_raw
+        elif field in AGENT_BOOL_FIELDS:
+            encode = _encode_bool
+        elif field in AGENT_INT_FIELDS:
+            encode = _encode_int
+        else:
+            encode = _encode_text
+        encoders.append((("{" if n == 0 else ",") + _encode_str(field) + ":", encode))
+    encoders = tuple(encoders)
+
+    def encode_row(row: Sequence) -> str:
+        return "".join([
+            prefix + encode(value) for (prefix, encode), value in zip(encoders, row)
+        ]) + "}"
+
+    return encode_row
+
+def encode_agent(row, fields: Tuple[str, ...] = AGENT_RESPONSE_FIELDS) -> bytes:
+    """Encode a single agents row as a JSON object."""
+    return row_encoder(fields)(row).encode("utf-8")
+
+def encode_agents(rows: Iterable, fields: Tuple[str, ...] = AGENT_RESPONSE_FIELDS) -> bytes:
+    """Encode agents rows as a JSON array."""
+    encode_row = row_encoder(fields)
+    return ("[" + ",".join([encode_row(row) for row in rows]) + "]").encode("utf-8")
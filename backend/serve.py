@@ -0,0 +1,197 @@
+"""
+Production server for the AgentHub backend.
+
+Runs the database schema initialization once, under the schema file lock,
+then serves the app from several uvicorn worker processes sharing one
+listening socket. On POSIX the app is imported once in this process and
+the workers are forked from it, so a worker is accepting connections a few
+milliseconds after it starts instead of re-importing FastAPI and the app
+(about a second per worker). Crashed workers are replaced.
+
+SIGTERM or SIGINT drains the server: workers stop accepting connections,
+finish the requests in flight for up to --graceful-timeout seconds, stop
+their background workers and exit; any left after that are killed.
+
+Usage:
+    python serve.py [--workers N] [--host 0.0.0.0] [--port 8000] [--backlog 2048]
+                    [--keep-alive 75] [--graceful-timeout 30] [--access-log]
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import uvicorn
+
+from config import settings
+from database import init_database
+from metrics import worker_startup_seconds
+
+# A worker that dies sooner than this after starting is restarted only after a pause
+RESTART_BACKOFF_SECONDS = 1.0
+# Exit code of a worker whose app startup failed; restarting it would fail the same way
+STARTUP_FAILED = 3
+
+def build_config(args) -> uvicorn.Config:
+    return uvicorn.Config(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        backlog=args.backlog,
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        access_log=args.access_log,
+        log_level="info",
+    )
+
+class WorkerServer(uvicorn.Server):
+    """A uvicorn server that reports how long its process took to start accepting connections."""
+
+    def __init__(self, config: uvicorn.Config, started: float):
+        super().__init__(config)
+        self.process_started = started
+
+    async def startup(self, sockets=None):
+        await super().startup(sockets=sockets)
+        if not self.should_exit:
+            elapsed = time.perf_counter() - self.process_started
+            worker_startup_seconds.inc(amount=elapsed)
+            print(f"Worker {os.getpid()} ready in {elapsed * 1000:.1f} ms")
+
+def run_worker(config: uvicorn.Config, sock, started: float):
+    """Body of a forked worker process; never returns."""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    code = 0
+    try:
+        config.setup_event_loop()
+        server = WorkerServer(config, started)
+        asyncio.run(server.serve(sockets=[sock]))
+        if not server.started:
+            code = STARTUP_FAILED
+    except BaseException as e:
+        print(f"Worker {os.getpid()} failed: {e}")
+        code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
+
+class Supervisor:
+    """Forks the workers, replaces ones that die, and drains them all on SIGTERM/SIGINT."""
+
+    def __init__(self, config: uvicorn.Config, sock, workers: int, graceful_timeout: float):
+        self.config = config
+        self.sock = sock
+        self.workers = workers
+        # Workers also stop their job and retention threads after draining requests
+        self.shutdown_timeout = graceful_timeout + settings.JOB_POLL_INTERVAL + 10
+        self.children = {}  # pid -> start time
+        self.stopping = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            run_worker(self.config, self.sock, time.perf_counter())
+        self.children[pid] = time.monotonic()
+
+    def handle_signal(self, signum, frame):
+        if not self.stopping:
+            print(f"Received {signal.Signals(signum).name}, draining {len(self.children)} workers")
+            self.stopping = True
+        self._signal_children(signal.SIGTERM)
+
+    def _signal_children(self, signum: int):
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self.handle_signal)
+        signal.signal(signal.SIGINT, self.handle_signal)
+        for _ in range(self.workers):
+            self.spawn()
+
+        exit_code = 0
+        deadline = None
+        while self.children:
+            if self.stopping and deadline is None:
+                deadline = time.monotonic() + self.shutdown_timeout
+            if deadline is not None and time.monotonic() > deadline:
+                print(f"Killing {len(self.children)} workers that did not exit in time")
+                self._signal_children(signal.SIGKILL)
+                deadline = float("inf")
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                time.sleep(0.1)
+                continue
+            started = self.children.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if code == STARTUP_FAILED:
+                print(f"Worker {pid} failed to start, shutting down")
+                self.handle_signal(signal.SIGTERM, None)
+                exit_code = STARTUP_FAILED
+                continue
+            print(f"Worker {pid} exited with status {code}, restarting it")
+            if time.monotonic() - started < RESTART_BACKOFF_SECONDS:
+                time.sleep(RESTART_BACKOFF_SECONDS)
+            if not self.stopping:
+                self.spawn()
+        self.sock.close()
+        return exit_code
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the AgentHub API with multiple worker processes.")
+    parser.add_argument("--host", default=settings.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=settings.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=settings.SERVER_WORKERS,
+                        help="worker processes (default: one per CPU core)")
+    parser.add_argument("--backlog", type=int, default=settings.SERVER_BACKLOG,
+                        help="connections the kernel queues while workers are busy")
+    parser.add_argument("--keep-alive", type=int, default=settings.SERVER_KEEP_ALIVE_SECONDS,
+                        help="seconds an idle keep-alive connection is held open")
+    parser.add_argument("--graceful-timeout", type=int, default=settings.SERVER_GRACEFUL_TIMEOUT,
+                        help="seconds to finish requests in flight on shutdown")
+    parser.add_argument("--access-log", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+    if args.workers <= 0:
+        args.workers = os.cpu_count() or 1
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    started = time.perf_counter()
+    init_database()
+    # Workers (forked or spawned) must not run the DDL again
+    os.environ["INIT_DATABASE"] = "false"
+    settings.INIT_DATABASE = False
+    print(f"Schema ready in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    if not hasattr(os, "fork"):
+        # Windows: uvicorn spawns the workers, and each imports the app itself
+        uvicorn.run(
+            "main:app", host=args.host, port=args.port, workers=args.workers, backlog=args.backlog,
+            timeout_keep_alive=args.keep_alive, timeout_graceful_shutdown=args.graceful_timeout,
+            access_log=args.access_log,
+        )
+        return 0
+
+    config = build_config(args)
+    started = time.perf_counter()
+    config.load()  # imports main once; forked workers share it
+    print(f"App loaded in {(time.perf_counter() - started) * 1000:.1f} ms, starting {args.workers} workers")
+    sock = config.bind_socket()
+    return Supervisor(config, sock, args.workers, args.graceful_timeout).run()
+
+if __name__ == "__main__":
+    sys.exit(main())
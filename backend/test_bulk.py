@@ -0,0 +1,133 @@
+"""
+Tests for the bulk import endpoint and its streaming parsers.
+
+Bodies are sent in small chunks so records and numbers straddle chunk
+boundaries, and with a small chunk size so results span several
+transactions.
+"""
+
+import json
+
+import pytest
+
+from config import settings
+
+NDJSON = {"Content-Type": "application/x-ndjson"}
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(settings, "BULK_IMPORT_CHUNK_SIZE", 3)
+
+def agent(n, **fields):
+    return {
+        "name": f"Bulk agent {n}", "description": "Imported", "short_description": "Imported",
+        "creator": "Bulk", "creator_wallet": "addr_bulk", "price": 1000000 + n, "category": "bulk",
+        **fields,
+    }
+
+def in_pieces(body: bytes, size=7):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+def upload(client, body, headers=None):
+    response = client.post("/api/agents/bulk", content=in_pieces(body), headers=headers or {})
+    assert response.status_code == 200 and response.headers["content-type"] == "application/x-ndjson"
+    *results, summary = [json.loads(line) for line in response.text.splitlines()]
+    return results, summary["summary"]
+
+def assert_in_order(results):
+    assert [result["index"] for result in results] == list(range(len(results)))
+
+def test_json_array(client, db):
+    records = [agent(n) for n in range(7)]
+    results, summary = upload(client, json.dumps(records).encode())
+    assert summary == {"created": 7, "failed": 0}
+    assert_in_order(results)
+    for record, result in zip(records, results):
+        row = db.execute("SELECT name, price FROM agents WHERE id = ?", (result["id"],)).fetchone()
+        assert (row["name"], row["price"]) == (record["name"], record["price"])
+
+def test_malformed_ndjson_lines(client):
+    lines = [
+        json.dumps(agent(0)),
+        "{not json",
+        json.dumps(agent(2)),
+        "",  # blank lines are skipped, not counted
+        json.dumps({**agent(3), "price": -1}),
+        json.dumps(agent(4)),
+        json.dumps(agent(5)),
+        json.dumps(agent(6, name="")),
+        json.dumps(agent(7)),
+    ]
+    results, summary = upload(client, "\n".join(lines).encode(), NDJSON)
+    assert summary == {"created": 5, "failed": 3}
+    # Errors come out in input order, interleaved with the creates of their chunk
+    assert_in_order(results)
+    assert [result["status"] for result in results] == [
+        "created", "error", "created", "error", "created", "created", "error", "created",
+    ]
+    assert results[1]["error"].startswith("Invalid JSON")
+    assert results[3]["error"].startswith("price:")
+    assert results[6]["error"].startswith("name:")
+
+def test_mixed_array_and_ndjson(client):
+    # An array line in an NDJSON body is one record that is not an agent
+    body = "\n".join([json.dumps(agent(0)), json.dumps([agent(1), agent(2)]), json.dumps(agent(3))])
+    results, summary = upload(client, body.encode(), NDJSON)
+    assert [result["status"] for result in results] == ["created", "error", "created"]
+    assert summary == {"created": 2, "failed": 1}
+
+    # NDJSON sent as a JSON array body stops at the first line break
+    body = "\n".join(json.dumps(agent(n)) for n in range(3))
+    results, summary = upload(client, body.encode())
+    assert results == [{"index": 0, "status": "error", "error": "Expected a JSON array"}]
+    assert summary == {"created": 0, "failed": 1}
+
+    # Records before a malformed part of an array are kept, and reported first
+    body = ("[" + ",".join(json.dumps(agent(n)) for n in range(4)) + "\n" + json.dumps(agent(4)) + "]").encode()
+    results, summary = upload(client, body)
+    assert_in_order(results)
+    assert [result["status"] for result in results] == ["created"] * 4 + ["error"]
+    assert results[-1]["error"].startswith("Expected ',' or ']'")
+    assert summary == {"created": 4, "failed": 1}
+
+def test_oversized_record(client, monkeypatch):
+    monkeypatch.setattr(settings, "BULK_IMPORT_MAX_RECORD_BYTES", 1000)
+    too_large = {"status": "error", "error": "Record exceeds the maximum record size"}
+    # Records too large to keep are read past; the ones after them still go in
+    lines = [json.dumps(agent(0)), json.dumps(agent(1, description="x" * 5000)), json.dumps(agent(2))]
+    results, summary = upload(client, "\n".join(lines).encode(), NDJSON)
+    assert results == [
+        {"index": 0, "status": "created", "id": results[0]["id"]},
+        {"index": 1, **too_large},
+        {"index": 2, "status": "created", "id": results[2]["id"]},
+    ]
+    assert summary == {"created": 2, "failed": 1}
+    results, summary = upload(client, "\n".join(lines[:2]).encode(), NDJSON)
+    assert results[1] == {"index": 1, **too_large} and summary == {"created": 1, "failed": 1}
+
+    # Brackets and escaped quotes inside the skipped strings do not end the record early
+    nested = agent(1, description='"]}' * 2000, tags=[{"note": '\\"[' * 500}])
+    records = [agent(0), nested, "x" * 5000, agent(3)]
+    results, summary = upload(client, json.dumps(records).encode())
+    assert [result["status"] for result in results] == ["created", "error", "error", "created"]
+    assert results[1] == {"index": 1, **too_large} and results[2] == {"index": 2, **too_large}
+    assert summary == {"created": 2, "failed": 2}
+
+    # A malformed array is still fatal, even inside a record being skipped
+    results, summary = upload(client, json.dumps([agent(0), nested]).encode()[:-20])
+    assert [result["status"] for result in results] == ["created", "error"]
+    assert results[1]["error"] == "Unexpected end of JSON array"
+
+def test_duplicate_ids(client, db):
+    # Ids in the upload are ignored: every record gets an id of its own
+    records = [{**agent(n), "id": "same-id"} for n in range(4)]
+    results, summary = upload(client, json.dumps(records).encode())
+    assert summary == {"created": 4, "failed": 0}
+    ids = [result["id"] for result in results]
+    assert len(set(ids)) == 4 and "same-id" not in ids
+    assert db.execute("SELECT COUNT(*) FROM agents WHERE id = 'same-id'").fetchone()[0] == 0
+
+def test_empty_bodies(client):
+    assert upload(client, b"[]") == ([], {"created": 0, "failed": 0})
+    assert upload(client, b"\n\n", NDJSON) == ([], {"created": 0, "failed": 0})
@@ -0,0 +1,176 @@
+"""
+Tests for the response cache: validators and 304s, TTL expiry, the LRU
+bound, and invalidation after agents change, through this process's API or
+behind its back.
+
+Agents seeded with ``create_agent`` go straight into the database, like a
+write from another process; each test uses a category of its own so cached
+listings of other tests do not interfere.
+"""
+
+import json
+import time
+import types
+
+import pytest
+
+import cache
+from cache import ResponseCache, etag_matches, make_etag, response_cache
+import main
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    response_cache.clear()
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A monotonic clock for the cache module that only moves when told to."""
+    now = [1000.0]
+    monkeypatch.setattr(cache, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+@pytest.fixture
+def watcher(db):
+    """The app's change watcher, with the counter read before the test writes anything."""
+    main.catalog_watcher.check(db)
+    return main.catalog_watcher
+
+def new_agent(n, category, **fields):
+    return {
+        "name": f"Cached agent {n}", "description": "Cached", "short_description": "Cached",
+        "creator": "Cache", "creator_wallet": "addr_cache", "price": 1000000, "category": category, **fields,
+    }
+
+def listed_ids(client, category, filters=""):
+    return [agent["id"] for agent in client.get(f"/api/agents?category={category}&fields=id{filters}").json()]
+
+def test_lru_bound(clock):
+    lru = ResponseCache(max_entries=2, ttl_seconds=60)
+    lru.set(("agent", "a"), b"a")
+    lru.set(("agent", "b"), b"b")
+    assert lru.get(("agent", "a")).body == b"a"  # now the most recently used
+    lru.set(("agent", "c"), b"c")
+    assert lru.get(("agent", "b")) is None
+    assert [lru.get(("agent", key)).body for key in "ac"] == [b"a", b"c"]
+    assert lru.stats()["entries"] == 2 and lru.stats()["evictions"] == 1
+
+    disabled = ResponseCache(max_entries=0, ttl_seconds=60)
+    assert disabled.set(("agent", "a"), b"a").body == b"a" and disabled.get(("agent", "a")) is None
+
+def test_ttl_expiry(clock):
+    ttl = ResponseCache(max_entries=10, ttl_seconds=30)
+    ttl.set(("agent", "a"), b"a")
+    clock[0] += 29.9
+    assert ttl.get(("agent", "a")).body == b"a"
+    clock[0] += 0.1
+    assert ttl.get(("agent", "a")) is None
+    assert ttl.stats()["expirations"] == 1 and ttl.stats()["entries"] == 0
+
+def test_read_started_before_an_invalidation_is_not_stored(clock):
+    guarded = ResponseCache(max_entries=10, ttl_seconds=30)
+    guarded.set(("agent", "other"), b"other")
+    generation = guarded.generation
+    guarded.invalidate_namespace("agents")  # a write lands while the read is in flight
+    entry = guarded.set(("agent", "a"), b"old", generation=generation)
+    assert entry.body == b"old" and guarded.get(("agent", "a")) is None
+    # Only the invalidated namespace is dropped
+    assert guarded.get(("agent", "other")).body == b"other"
+
+def test_etag_matches():
+    etag = make_etag(b"body")
+    assert etag == make_etag(b"body") != make_etag(b"other")
+    assert etag_matches(etag, etag)
+    assert etag_matches(f"W/{etag}", etag)
+    assert etag_matches(f'"nope", {etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"nope"', etag)
+    assert not etag_matches(None, etag)
+
+def test_not_modified(client, create_agent):
+    url = f"/api/agents/{create_agent()}"
+    first = client.get(url)
+    etag = first.headers["etag"]
+    hits = response_cache.stats()["hits"]
+    assert etag.startswith('W/"')  # made weak by the compression middleware
+    for if_none_match in (etag, etag[2:], f'"other", {etag}'):
+        revalidated = client.get(url, headers={"If-None-Match": if_none_match})
+        assert revalidated.status_code == 304 and revalidated.content == b""
+        assert revalidated.headers["etag"] == etag
+    assert response_cache.stats()["hits"] == hits + 3
+    changed = client.get(url, headers={"If-None-Match": '"other"'})
+    assert changed.status_code == 200 and changed.content == first.content
+
+def test_api_writes_refresh_cached_reads(client):
+    # Agents created through the API await approval
+    category, pending = "cache-api", "&is_approved=false"
+    assert listed_ids(client, category, pending) == []
+    facets_url = f"/api/agents/facets?category={category}{pending}"
+    assert client.get(facets_url).json()["total"] == 0
+    search_url = f"/api/agents/search?q=Cached&category={category}&fields=id{pending}"
+    assert client.get(search_url).json() == []
+
+    created = client.post("/api/agents", json=new_agent(0, category)).json()["id"]
+    assert listed_ids(client, category, pending) == [created]
+    assert client.get(facets_url).json()["total"] == 1
+    assert [agent["id"] for agent in client.get(search_url).json()] == [created]
+
+    body = json.dumps([new_agent(n, category) for n in (1, 2)])
+    response = client.post("/api/agents/bulk", content=body)
+    imported = [json.loads(line)["id"] for line in response.text.splitlines()[:-1]]
+    assert sorted(listed_ids(client, category, pending)) == sorted([created, *imported])
+    assert client.get(facets_url).json()["total"] == 3
+    assert len(client.get(search_url).json()) == 3
+
+def test_writes_from_other_processes(client, db, create_agent, watcher):
+    category = "cache-elsewhere"
+    agent_id = create_agent(category=category, is_approved=0)
+    watcher.check(db)
+    url = f"/api/agents/{agent_id}"
+    assert listed_ids(client, category) == []
+    assert client.get(url).json()["is_approved"] is False
+
+    # Approved and renamed by something other than this API
+    db.execute("UPDATE agents SET is_approved = 1, name = 'Renamed' WHERE id = ?", (agent_id,))
+    db.commit()
+    assert listed_ids(client, category) == []  # still cached until the watcher notices
+    assert watcher.check(db)
+    assert listed_ids(client, category) == [agent_id]
+    agent = client.get(url).json()
+    assert agent["is_approved"] is True and agent["name"] == "Renamed"
+
+    db.execute("DELETE FROM agents WHERE id = ?", (agent_id,))
+    db.commit()
+    assert watcher.check(db)
+    assert listed_ids(client, category) == []
+    assert client.get(url).status_code == 404
+    assert not watcher.check(db)
+
+def test_watcher_thread(client, db, create_agent, watcher, monkeypatch):
+    category = "cache-watched"
+    assert listed_ids(client, category) == []
+    monkeypatch.setattr(watcher, "poll_interval", 0.02)
+    watcher.start()
+    try:
+        agent_id = create_agent(category=category)
+        deadline = time.monotonic() + 5
+        while listed_ids(client, category) != [agent_id] and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert listed_ids(client, category) == [agent_id]
+    finally:
+        watcher.stop(timeout=5)
+    assert watcher.stats()["running"] is False
+
+def test_demos_do_not_go_through_the_cache(client, db, create_agent):
+    agent_id = create_agent(demo_limit=3)
+    url = f"/api/agents/{agent_id}"
+    etag = client.get(url).headers["etag"]
+    demo = {"input": {}, "user_wallet": "addr_cache_user"}
+    counts = [client.post(f"{url}/demo", json=demo).json()["demo_count"] for _ in range(2)]
+    assert counts == [1, 2]
+    # Demo usage is not part of the agent, so the cached agent stays valid
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    # A lower limit set elsewhere applies to the next demo, whatever the cache holds
+    db.execute("UPDATE agents SET demo_limit = 2 WHERE id = ?", (agent_id,))
+    db.commit()
+    assert client.post(f"{url}/demo", json=demo).status_code == 429
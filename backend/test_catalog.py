@@ -0,0 +1,149 @@
+"""
+Tests for the in-memory catalog snapshot.
+
+Every listing served from the snapshot is compared with the same request
+answered from SQL. Runs the app in-process against a temporary database.
+"""
+
+import json
+import random
+import uuid
+
+import pytest
+
+from cache import response_cache
+from catalog import CatalogSnapshots, catalog_snapshots
+import main
+from migrations import CATALOG_CHANGE_LOG_MAX
+
+CATEGORIES = ["research", "writing", "finance", "testing"]
+TAGS = ["ai", "Data", "web", "nlp", "cardano", "defi"]
+
+@pytest.fixture(autouse=True, scope="module")
+def read_from_sql_afterwards():
+    yield
+    catalog_snapshots.snapshot = None  # other test modules read from SQL
+
+def seed(db, count, rng):
+    for n in range(count):
+        db.execute("""
+            INSERT INTO agents (
+                id, name, description, short_description, creator, creator_wallet, price, category,
+                tags, is_active, is_approved, demo_limit, created_at, updated_at, input_schema, crewai_config
+            ) VALUES (?, ?, 'desc', 'short', 'Test', 'addr_test', ?, ?, ?, ?, ?, 3, ?, ?, '{}', '{}')
+        """, (
+            str(uuid.UUID(int=rng.getrandbits(128))), f"Agent {n}", rng.randrange(1, 100) * 1000000,
+            rng.choice(CATEGORIES + [None]), json.dumps(rng.sample(TAGS, rng.randrange(0, 4))),
+            rng.random() < 0.9, rng.random() < 0.8,
+            # Few distinct timestamps, so ties are broken by id
+            f"2024-01-{rng.randrange(1, 10):02d}T00:00:00", "2024-01-01T00:00:00",
+        ))
+    db.commit()
+
+def from_sql(client, url):
+    # The seed writes bypass the API, so nothing invalidated listings cached by earlier requests
+    response_cache.clear()
+    saved, catalog_snapshots.snapshot = catalog_snapshots.snapshot, None
+    try:
+        return client.get(url)
+    finally:
+        catalog_snapshots.snapshot = saved
+
+def assert_same(client, url):
+    expected = from_sql(client, url)
+    actual = client.get(url)
+    assert actual.status_code == expected.status_code == 200, (url, actual.text)
+    assert actual.content == expected.content, url
+    assert actual.headers.get("x-next-cursor") == expected.headers.get("x-next-cursor"), url
+    return actual
+
+QUERIES = [
+    "/api/agents",
+    "/api/agents?limit=7&offset=3",
+    "/api/agents?category=research&limit=5",
+    "/api/agents?tags=ai&limit=20",
+    "/api/agents?tags=ai,DATA&tag_match=all",
+    "/api/agents?tags=web&tags=nlp&category=finance",
+    "/api/agents?view=card&limit=100",
+    "/api/agents?fields=price,id,tags",
+    "/api/agents?tags=unknown",
+    "/api/agents?category=none-such",
+]
+
+def walk(client, url):
+    """Follow X-Next-Cursor through every page, comparing each one."""
+    response = assert_same(client, url)
+    pages = 1
+    while response.headers.get("x-next-cursor"):
+        response = assert_same(client, f"{url}&cursor={response.headers['x-next-cursor']}")
+        pages += 1
+    return pages
+
+def test_snapshot_matches_sql(client, db):
+    seed(db, 400, random.Random(7))
+    assert catalog_snapshots.refresh(db) == "rebuilt"
+    for url in QUERIES:
+        assert_same(client, url)
+    assert walk(client, "/api/agents?limit=25") > 5
+    walk(client, "/api/agents?limit=9&category=writing&tags=ai,defi")
+
+def test_changes_are_patched(client, db):
+    catalog_snapshots.refresh(db)
+    before = catalog_snapshots.snapshot
+    before_ids = set(before.agents)
+    hidden = db.execute("SELECT id FROM agents WHERE is_active = 1 AND is_approved = 0 LIMIT 1").fetchone()["id"]
+    shown = next(iter(before_ids))
+    db.execute("UPDATE agents SET is_approved = 1 WHERE id = ?", (hidden,))
+    db.execute("UPDATE agents SET tags = '[\"brand-new\"]', category = 'moved' WHERE id = ?", (shown,))
+    db.execute("DELETE FROM agents WHERE id = (SELECT id FROM agents WHERE is_approved = 1 AND id != ? LIMIT 1)", (shown,))
+    db.commit()
+
+    assert catalog_snapshots.refresh(db) == "patched"
+    assert catalog_snapshots.refresh(db) == "unchanged"
+    after = catalog_snapshots.snapshot
+    assert hidden in after.agents and hidden not in before.agents
+    assert set(before.agents) == before_ids  # the old snapshot is untouched
+    for url in QUERIES + ["/api/agents?tags=brand-new", "/api/agents?category=moved"]:
+        assert_same(client, url)
+    assert client.get(f"/api/agents/{shown}").json()["category"] == "moved"
+
+def test_rebuild_when_changes_pile_up(db):
+    snapshots = CatalogSnapshots(poll_interval=1, patch_limit=3, change_log_size=3)
+    assert snapshots.refresh(db) == "rebuilt"
+    db.execute("UPDATE agents SET price = price + 1 WHERE rowid IN (SELECT rowid FROM agents LIMIT 10)")
+    db.commit()
+    assert snapshots.refresh(db) == "rebuilt"  # more changes than patch_limit
+    db.execute("UPDATE agents SET price = price + 1 WHERE rowid IN (SELECT rowid FROM agents LIMIT 2)")
+    db.commit()
+    snapshots._prune(db)
+    behind = CatalogSnapshots(poll_interval=1, patch_limit=100, change_log_size=100)
+    behind.snapshot = snapshots.snapshot
+    db.execute("DELETE FROM catalog_changes")  # pruned past its position by another process
+    db.execute("UPDATE agents SET price = price + 1 WHERE rowid = (SELECT min(rowid) FROM agents)")
+    db.commit()
+    assert behind.refresh(db) == "rebuilt"
+
+def test_reads_do_not_touch_database(client, db, monkeypatch):
+    catalog_snapshots.refresh(db)
+    agent_id = next(iter(catalog_snapshots.snapshot.agents))
+
+    async def no_database(*args, **kwargs):
+        raise AssertionError("catalog read went to the database")
+
+    monkeypatch.setattr(main, "run_db", no_database)
+    assert client.get("/api/agents?tags=ai&limit=3").status_code == 200
+    response = client.get(f"/api/agents/{agent_id}")
+    assert response.status_code == 200 and response.json()["id"] == agent_id
+    assert client.get(f"/api/agents/{agent_id}", headers={"If-None-Match": response.headers["etag"]}).status_code == 304
+
+def test_change_log_is_bounded_without_snapshot(db):
+    # Nothing prunes here: the log trims itself as entries are appended
+    db.execute(f"""
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < {CATALOG_CHANGE_LOG_MAX + 5000})
+        INSERT INTO catalog_changes (agent_id) SELECT 'agent-' || i FROM n
+    """)
+    db.commit()
+    newest = db.execute("SELECT max(seq) FROM catalog_changes").fetchone()[0]
+    count, oldest = db.execute("SELECT COUNT(*), min(seq) FROM catalog_changes").fetchone()
+    assert CATALOG_CHANGE_LOG_MAX <= count < CATALOG_CHANGE_LOG_MAX + 1000
+    assert oldest == newest - count + 1  # only the oldest entries went
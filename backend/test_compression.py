@@ -0,0 +1,145 @@
+"""
+Tests for response compression: the size threshold, Accept-Encoding
+negotiation, streamed bodies, skipped content types, Vary and ETags.
+
+The middleware is mostly exercised around stub ASGI apps; the ETag test
+goes through the app.
+"""
+
+import asyncio
+import gzip
+import zlib
+
+import httpx
+
+import compression
+from compression import CompressionMiddleware, negotiate_encoding
+
+def stub(body=b"", content_type=b"application/json", status=200, chunks=None, etag=None):
+    """An ASGI app sending ``body`` in one piece, or ``chunks`` one message each."""
+    async def app(scope, receive, send):
+        headers = [(b"content-type", content_type)]
+        if etag:
+            headers.append((b"etag", etag))
+        if chunks is None:
+            headers.append((b"content-length", str(len(body)).encode()))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        if chunks is None:
+            await send({"type": "http.response.body", "body": body})
+            return
+        for chunk in chunks:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    return app
+
+def fetch(app, accept_encoding="gzip", minimum_size=100):
+    """The response of ``app`` behind the middleware, with the body exactly as sent."""
+    async def run():
+        transport = httpx.ASGITransport(app=CompressionMiddleware(app, minimum_size=minimum_size))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            request = client.build_request("GET", "/")
+            if accept_encoding is None:
+                del request.headers["accept-encoding"]  # httpx sends one by default
+            else:
+                request.headers["accept-encoding"] = accept_encoding
+            response = await client.send(request, stream=True)
+            raw = b"".join([chunk async for chunk in response.aiter_raw()])
+            await response.aclose()
+            return response, raw
+    return asyncio.run(run())
+
+BIG = b'{"items":[' + b",".join(b'{"n":%d}' % n for n in range(200)) + b"]}"
+
+def test_threshold():
+    response, raw = fetch(stub(BIG))
+    assert response.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(raw) == BIG and int(response.headers["content-length"]) == len(raw) < len(BIG)
+
+    small = b'{"n":1}'
+    response, raw = fetch(stub(small))
+    assert "content-encoding" not in response.headers and raw == small
+    assert response.headers["content-length"] == str(len(small))
+    # Larger bodies of the same resource would be compressed, so caches must still key on the encoding
+    assert response.headers["vary"] == "Accept-Encoding"
+
+def test_accept_encoding_q_values():
+    assert negotiate_encoding("gzip") == "gzip"
+    assert negotiate_encoding("gzip;q=0") is None
+    assert negotiate_encoding("GZIP; q=0.5, identity") == "gzip"
+    assert negotiate_encoding("*;q=0.1") == "gzip"
+    assert negotiate_encoding("*, gzip;q=0") is None
+    assert negotiate_encoding("gzip;q=bogus") is None
+    assert negotiate_encoding("identity, deflate") is None
+    assert negotiate_encoding("") is None
+    if compression.brotli is None:
+        assert negotiate_encoding("br, gzip;q=0.5") == "gzip"
+    else:
+        assert negotiate_encoding("br, gzip;q=0.5") == "br"
+
+    for accept_encoding in (None, "gzip;q=0", "identity"):
+        response, raw = fetch(stub(BIG), accept_encoding)
+        assert "content-encoding" not in response.headers and raw == BIG
+        assert response.headers["vary"] == "Accept-Encoding"
+
+def test_streamed_bodies_are_compressed_chunk_by_chunk():
+    chunks = [b'{"n":%d}\n' % n for n in range(50)]
+    response, raw = fetch(stub(chunks=chunks, content_type=b"application/x-ndjson"))
+    assert response.headers["content-encoding"] == "gzip" and "content-length" not in response.headers
+    assert gzip.decompress(raw) == b"".join(chunks)
+
+    # Each chunk is flushed, so what has been sent so far decodes on its own
+    async def first_chunk():
+        app = CompressionMiddleware(stub(chunks=chunks, content_type=b"application/x-ndjson"), minimum_size=100)
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "GET", "path": "/", "headers": [(b"accept-encoding", b"gzip")]}
+        await app(scope, receive, send)
+        return sent[1]["body"]
+
+    assert zlib.decompressobj(31).decompress(asyncio.run(first_chunk())) == chunks[0]
+
+def test_skipped_content_types():
+    for content_type in (b"text/event-stream", b"image/png", b"application/octet-stream"):
+        response, raw = fetch(stub(BIG, content_type=content_type))
+        assert "content-encoding" not in response.headers and raw == BIG, content_type
+        assert "vary" not in response.headers, content_type
+    response, raw = fetch(stub(BIG, content_type=b"text/csv; charset=utf-8"))
+    assert response.headers["content-encoding"] == "gzip"
+
+def test_vary_is_merged():
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json"), (b"vary", b"Origin")]})
+        await send({"type": "http.response.body", "body": BIG})
+
+    for accept_encoding in ("gzip", None):
+        response, _ = fetch(app, accept_encoding)
+        assert response.headers["vary"] == "Origin, Accept-Encoding"
+
+def test_one_etag_per_resource():
+    for body in (BIG, b"{}"):
+        for accept_encoding in ("gzip", None):
+            response, _ = fetch(stub(body, etag=b'"abc"'), accept_encoding)
+            assert response.headers["etag"] == 'W/"abc"'
+    response, raw = fetch(stub(status=304, content_type=b"", etag=b'"abc"'))
+    assert response.status_code == 304 and raw == b""
+    assert response.headers["etag"] == 'W/"abc"' and response.headers["vary"] == "Accept-Encoding"
+
+def test_revalidation_through_the_app(client, create_agent):
+    agent_id = create_agent(description="x" * 5000)
+    url = f"/api/agents/{agent_id}"
+    response = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    etag = response.headers["etag"]
+    assert etag.startswith('W/"')
+    for accept_encoding in ("gzip", "identity"):
+        revalidated = client.get(url, headers={"Accept-Encoding": accept_encoding, "If-None-Match": etag})
+        assert revalidated.status_code == 304
+        assert revalidated.headers["etag"] == etag and revalidated.headers["vary"] == "Accept-Encoding"
+    assert client.get(url, headers={"Accept-Encoding": "identity"}).headers["etag"] == etag
@@ -0,0 +1,61 @@
+"""
+Concurrency test for demo quota enforcement.
+
+Runs the app in-process against a temporary database and fires many demo
+requests for the same agent and wallet at once; exactly ``demo_limit`` of them
+must succeed.
+"""
+
+import asyncio
+
+import httpx
+
+async def fire_demos(app, agent_id, wallet, count):
+    """Send ``count`` demo requests concurrently and return their status codes."""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        responses = await asyncio.gather(*(
+            client.post(
+                f"/api/agents/{agent_id}/demo",
+                json={"input": {"n": n}, "user_wallet": wallet},
+            )
+            for n in range(count)
+        ))
+    return [response.status_code for response in responses]
+
+def count_demo_jobs(db, agent_id, wallet):
+    return db.execute(
+        "SELECT COUNT(*) FROM agent_jobs WHERE agent_id = ? AND user_wallet = ? AND is_demo = 1",
+        (agent_id, wallet),
+    ).fetchone()[0]
+
+def test_parallel_demos_respect_limit(app, db, create_agent):
+    """Many simultaneous demos from one wallet never exceed demo_limit."""
+    demo_limit = 5
+    agent_id = create_agent(demo_limit=demo_limit)
+    wallet = "addr_test_parallel"
+
+    statuses = asyncio.run(fire_demos(app, agent_id, wallet, 60))
+
+    assert statuses.count(200) == demo_limit, statuses
+    assert statuses.count(429) == 60 - demo_limit, statuses
+    assert count_demo_jobs(db, agent_id, wallet) == demo_limit
+
+def test_limit_is_per_wallet(app, create_agent):
+    """One wallet exhausting its quota does not affect another wallet."""
+    agent_id = create_agent(demo_limit=2)
+
+    first = asyncio.run(fire_demos(app, agent_id, "addr_test_a", 10))
+    second = asyncio.run(fire_demos(app, agent_id, "addr_test_b", 10))
+
+    assert first.count(200) == 2
+    assert second.count(200) == 2
+
+def test_zero_limit_rejects_all(app, db, create_agent):
+    """An agent with demo_limit 0 allows no demos for identified wallets."""
+    agent_id = create_agent(demo_limit=0)
+
+    statuses = asyncio.run(fire_demos(app, agent_id, "addr_test_zero", 5))
+
+    assert statuses == [429] * 5
+    assert count_demo_jobs(db, agent_id, "addr_test_zero") == 0
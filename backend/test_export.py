@@ -0,0 +1,63 @@
+"""
+Tests for the NDJSON and CSV exports: stored payloads that cannot be
+decoded, and encoding off the event loop.
+"""
+
+import csv
+import io
+import json
+import threading
+import uuid
+import zlib
+
+import pytest
+
+from compression import PAYLOAD_MARKER, pack_json
+import export
+
+@pytest.fixture
+def jobs(db, create_agent):
+    """An agent with one job per kind of stored input, in created_at order."""
+    agent_id = create_agent()
+    inputs = [
+        pack_json({"n": 0}),
+        PAYLOAD_MARKER + zlib.compress(json.dumps({"n": 1}).encode()),
+        PAYLOAD_MARKER + b"not zlib at all",
+        "{not json",
+        b"\xff\xfe",
+        pack_json({"n": 5}),
+    ]
+    for n, stored in enumerate(inputs):
+        db.execute("""
+            INSERT INTO agent_jobs (id, agent_id, user_wallet, status, input, created_at)
+            VALUES (?, ?, 'addr_export', 'completed', ?, ?)
+        """, (str(uuid.uuid4()), agent_id, stored, f"2024-03-01T00:00:0{n}"))
+    db.commit()
+    return agent_id
+
+def export_jobs(client, agent_id, export_format):
+    response = client.get(f"/api/export/jobs?agent_id={agent_id}&format={export_format}")
+    assert response.status_code == 200
+    return response.text
+
+def test_undecodable_payloads_do_not_cut_the_export_short(client, jobs):
+    records = [json.loads(line) for line in export_jobs(client, jobs, "ndjson").splitlines()]
+    ordered = sorted(records, key=lambda record: record["created_at"])
+    # Corrupt compressed data and undecodable bytes become null, invalid JSON its raw text
+    assert [record["input"] for record in ordered] == [{"n": 0}, {"n": 1}, None, "{not json", None, {"n": 5}]
+
+    rows = list(csv.DictReader(io.StringIO(export_jobs(client, jobs, "csv"))))
+    cells = [row["input"] for row in sorted(rows, key=lambda row: row["created_at"])]
+    assert cells == ['{"n": 0}', '{"n": 1}', "", "{not json", "", '{"n": 5}']
+
+def test_rows_are_encoded_on_the_database_executor(client, jobs, monkeypatch):
+    threads = []
+    real_ndjson_chunk = export._ndjson_chunk
+
+    def ndjson_chunk(*args, **kwargs):
+        threads.append(threading.current_thread().name)
+        return real_ndjson_chunk(*args, **kwargs)
+
+    monkeypatch.setattr(export, "_ndjson_chunk", ndjson_chunk)
+    assert len(export_jobs(client, jobs, "ndjson").splitlines()) == 6
+    assert threads and all(name.startswith("agenthub-db") for name in threads), threads
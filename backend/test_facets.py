@@ -0,0 +1,151 @@
+"""
+Tests for facet counts.
+
+Facets are compared with counts worked out in Python from the agents table,
+before and after changes that the catalog_facets triggers have to follow.
+Runs the app in-process against a temporary database.
+"""
+
+import itertools
+import json
+import random
+import uuid
+from collections import Counter
+
+from cache import response_cache
+import database
+from facets import agent_facets
+from migrations import PRICE_BUCKETS
+
+CATEGORIES = ["research", "writing", "finance", "testing"]
+# Mixed case, padding and duplicates are normalized as agent_tags does
+TAGS = ["ai", "AI", " data ", "web", "nlp", "cardano", "defi"]
+
+def random_tags(rng):
+    if rng.random() < 0.05:
+        return "not json"
+    return json.dumps(rng.sample(TAGS, rng.randrange(0, 4)))
+
+def seed(db, count, rng):
+    for n in range(count):
+        db.execute("""
+            INSERT INTO agents (
+                id, name, description, creator, creator_wallet, price, category, tags, is_active, is_approved
+            ) VALUES (?, ?, 'desc', 'Test', 'addr_test', ?, ?, ?, ?, ?)
+        """, (
+            str(uuid.UUID(int=rng.getrandbits(128))), f"Agent {n}",
+            rng.choice([0, 500000, 1000000, 1999999, 7000000, 150000000, 20000000000, rng.randrange(1, 10**10)]),
+            rng.choice(CATEGORIES + [None]), random_tags(rng), rng.random() < 0.9, rng.random() < 0.8,
+        ))
+    db.commit()
+
+def agent_tags(raw):
+    try:
+        values = json.loads(raw)
+    except ValueError:
+        return set()
+    return {value.strip().lower() for value in values if isinstance(value, str) and value.strip()}
+
+def bucket(price):
+    return max(edge for edge in PRICE_BUCKETS if price >= edge)
+
+def expected(db, category=None, tags=(), tag_match="any", is_active=True, is_approved=True):
+    """The facets, counted agent by agent."""
+    rows = db.execute("SELECT category, price, tags FROM agents WHERE is_active = ? AND is_approved = ?",
+                      (is_active, is_approved)).fetchall()
+    agents = [(row["category"], row["price"], agent_tags(row["tags"])) for row in rows]
+
+    def has_tags(tags_of_agent, wanted):
+        if not wanted:
+            return True
+        return wanted <= tags_of_agent if tag_match == "all" else bool(wanted & tags_of_agent)
+
+    wanted = set(tags)
+    tagged = [agent for agent in agents if has_tags(agent[2], wanted)]
+    matched = [agent for agent in tagged if not category or agent[0] == category]
+    tag_scope = [agent for agent in agents if not category or agent[0] == category]
+    if tag_match == "all":
+        tag_scope = [agent for agent in tag_scope if has_tags(agent[2], wanted)]
+    prices = Counter(bucket(agent[1]) for agent in matched)
+    return {
+        "total": len(matched),
+        "categories": dict(Counter(agent[0] for agent in tagged if agent[0])),
+        "tags": dict(Counter(tag for agent in tag_scope for tag in agent[2])),
+        "price": [prices.get(edge, 0) for edge in PRICE_BUCKETS],
+    }
+
+def actual(client, url):
+    response_cache.clear()
+    response = client.get(url)
+    assert response.status_code == 200, (url, response.text)
+    facets = response.json()
+    return {
+        "total": facets["total"],
+        "categories": {item["value"]: item["count"] for item in facets["categories"]},
+        "tags": {item["value"]: item["count"] for item in facets["tags"]},
+        "price": [item["count"] for item in facets["price"]],
+    }
+
+def combinations():
+    for category, tags, tag_match, is_approved in itertools.product(
+        [None, "finance", "none-such"], [(), ("ai",), ("data", "web"), ("unknown",)], ["any", "all"], [True, False],
+    ):
+        if tag_match == "all" and not tags:
+            continue
+        query = [f"is_approved={str(is_approved).lower()}", "tag_limit=1000"]
+        if category:
+            query.append(f"category={category}")
+        query.extend(f"tags={tag}" for tag in tags)
+        query.append(f"tag_match={tag_match}")
+        yield f"/api/agents/facets?{'&'.join(query)}", dict(
+            category=category, tags=tags, tag_match=tag_match, is_approved=is_approved,
+        )
+
+def assert_all_combinations(client, db):
+    for url, filters in combinations():
+        assert actual(client, url) == expected(db, **filters), url
+
+def test_facets_match_counts(client, db):
+    seed(db, 500, random.Random(11))
+    assert_all_combinations(client, db)
+    facets = client.get("/api/agents/facets?tag_limit=2").json()
+    assert len(facets["tags"]) == 2 and facets["tags"][0]["count"] >= facets["tags"][1]["count"]
+    assert facets["price"][0] == {"min": 0, "max": PRICE_BUCKETS[1], "count": facets["price"][0]["count"]}
+    assert facets["price"][-1]["max"] is None
+    assert client.get("/api/agents/facets?tag_match=some").status_code == 400
+
+def test_counts_follow_changes(client, db):
+    ids = [row["id"] for row in db.execute("SELECT id FROM agents ORDER BY rowid LIMIT 40")]
+    db.execute("UPDATE agents SET is_approved = NOT is_approved WHERE id IN (?, ?, ?)", ids[:3])
+    db.execute("UPDATE agents SET tags = '[\"AI\", \"ai\", \"brand-new\"]' WHERE id = ?", (ids[3],))
+    db.execute("UPDATE agents SET category = 'moved', price = price * 3 WHERE id IN (?, ?)", ids[4:6])
+    db.execute("UPDATE agents SET category = NULL WHERE id = ?", (ids[6],))
+    db.execute("UPDATE agents SET name = 'renamed' WHERE id = ?", (ids[7],))
+    db.execute("DELETE FROM agents WHERE id IN (?, ?)", ids[8:10])
+    db.commit()
+    assert_all_combinations(client, db)
+    assert actual(client, "/api/agents/facets?tag_limit=1000")["tags"]["brand-new"] == expected(db)["tags"]["brand-new"]
+    assert actual(client, "/api/agents/facets?category=moved") == expected(db, category="moved")
+
+    # A rebuild from scratch gives the counts the triggers kept
+    kept = db.execute("SELECT * FROM catalog_facets ORDER BY tag, category, bucket").fetchall()
+    database.rebuild_catalog_facets(db)
+    assert db.execute("SELECT * FROM catalog_facets ORDER BY tag, category, bucket").fetchall() == kept
+    assert all(row["count"] > 0 for row in kept)
+
+def test_public_facets_do_not_read_agents():
+    conn = database.create_connection()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    agent_facets(conn)
+    agent_facets(conn, category="finance", tags=["ai"])
+    assert statements and all("catalog_facets" in sql and "agents" not in sql.replace("catalog_facets", "")
+                              for sql in statements), statements
+
+    # Several tags are counted over the matching agents, found through agent_tags
+    statements.clear()
+    agent_facets(conn, tags=["ai", "web"])
+    conn.set_trace_callback(None)
+    plans = [row[3] for sql in statements if "agent_tags" in sql for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+    assert plans and not any(detail.startswith("SCAN agents") for detail in plans), plans
+    conn.close()
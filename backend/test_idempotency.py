@@ -0,0 +1,91 @@
+"""
+Tests for Idempotency-Key handling on agent creation and demos.
+
+Runs the app in-process against a temporary database.
+"""
+
+import asyncio
+import uuid
+
+import httpx
+
+def agent_payload(name):
+    return {
+        "name": name,
+        "description": "Idempotency test agent",
+        "short_description": "Idempotency",
+        "creator": "Test",
+        "creator_wallet": "addr_test",
+        "price": 1000000,
+        "category": "testing",
+    }
+
+def count(db, sql, *params):
+    return db.execute(sql, params).fetchone()[0]
+
+def test_create_agent_replays_first_response(client, db):
+    key = str(uuid.uuid4())
+    name = f"Idempotent {key[:8]}"
+    first = client.post("/api/agents", json=agent_payload(name), headers={"Idempotency-Key": key})
+    retry = client.post("/api/agents", json=agent_payload(name), headers={"Idempotency-Key": key})
+    assert first.status_code == 200 and retry.status_code == 200, (first.text, retry.text)
+    assert retry.json() == first.json()
+    assert retry.headers.get("idempotent-replayed") == "true"
+    assert "idempotent-replayed" not in first.headers
+    assert count(db, "SELECT COUNT(*) FROM agents WHERE name = ?", name) == 1
+
+def test_key_reused_for_different_request(client, db):
+    key = str(uuid.uuid4())
+    assert client.post("/api/agents", json=agent_payload("First body"), headers={"Idempotency-Key": key}).status_code == 200
+    response = client.post("/api/agents", json=agent_payload("Second body"), headers={"Idempotency-Key": key})
+    assert response.status_code == 422, response.text
+    assert count(db, "SELECT COUNT(*) FROM agents WHERE name = 'Second body'") == 0
+
+def test_without_key_every_request_creates(client, db):
+    name = f"No key {uuid.uuid4().hex[:8]}"
+    for _ in range(2):
+        assert client.post("/api/agents", json=agent_payload(name)).status_code == 200
+    assert count(db, "SELECT COUNT(*) FROM agents WHERE name = ?", name) == 2
+
+def test_demo_retry_does_not_use_quota(client, db, create_agent):
+    agent_id = create_agent(demo_limit=2)
+    body = {"input": {"topic": "retry"}, "user_wallet": "addr_retry"}
+    key = str(uuid.uuid4())
+    first = client.post(f"/api/agents/{agent_id}/demo", json=body, headers={"Idempotency-Key": key})
+    for _ in range(3):
+        retry = client.post(f"/api/agents/{agent_id}/demo", json=body, headers={"Idempotency-Key": key})
+        assert retry.json() == first.json()
+    assert first.json()["demo_count"] == 1
+    # The quota still has one demo left for a new request
+    other = client.post(f"/api/agents/{agent_id}/demo", json=body, headers={"Idempotency-Key": str(uuid.uuid4())})
+    assert other.status_code == 200 and other.json()["demo_count"] == 2
+    assert count(db, "SELECT COUNT(*) FROM agent_jobs WHERE agent_id = ?", agent_id) == 2
+
+def test_error_responses_are_replayed(client, create_agent):
+    agent_id = create_agent(demo_limit=0)
+    body = {"input": {}, "user_wallet": "addr_limited"}
+    key = str(uuid.uuid4())
+    first = client.post(f"/api/agents/{agent_id}/demo", json=body, headers={"Idempotency-Key": key})
+    retry = client.post(f"/api/agents/{agent_id}/demo", json=body, headers={"Idempotency-Key": key})
+    assert first.status_code == retry.status_code == 429
+    assert retry.json() == first.json()
+    assert retry.headers.get("idempotent-replayed") == "true"
+
+def test_concurrent_retries_run_once(app, db, create_agent):
+    agent_id = create_agent(demo_limit=10)
+    body = {"input": {"topic": "storm"}, "user_wallet": "addr_storm"}
+    key = str(uuid.uuid4())
+
+    async def storm():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            return await asyncio.gather(*(
+                http.post(f"/api/agents/{agent_id}/demo", json=body, headers={"Idempotency-Key": key})
+                for _ in range(20)
+            ))
+
+    responses = asyncio.run(storm())
+    assert all(response.status_code == 200 for response in responses), [r.status_code for r in responses]
+    assert len({response.json()["job_id"] for response in responses}) == 1
+    assert count(db, "SELECT COUNT(*) FROM agent_jobs WHERE agent_id = ?", agent_id) == 1
+    assert count(db, "SELECT count FROM demo_usage WHERE agent_id = ?", agent_id) == 1
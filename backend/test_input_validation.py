@@ -0,0 +1,88 @@
+"""
+Tests for validating demo and job input against an agent's input_schema.
+
+Runs the app in-process against a temporary database.
+"""
+
+import uuid
+
+import pytest
+
+from validation import SchemaError, compile_schema
+
+INPUT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "message": {"type": "string", "minLength": 1},
+        "priority": {"type": "number", "minimum": 1, "maximum": 10},
+        "urgent": {"type": "boolean"},
+        "channels": {"type": "array", "items": {"enum": ["email", "sms"]}},
+    },
+    "required": ["message"],
+}
+
+def count_jobs(db, agent_id):
+    return db.execute("SELECT COUNT(*) FROM agent_jobs WHERE agent_id = ?", (agent_id,)).fetchone()[0]
+
+def test_compiled_schema():
+    """The compiled check accepts matching values and names the first failing path."""
+    check = compile_schema(INPUT_SCHEMA)
+    assert check({"message": "hi", "priority": 3, "channels": ["sms"]}, "input") is None
+    assert check({"priority": 3}, "input") == "input.message is required"
+    assert check({"message": "hi", "priority": 11}, "input") == "input.priority must be at most 10"
+    assert check({"message": "hi", "urgent": 1}, "input") == "input.urgent must be boolean"
+    assert "input.channels[1]" in check({"message": "hi", "channels": ["sms", "fax"]}, "input")
+    assert compile_schema({}) is None
+
+def test_invalid_schema_rejected_on_create(client):
+    """Agents cannot be created with a schema the compiler cannot interpret."""
+    with pytest.raises(SchemaError):
+        compile_schema({"type": "text"})
+    response = client.post("/api/agents", json={
+        "name": "Bad Schema", "description": "d", "short_description": "s",
+        "creator": "Test", "creator_wallet": "addr_test", "price": 0, "category": "testing",
+        "input_schema": {"type": "object", "properties": {"n": {"minimum": "one"}}},
+    })
+    assert response.status_code == 422, response.text
+
+def test_demo_rejects_invalid_input_before_writing(client, db, create_agent):
+    """A demo with invalid input gets a 422 and neither a job nor a demo slot is used."""
+    agent_id = create_agent(input_schema=INPUT_SCHEMA)
+    wallet = f"addr_{uuid.uuid4().hex[:8]}"
+
+    response = client.post(f"/api/agents/{agent_id}/demo", json={"input": {"priority": 5}, "user_wallet": wallet})
+    assert response.status_code == 422, response.text
+    assert "input.message is required" in response.text
+    assert count_jobs(db, agent_id) == 0
+
+    response = client.post(f"/api/agents/{agent_id}/demo", json={"input": {"message": "hi"}, "user_wallet": wallet})
+    assert response.status_code == 200, response.text
+    assert response.json()["demo_count"] == 1
+
+def test_start_rejects_invalid_input(client, db, create_agent):
+    """Queuing a job with invalid input gets a 422 and nothing is queued."""
+    agent_id = create_agent(input_schema=INPUT_SCHEMA)
+
+    response = client.post(f"/api/agents/{agent_id}/start", json={
+        "input": {"message": "hi", "priority": 0}, "user_wallet": "addr_test_start",
+    })
+    assert response.status_code == 422, response.text
+    assert count_jobs(db, agent_id) == 0
+
+    response = client.post(f"/api/agents/{agent_id}/start", json={
+        "input": {"message": "hi", "priority": 1}, "user_wallet": "addr_test_start",
+    })
+    assert response.status_code == 202, response.text
+
+def test_updated_schema_takes_effect(client, db, create_agent):
+    """Changing input_schema (and updated_at) replaces the cached validator."""
+    agent_id = create_agent(input_schema={"type": "object", "required": ["a"]})
+    demo = {"input": {"b": 1}}
+    assert client.post(f"/api/agents/{agent_id}/demo", json=demo).status_code == 422
+
+    db.execute(
+        "UPDATE agents SET input_schema = ?, updated_at = ? WHERE id = ?",
+        ('{"type": "object", "required": ["b"]}', "2099-01-01T00:00:00", agent_id),
+    )
+    db.commit()
+    assert client.post(f"/api/agents/{agent_id}/demo", json=demo).status_code == 200
@@ -0,0 +1,84 @@
+"""
+Tests for the job event stream (Server-Sent Events).
+
+No job workers run in the tests, so the job engine's events are published
+by hand, and a job finished "in another process" is finished in SQL.
+"""
+
+import json
+from datetime import datetime
+
+import pytest
+
+from compression import pack_json
+from config import settings
+from events import job_events
+from jobs import JOB_COMPLETED, JOB_RUNNING, enqueue_job
+
+@pytest.fixture(autouse=True)
+def quick_heartbeats(monkeypatch):
+    monkeypatch.setattr(settings, "SSE_HEARTBEAT_SECONDS", 0.05)
+
+@pytest.fixture
+def job(db, create_agent):
+    agent_id = create_agent()
+    return agent_id, enqueue_job(db, agent_id, "addr_test", {"prompt": "hi"})["job_id"]
+
+def events(client, agent_id, job_id, **headers):
+    """The stream's events as (id, event, data) until it ends."""
+    response = client.get(f"/api/agents/{agent_id}/events/{job_id}", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    parsed = []
+    for block in response.text.split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if "event" in fields:
+            parsed.append((fields.get("id"), fields["event"], json.loads(fields["data"])))
+    return parsed
+
+def finish_in_database(db, job_id, output):
+    db.execute(
+        "UPDATE agent_jobs SET status = ?, output = ?, completed_at = ? WHERE id = ?",
+        (JOB_COMPLETED, pack_json(output), datetime.utcnow().isoformat(), job_id),
+    )
+    db.commit()
+
+def run_here(job_id, output):
+    """Publish what this process's job engine would while running the job."""
+    job_events.publish(job_id, "status", {"job_id": job_id, "status": JOB_RUNNING})
+    job_events.publish(job_id, "progress", {"job_id": job_id, "output": {"step": 1}})
+    job_events.publish(job_id, "status", {"job_id": job_id, "status": JOB_COMPLETED, "output": output},
+                       final=True)
+
+def test_stream_ends_with_final_event(client, job):
+    agent_id, job_id = job
+    run_here(job_id, {"answer": 42})
+    received = events(client, agent_id, job_id)
+    assert [(event_id, event) for event_id, event, _ in received] == [
+        ("1", "status"), ("2", "status"), ("3", "progress"), ("4", "status"),
+    ]
+    assert received[-1][2] == {"job_id": job_id, "status": JOB_COMPLETED, "output": {"answer": 42}}
+
+def test_resume_after_last_event_id(client, job):
+    agent_id, job_id = job
+    run_here(job_id, {"answer": 42})
+    assert [event_id for event_id, _, _ in events(client, agent_id, job_id, **{"Last-Event-ID": "2"})] == ["3", "4"]
+    resumed = client.get(f"/api/agents/{agent_id}/events/{job_id}?last_event_id=3")
+    assert resumed.text.count("event: ") == 1 and "id: 4" in resumed.text
+    assert client.get(f"/api/agents/{agent_id}/events/{job_id}", headers={"Last-Event-ID": "x"}).status_code == 400
+
+def test_job_finished_in_another_process(client, db, job):
+    # This process only published 'queued'; another worker claimed the job and finished it
+    agent_id, job_id = job
+    finish_in_database(db, job_id, {"answer": "elsewhere"})
+    received = events(client, agent_id, job_id)
+    assert [(event_id, data["status"]) for event_id, _, data in received] == [("1", "queued"), (None, JOB_COMPLETED)]
+    assert received[-1][2]["output"] == {"answer": "elsewhere"}
+
+    # A client resuming after the 'queued' event gets the outcome from the database too
+    received = events(client, agent_id, job_id, **{"Last-Event-ID": "1"})
+    assert [(event_id, data["status"]) for event_id, _, data in received] == [(None, JOB_COMPLETED)]
+
+def test_unknown_job(client, job):
+    agent_id, _ = job
+    assert client.get(f"/api/agents/{agent_id}/events/no-such-job").status_code == 404
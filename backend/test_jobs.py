@@ -0,0 +1,234 @@
+"""
+Tests for the background job engine: claiming, the per-agent cap, heartbeats
+and requeueing abandoned jobs.
+
+Each test runs against a new temporary database.
+"""
+
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from compression import unpack_json
+from conftest import insert_agent
+import database
+from events import job_events
+import jobs
+from jobs import JOB_COMPLETED, JOB_FAILED, JobEngine, claim_next_job, enqueue_job, heartbeat_jobs, requeue_stale_jobs
+
+@pytest.fixture
+def conn(scratch_database, request):
+    scratch_database(request.node.name)
+    database.init_database()
+    conn = database.create_connection()
+    yield conn
+    conn.close()
+
+def ago(seconds):
+    return (datetime.utcnow() - timedelta(seconds=seconds)).isoformat()
+
+def job_row(conn, job_id):
+    return conn.execute("SELECT * FROM agent_jobs WHERE id = ?", (job_id,)).fetchone()
+
+def test_each_job_is_claimed_once(conn):
+    agents = [insert_agent(conn) for _ in range(5)]
+    job_ids = {enqueue_job(conn, agents[n % 5], "addr_test", {"n": n})["job_id"] for n in range(60)}
+    claimed = []
+    errors = []
+
+    def worker(worker_id):
+        own = database.create_connection()
+        try:
+            # A cap above the job count, so only the claim's atomicity stops double runs
+            while (row := claim_next_job(own, worker_id, 100)) is not None:
+                claimed.append((row["id"], worker_id))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            own.close()
+
+    threads = [threading.Thread(target=worker, args=(f"worker-{n}",)) for n in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert sorted(job_id for job_id, _ in claimed) == sorted(job_ids)
+    for job_id, worker_id in claimed:
+        row = job_row(conn, job_id)
+        assert row["status"] == "running" and row["worker_id"] == worker_id
+        assert row["heartbeat_at"] == row["started_at"]
+
+def test_per_agent_cap(conn):
+    busy, other = insert_agent(conn), insert_agent(conn)
+    for n in range(3):
+        enqueue_job(conn, busy, "addr_test", {"n": n})
+    enqueue_job(conn, other, "addr_test", {})
+    claims = []
+    while (row := claim_next_job(conn, "worker-1", 2)) is not None:
+        claims.append(row["agent_id"])
+    # The third job for the busy agent waits although it was queued before the other agent's
+    assert claims == [busy, busy, other]
+    assert conn.execute("SELECT COUNT(*) FROM agent_jobs WHERE status = 'queued'").fetchone()[0] == 1
+
+    conn.execute("UPDATE agent_jobs SET status = 'completed' WHERE agent_id = ? AND status = 'running' "
+                  "AND rowid = (SELECT min(rowid) FROM agent_jobs WHERE agent_id = ?)", (busy, busy))
+    conn.commit()
+    assert claim_next_job(conn, "worker-1", 2)["agent_id"] == busy
+
+def test_only_jobs_without_heartbeat_are_requeued(conn):
+    agent_id = insert_agent(conn)
+    alive, dead, legacy = (enqueue_job(conn, agent_id, "addr_test", {})["job_id"] for _ in range(3))
+    for _ in range(3):
+        claim_next_job(conn, "worker-alive", 10)
+    # All started long ago; the other two were claimed by a worker that has died since
+    conn.execute("UPDATE agent_jobs SET started_at = ?, heartbeat_at = ?", (ago(3600), ago(3600)))
+    conn.execute("UPDATE agent_jobs SET worker_id = 'worker-dead' WHERE id IN (?, ?)", (dead, legacy))
+    conn.execute("UPDATE agent_jobs SET heartbeat_at = NULL WHERE id = ?", (legacy,))  # claimed before heartbeats
+    conn.commit()
+    # A pair whose worker no longer holds the job does not keep it alive
+    assert heartbeat_jobs(conn, [(alive, "worker-alive"), (dead, "worker-alive")]) == 1
+
+    assert requeue_stale_jobs(conn, 60) == 2
+    assert job_row(conn, alive)["status"] == "running"
+    for job_id in (dead, legacy):  # a job claimed before heartbeats existed goes by its start time
+        row = job_row(conn, job_id)
+        assert row["status"] == "queued" and row["worker_id"] is None and row["heartbeat_at"] is None
+
+def test_engine_runs_jobs_and_keeps_them_alive(conn):
+    agent_id = insert_agent(conn)
+    release = threading.Event()
+
+    def executor(agent, job_input, progress):
+        release.wait(5)
+        return {"echo": job_input}
+
+    engine = JobEngine(1, 1, poll_interval=0.02, executor=executor, heartbeat_interval=0.02, stale_seconds=0)
+    job_id = enqueue_job(conn, agent_id, "addr_test", {"n": 1})["job_id"]
+    engine.start()
+    try:
+        deadline = time.monotonic() + 5
+        while not engine.owns(job_id) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        first_beat = job_row(conn, job_id)["heartbeat_at"]
+        time.sleep(0.2)
+        # Far longer than stale_seconds was asked for, but the heartbeat keeps the job
+        row = job_row(conn, job_id)
+        assert row["status"] == "running" and row["heartbeat_at"] > first_beat
+        assert engine.stale_seconds == pytest.approx(0.06)
+        release.set()
+        while job_row(conn, job_id)["status"] == "running" and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        release.set()
+        engine.stop(timeout=5)
+    row = job_row(conn, job_id)
+    assert row["status"] == JOB_COMPLETED and row["completed_at"]
+    assert engine.stats()["completed"] == 1 and engine.stats()["requeued"] == 0
+
+def test_result_is_published_only_once_recorded(conn):
+    agent_id = insert_agent(conn)
+    engine = JobEngine(0, 1, poll_interval=1)
+    job_id = enqueue_job(conn, agent_id, "addr_test", {})["job_id"]
+    claim_next_job(conn, "worker-1", 1)
+
+    def history():
+        return job_events._channels[job_id].history
+
+    # Requeued and claimed by another worker meanwhile: the late result is dropped
+    requeue_stale_jobs(conn, -1)
+    claim_next_job(conn, "worker-2", 1)
+    assert not engine._finish(conn, job_id, "worker-1", JOB_COMPLETED, output={"late": True})
+    assert job_row(conn, job_id)["status"] == "running" and not history()[-1].final
+
+    assert engine._finish(conn, job_id, "worker-2", JOB_COMPLETED, output={"ok": True})
+    assert job_row(conn, job_id)["status"] == JOB_COMPLETED and history()[-1].final
+
+class LockedConnection:
+    """Stands in for a connection whose writes keep failing."""
+
+    def execute(self, *args):
+        raise sqlite3.OperationalError("database is locked")
+
+    def rollback(self):
+        pass
+
+def test_result_is_not_published_when_it_cannot_be_recorded(conn, monkeypatch):
+    agent_id = insert_agent(conn)
+    job_id = enqueue_job(conn, agent_id, "addr_test", {})["job_id"]
+    claim_next_job(conn, "worker-1", 1)
+    monkeypatch.setattr(jobs.time, "sleep", lambda seconds: None)
+    assert not JobEngine(0, 1, poll_interval=1)._finish(LockedConnection(), job_id, "worker-1", JOB_COMPLETED, output={})
+    assert not any(job_event.final for job_event in job_events._channels[job_id].history)
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def test_output_that_cannot_be_stored_fails_the_job(conn):
+    agent_id = insert_agent(conn)
+
+    def executor(agent, job_input, progress):
+        return {"x": {1, 2}} if job_input["n"] == 0 else {"ok": True}
+
+    engine = JobEngine(1, 1, poll_interval=0.02, executor=executor, heartbeat_interval=0.02, stale_seconds=0)
+    bad, good = (enqueue_job(conn, agent_id, "addr_test", {"n": n})["job_id"] for n in range(2))
+    engine.start()
+    try:
+        # The worker survives the first job and goes on to the next
+        assert wait_for(lambda: job_row(conn, good)["status"] == JOB_COMPLETED)
+    finally:
+        engine.stop(timeout=5)
+    row = job_row(conn, bad)
+    assert row["status"] == JOB_FAILED and "not JSON-serializable" in row["error"]
+    assert job_events._channels[bad].history[-1].final
+    assert engine.stats()["completed"] == 1 and engine.stats()["failed"] == 1
+
+def test_job_whose_result_was_lost_is_requeued(conn, monkeypatch):
+    agent_id = insert_agent(conn)
+    runs = []
+    engine = JobEngine(1, 1, poll_interval=0.02, heartbeat_interval=0.02, stale_seconds=0,
+                       executor=lambda agent, job_input, progress: runs.append(1) or {"run": len(runs)})
+    real_finish = engine._finish
+
+    def finish(conn, *args, **kwargs):
+        # The first result cannot be written at all
+        return real_finish(LockedConnection() if len(runs) == 1 else conn, *args, **kwargs)
+
+    monkeypatch.setattr(jobs.time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(engine, "_finish", finish)
+    job_id = enqueue_job(conn, agent_id, "addr_test", {})["job_id"]
+    engine.start()
+    try:
+        assert wait_for(lambda: job_row(conn, job_id)["status"] == JOB_COMPLETED)
+    finally:
+        engine.stop(timeout=5)
+    assert len(runs) == 2 and unpack_json(job_row(conn, job_id)["output"]) == {"run": 2}
+    assert engine.stats()["requeued"] == 1
+
+def test_worker_survives_an_unexpected_error(conn, monkeypatch):
+    agent_id = insert_agent(conn)
+    engine = JobEngine(1, 1, poll_interval=0.02, heartbeat_interval=0.02, stale_seconds=0)
+    real_run_job = engine._run_job
+    failures = []
+
+    def run_job(conn, job, worker_id):
+        if not failures:
+            failures.append(job["id"])
+            raise RuntimeError("boom")
+        real_run_job(conn, job, worker_id)
+
+    monkeypatch.setattr(engine, "_run_job", run_job)
+    job_ids = [enqueue_job(conn, agent_id, "addr_test", {"n": n})["job_id"] for n in range(2)]
+    engine.start()
+    try:
+        # The job it was running when it failed is requeued and run again
+        assert wait_for(lambda: all(job_row(conn, job_id)["status"] == JOB_COMPLETED for job_id in job_ids))
+    finally:
+        engine.stop(timeout=5)
+    assert failures == job_ids[:1] and engine.stats()["requeued"] == 1
@@ -0,0 +1,118 @@
+"""
+Tests for versioned schema migrations.
+
+Each test runs against a new temporary database.
+"""
+
+import sqlite3
+import uuid
+
+import pytest
+
+import database
+import migrations
+from migrations import LATEST_VERSION, migrate, plan, schema_version
+
+def legacy_database(path, demo_jobs):
+    """A database as the pre-versioning init_database left it: user_version 0, demo_usage filled."""
+    conn = sqlite3.connect(path)
+    for migration in migrations.MIGRATIONS[:5]:
+        migration.apply(conn)
+    conn.commit()
+    insert_demo_jobs(conn, demo_jobs)
+    migrations._demo_usage(conn)
+    conn.execute("""
+        INSERT INTO demo_usage (agent_id, user_wallet, count)
+        SELECT agent_id, user_wallet, COUNT(*) FROM agent_jobs WHERE is_demo = 1 GROUP BY agent_id, user_wallet
+    """)
+    conn.commit()
+    conn.close()
+
+def insert_demo_jobs(conn, count, wallets=3):
+    for n in range(count):
+        conn.execute(
+            "INSERT INTO agent_jobs (id, agent_id, user_wallet, status, is_demo) VALUES (?, 'agent-1', ?, 'completed', 1)",
+            (str(uuid.uuid4()), f"addr_{n % wallets}"),
+        )
+    conn.commit()
+
+def demo_counts(conn):
+    return dict(conn.execute("SELECT user_wallet, count FROM demo_usage"))
+
+def test_new_database_then_noop(scratch_database):
+    scratch_database("fresh")
+    database.init_database()
+    conn = database.create_connection()
+    assert schema_version(conn) == LATEST_VERSION
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2  # INCREMENTAL
+    statements = []
+    conn.set_trace_callback(statements.append)
+    assert migrate(conn) == []
+    assert statements == ["PRAGMA user_version"], statements
+    conn.close()
+
+def test_legacy_database_is_adopted(scratch_database):
+    path = scratch_database("legacy")
+    legacy_database(path, demo_jobs=9)
+    conn = database.create_connection()
+    assert schema_version(conn) == 0
+    steps = plan(conn)
+    assert [step["version"] for step in steps] == list(range(1, LATEST_VERSION + 1))
+    assert all(step["backfill"] is None for step in steps)  # the tables are already filled
+    database.init_database()
+    assert schema_version(conn) == LATEST_VERSION
+    # The existing counters are kept, not counted a second time
+    assert demo_counts(conn) == {"addr_0": 3, "addr_1": 3, "addr_2": 3}
+    conn.close()
+
+def test_interrupted_backfill_resumes(scratch_database, monkeypatch):
+    scratch_database("resume")
+    conn = database.create_connection()
+    migrate(conn, batch_size=1000)
+    # Roll back to before demo_usage existed, with demos recorded in the meantime
+    conn.execute("DROP TABLE demo_usage")
+    conn.execute("PRAGMA user_version = 5")
+    insert_demo_jobs(conn, 25)
+
+    step = next(s for s in plan(conn) if s["version"] == 6)
+    assert step["backfill"] == "demo_usage" and step["estimated_rows"] == 25
+
+    batches = []
+
+    def interrupt(seconds):
+        batches.append(seconds)
+        if len(batches) == 2:
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(migrations.time, "sleep", interrupt)
+    with pytest.raises(KeyboardInterrupt):
+        migrate(conn, batch_size=5, pause=0.01)
+    monkeypatch.undo()
+    assert schema_version(conn) == 5
+    step = next(s for s in plan(conn) if s["version"] == 6)
+    assert step["estimated_rows"] == 15  # two batches of five are done
+
+    # A demo recorded by the app meanwhile is counted by the app, not by the backfill
+    insert_demo_jobs(conn, 1, wallets=1)
+    conn.execute("UPDATE demo_usage SET count = count + 1 WHERE user_wallet = 'addr_0'")
+    conn.commit()
+
+    assert migrate(conn, batch_size=5, pause=0) == list(range(6, LATEST_VERSION + 1))
+    assert schema_version(conn) == LATEST_VERSION
+    assert demo_counts(conn) == {"addr_0": 10, "addr_1": 8, "addr_2": 8}
+    assert conn.execute("SELECT COUNT(*) FROM schema_backfill_progress").fetchone()[0] == 0
+    conn.close()
+
+def test_dry_run_changes_nothing(scratch_database):
+    path = scratch_database("dry-run")
+    conn = sqlite3.connect(path)
+    migrations._core_tables(conn)
+    conn.commit()
+    insert_demo_jobs(conn, 4)
+    steps = plan(conn)
+    assert schema_version(conn) == 0
+    by_version = {step["version"]: step for step in steps}
+    assert by_version[1]["estimated_rows"] == 4  # the agent_jobs index builds
+    assert by_version[6]["backfill"] == "demo_usage" and by_version[6]["estimated_rows"] == 4
+    assert not migrations._table_exists(conn, "demo_usage")
+    conn.close()
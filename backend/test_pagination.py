@@ -0,0 +1,138 @@
+"""
+Tests for keyset pagination of GET /api/agents (the X-Next-Cursor header).
+
+Pages are walked to the end and compared with the whole listing in SQL
+order. The seeded agents share a handful of timestamps, so most positions
+are decided by the id tie-breaker.
+"""
+
+import base64
+import json
+import random
+import uuid
+
+import pytest
+
+from cache import response_cache
+import database
+import main
+
+CATEGORY = "paging"
+
+@pytest.fixture(autouse=True)
+def fresh_listings():
+    # Agents are seeded straight into the database, which does not invalidate cached pages
+    response_cache.clear()
+
+@pytest.fixture(scope="module")
+def seeded(app):
+    conn = database.create_connection()
+    rng = random.Random(3)
+    for n in range(120):
+        conn.execute("""
+            INSERT INTO agents (id, name, description, creator, creator_wallet, price, category, tags,
+                                is_active, is_approved, created_at)
+            VALUES (?, ?, 'desc', 'Test', 'addr_test', 1000000, ?, ?, 1, ?, ?)
+        """, (
+            str(uuid.UUID(int=rng.getrandbits(128))), f"Paging agent {n}",
+            CATEGORY if n % 3 else "paging-other", json.dumps(["paging-tag"] if n % 2 else []),
+            n % 10 != 0, f"2024-02-0{rng.randrange(1, 4)}T00:00:00",
+        ))
+    conn.commit()
+    conn.close()
+
+def expected_ids(db, category=None, tag=None):
+    query = "SELECT id FROM agents WHERE is_active = 1 AND is_approved = 1"
+    params = []
+    if category:
+        query += " AND category = ?"
+        params.append(category)
+    if tag:
+        query += " AND id IN (SELECT agent_id FROM agent_tags WHERE tag = ?)"
+        params.append(tag)
+    return [row["id"] for row in db.execute(query + " ORDER BY created_at DESC, id DESC", params)]
+
+def walk(client, url):
+    """Ids of every page reached by following X-Next-Cursor, and the number of pages."""
+    ids, pages, cursor = [], 0, None
+    while True:
+        response = client.get(url + (f"&cursor={cursor}" if cursor else ""))
+        assert response.status_code == 200, response.text
+        page = [agent["id"] for agent in response.json()]
+        ids.extend(page)
+        pages += 1
+        cursor = response.headers.get("x-next-cursor")
+        if cursor is None:
+            return ids, pages
+
+@pytest.mark.parametrize("filters, category, tag", [
+    ("", None, None),
+    (f"&category={CATEGORY}", CATEGORY, None),
+    ("&tags=paging-tag", None, "paging-tag"),
+    (f"&category={CATEGORY}&tags=paging-tag", CATEGORY, "paging-tag"),
+])
+def test_pages_cover_the_listing_once(client, db, seeded, filters, category, tag):
+    expected = expected_ids(db, category, tag)
+    for limit in (1, 7, 50):
+        ids, pages = walk(client, f"/api/agents?limit={limit}&fields=id{filters}")
+        assert len(ids) == len(set(ids)), "duplicate agents across pages"
+        assert ids == expected, "pages skipped or reordered agents"
+        # A full last page still carries a cursor, which leads to an empty page
+        assert pages == len(expected) // limit + 1
+
+def test_category_pages_use_the_listing_index(client, seeded, monkeypatch):
+    statements = []
+    real_run_db = main.run_db
+
+    async def traced(fn, *args, **kwargs):
+        def run(conn, *args, **kwargs):
+            conn.set_trace_callback(statements.append)
+            try:
+                return fn(conn, *args, **kwargs)
+            finally:
+                conn.set_trace_callback(None)
+        return await real_run_db(run, *args, **kwargs)
+
+    monkeypatch.setattr(main, "run_db", traced)
+    first = client.get(f"/api/agents?limit=5&category={CATEGORY}")
+    client.get(f"/api/agents?limit=5&category={CATEGORY}&cursor={first.headers['x-next-cursor']}")
+    monkeypatch.undo()
+
+    conn = database.create_connection()
+    plans = [[row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")] for sql in statements]
+    conn.close()
+    assert len(plans) == 2
+    for plan in plans:
+        # A seek into the index in listing order: no scan of agents, no sort
+        assert any("idx_agents_category_listing" in detail for detail in plan), plan
+        assert not any("TEMP B-TREE" in detail for detail in plan), plan
+
+def encode(value) -> str:
+    raw = value if isinstance(value, bytes) else json.dumps(value).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+@pytest.mark.parametrize("cursor", [
+    "not-a-cursor!",
+    "%%%",
+    encode(b"\xff\xfe"),
+    encode(b"[1, 2"),
+    encode(5),
+    encode({"created_at": "2024-01-01", "id": "x"}),
+    encode(["2024-01-01T00:00:00"]),
+    encode(["2024-01-01T00:00:00", "x", "y"]),
+    encode([20240101, "x"]),
+    encode(["yesterday", "x"]),
+])
+def test_invalid_cursor_is_rejected(client, cursor):
+    response = client.get(f"/api/agents?cursor={cursor}")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+def test_tampered_cursor_is_rejected(client, seeded):
+    cursor = client.get("/api/agents?limit=2").headers["x-next-cursor"]
+    for tampered in (cursor[:-3], cursor[1:], "A" + cursor, cursor + "A"):
+        assert client.get(f"/api/agents?cursor={tampered}").status_code == 400, tampered
+
+def test_cursor_and_offset_are_exclusive(client, seeded):
+    cursor = client.get("/api/agents?limit=2").headers["x-next-cursor"]
+    assert client.get(f"/api/agents?cursor={cursor}&offset=2").status_code == 400
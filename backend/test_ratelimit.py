@@ -0,0 +1,172 @@
+"""
+Tests for the per-client rate limiter and the concurrency cap.
+
+The middleware is mostly exercised around a stub ASGI app, so no database
+is involved; the app itself runs without limits in the other test modules.
+"""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from ratelimit import RateLimiter, RateLimitMiddleware, TokenBuckets, parse_limits, route_class
+
+class StubApp:
+    """Counts the requests that get through; optionally holds them until released."""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = None
+
+    async def __call__(self, scope, receive, send):
+        self.calls += 1
+        if self.release is not None:
+            await self.release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+def client_for(app, client=("10.0.0.1", 1234)):
+    transport = httpx.ASGITransport(app=app, client=client)
+    return httpx.AsyncClient(transport=transport, base_url="http://test")
+
+def test_parse_limits_and_classes():
+    assert parse_limits("read=50/100, demo=0.5/3") == {"read": (50.0, 100.0), "demo": (0.5, 3.0)}
+    for spec in ("read=0/5", "read=fast", "demo=1/0.5"):
+        with pytest.raises(ValueError):
+            parse_limits(spec)
+    assert route_class("GET", "/api/agents") == "read"
+    assert route_class("POST", "/api/agents") == "write"
+    assert route_class("POST", "/api/agents/abc/demo") == "demo"
+    assert route_class("POST", "/api/agents/abc/start") == "job"
+    assert route_class("GET", "/api/export/jobs") == "export"
+    assert route_class("GET", "/metrics") is None
+
+def test_token_bucket_refills():
+    buckets = TokenBuckets(rate=2.0, burst=3, capacity=16)
+    assert [buckets.take("a", 0.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert abs(buckets.take("a", 0.0) - 0.5) < 1e-9  # next token in half a second
+    assert buckets.take("a", 0.5) == 0.0
+    assert buckets.take("b", 0.5) == 0.0  # other clients have their own bucket
+
+def test_burst_is_the_most_a_bucket_holds():
+    buckets = TokenBuckets(rate=1.0, burst=2, capacity=16)
+    assert buckets.take("a", 0.0) == 0.0
+    # A long idle spell refills to the burst, not beyond it
+    assert [buckets.take("a", 1000.0) for _ in range(2)] == [0.0, 0.0]
+    assert buckets.take("a", 1000.0) == 1.0
+    # Rejected requests spend nothing: the wait only shrinks as time passes
+    assert buckets.take("a", 1000.25) == 0.75
+
+def test_idle_clients_are_evicted():
+    buckets = TokenBuckets(rate=1.0, burst=2, capacity=4)
+    for n in range(4):
+        buckets.take(n, 0.0)
+    buckets.take(0, 9.0)  # still active at t=10
+    # Client 1 has refilled by t=10, so a new client takes its slot instead of a busy one's
+    assert buckets.take("new", 10.0) == 0.0
+    assert len(buckets) == 4 and buckets.evictions == 1
+    assert 1 not in buckets._slots and 0 in buckets._slots
+    # With every slot busy, a newcomer still gets in by replacing the least recently seen
+    for key in (0, 2, 3, "new"):
+        buckets.take(key, 10.5)
+    buckets.take(2, 10.6)
+    buckets.take(3, 10.7)
+    buckets.take("new", 10.8)
+    assert buckets.take("late", 11.0) == 0.0
+    assert len(buckets) == 4 and buckets.evictions == 2
+    assert 0 not in buckets._slots
+
+def test_new_clients_in_a_full_table_are_cheap():
+    buckets = TokenBuckets(rate=1.0, burst=10, capacity=65536)
+    for n in range(65536):
+        buckets.take(("ip", n), 0.0)
+    # Every client is active, so each newcomer replaces one after a bounded scan
+    started = time.perf_counter()
+    for n in range(10000):
+        assert buckets.take(("new", n), 1.0) == 0.0
+    elapsed = time.perf_counter() - started
+    assert len(buckets) == 65536 and buckets.evictions == 10000
+    assert elapsed < 1.0, elapsed  # a full scan per newcomer took over a minute
+
+def test_rejections_never_reach_the_app():
+    app = StubApp()
+    limiter = RateLimiter({"demo": (1.0, 2)})
+    middleware = RateLimitMiddleware(app, limiter)
+
+    async def run():
+        async with client_for(middleware) as client:
+            statuses = [(await client.post("/api/agents/x/demo")).status_code for _ in range(5)]
+            rejected = await client.post("/api/agents/x/demo")
+            other = await client.post("/api/agents/x/demo", headers={"X-Forwarded-For": "10.9.9.9"})
+        async with client_for(middleware, ("10.0.0.2", 1)) as client:
+            second_client = await client.post("/api/agents/x/demo")
+        return statuses, rejected, other, second_client
+
+    statuses, rejected, other, second_client = asyncio.run(run())
+    assert statuses == [200, 200, 429, 429, 429], statuses
+    assert rejected.headers["retry-after"] == "1"
+    assert rejected.json() == {"detail": "Rate limit exceeded"}
+    assert other.status_code == 429  # X-Forwarded-For is ignored unless trusted
+    assert second_client.status_code == 200
+    assert app.calls == 3
+
+def test_wallet_header_has_its_own_bucket():
+    app = StubApp()
+    limiter = RateLimiter({"job": (1.0, 2)}, wallet_header="X-Wallet-Address")
+    middleware = RateLimitMiddleware(app, limiter)
+
+    async def run():
+        statuses = []
+        for n in range(3):
+            async with client_for(middleware, (f"10.0.1.{n}", 1)) as client:
+                response = await client.post("/api/agents/x/start", headers={"X-Wallet-Address": "addr_1"})
+                statuses.append(response.status_code)
+        return statuses
+
+    # Different IPs, same wallet: the wallet's bucket runs out
+    assert asyncio.run(run()) == [200, 200, 429]
+
+def test_concurrency_cap_sheds_load():
+    app = StubApp()
+    limiter = RateLimiter({}, max_concurrency=2)
+    middleware = RateLimitMiddleware(app, limiter)
+
+    async def run():
+        app.release = asyncio.Event()
+        async with client_for(middleware) as client:
+            held = [asyncio.ensure_future(client.get("/api/agents")) for _ in range(2)]
+            while limiter.in_flight < 2:
+                await asyncio.sleep(0)
+            shed = await client.get("/api/agents")
+            app.release.set()
+            done = await asyncio.gather(*held)
+            after = await client.get("/api/agents")
+        return shed, done, after
+
+    shed, done, after = asyncio.run(run())
+    assert shed.status_code == 503 and shed.headers["retry-after"] == "1"
+    assert [response.status_code for response in done] == [200, 200]
+    assert after.status_code == 200
+    assert limiter.in_flight == 0
+
+def test_retry_after_rounds_up():
+    limiter = RateLimiter({"write": (0.25, 1)})
+    middleware = RateLimitMiddleware(StubApp(), limiter)
+
+    async def run():
+        async with client_for(middleware) as client:
+            return [await client.post("/api/agents") for _ in range(2)]
+
+    allowed, rejected = asyncio.run(run())
+    assert allowed.status_code == 200
+    assert rejected.status_code == 429 and rejected.headers["retry-after"] == "4"  # one token per 4 s
+
+def test_limits_on_the_app(app):
+    limited = TestClient(RateLimitMiddleware(app, RateLimiter({"read": (0.5, 2)})))
+    assert [limited.get("/api/agents?limit=1").status_code for _ in range(3)] == [200, 200, 429]
+    assert limited.get("/api/agents?limit=1").headers["retry-after"] == "2"
+    assert limited.get("/").status_code == 200  # the health check is exempt
+    assert limited.post("/api/agents", json={}).status_code != 429  # writes have their own bucket
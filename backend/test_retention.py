@@ -0,0 +1,118 @@
+"""
+Tests for job retention: archiving, deleting and vacuuming old agent_jobs.
+
+Each test runs against a new temporary database.
+"""
+
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+import database
+from retention import RetentionWorker, count_eligible, parse_policies
+
+NOW = datetime(2025, 6, 1)
+POLICIES = "demo=7,failed=30,completed=90"
+
+@pytest.fixture
+def fresh_database(scratch_database):
+    """Create an empty schema in a new file, named by the test, and point the settings at it."""
+    def create(name):
+        path = scratch_database(name)
+        database.init_database()
+        return path
+    return create
+
+def insert_job(conn, status, is_demo, age_days):
+    job_id = str(uuid.uuid4())
+    created = (NOW - timedelta(days=age_days)).isoformat()
+    conn.execute("""
+        INSERT INTO agent_jobs (id, agent_id, user_wallet, status, input, output, created_at, is_demo)
+        VALUES (?, 'agent-1', 'addr_test', ?, '{"topic": "retention"}', ?, ?, ?)
+    """, (job_id, status, "x" * 2000, created, is_demo))
+    return job_id
+
+def seed_jobs(conn):
+    """Jobs on both sides of every policy; returns the ids retention should remove."""
+    expired = set()
+    for n in range(40):
+        expired.add(insert_job(conn, "completed", True, 8 + n))  # demo, older than 7 days
+        insert_job(conn, "completed", True, 6)
+        expired.add(insert_job(conn, "failed", False, 31 + n))
+        insert_job(conn, "failed", False, 29)
+        expired.add(insert_job(conn, "completed", False, 91 + n))
+        insert_job(conn, "completed", False, 89)
+        # Unfinished jobs are never removed, however old
+        insert_job(conn, "queued", False, 500)
+        insert_job(conn, "running", True, 500)
+    conn.commit()
+    return expired
+
+def remaining_ids(conn):
+    return {row[0] for row in conn.execute("SELECT id FROM agent_jobs")}
+
+def test_parse_policies():
+    policies = parse_policies(POLICIES)
+    assert [(p.name, p.is_demo, p.max_age_days) for p in policies] == [
+        ("demo", True, 7.0), ("failed", False, 30.0), ("completed", False, 90.0),
+    ]
+    for spec in ("queued=5", "demo=0", "demo=soon"):
+        with pytest.raises(ValueError):
+            parse_policies(spec)
+
+def test_archive_in_main_database(fresh_database):
+    fresh_database("archive-main")
+    worker = RetentionWorker(parse_policies(POLICIES), 3600, batch_size=7, batch_pause=0)
+    conn = worker.connect()
+    try:
+        expired = seed_jobs(conn)
+        all_ids = remaining_ids(conn)
+        assert sum(count_eligible(conn, worker.policies, NOW).values()) == len(expired)
+        removed = worker.run_once(conn, NOW)
+        assert removed == {"demo": 40, "failed": 40, "completed": 40}, removed
+        assert remaining_ids(conn) == all_ids - expired
+        archived = {row[0] for row in conn.execute("SELECT id FROM agent_jobs_archive")}
+        assert archived == expired
+        row = conn.execute("SELECT output, archived_at FROM agent_jobs_archive LIMIT 1").fetchone()
+        assert row["output"] == "x" * 2000 and row["archived_at"] == NOW.isoformat()
+        # Running again finds nothing new
+        assert sum(worker.run_once(conn, NOW).values()) == 0
+    finally:
+        conn.close()
+
+def test_archive_file_and_vacuum(fresh_database, tmp_path):
+    fresh_database("archive-file")
+    archive_path = str(tmp_path / "archive.db")
+    worker = RetentionWorker(parse_policies(POLICIES), 3600, batch_size=50, batch_pause=0, archive_path=archive_path)
+    conn = worker.connect()
+    try:
+        expired = seed_jobs(conn)
+        pages_before = conn.execute("PRAGMA page_count").fetchone()[0]
+        worker.run_once(conn, NOW)
+        assert not any(remaining_ids(conn) & expired)
+        assert conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'agent_jobs_archive'").fetchone() is None
+        archived = {row[0] for row in conn.execute("SELECT id FROM archive.agent_jobs_archive")}
+        assert archived == expired
+        # New databases use incremental auto-vacuum, so the freed pages are given back
+        assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+        assert conn.execute("PRAGMA page_count").fetchone()[0] < pages_before
+        assert worker.vacuumed_pages > 0
+    finally:
+        conn.close()
+
+def test_delete_without_archive(fresh_database):
+    fresh_database("delete-only")
+    worker = RetentionWorker(parse_policies(POLICIES), 3600, batch_size=25, batch_pause=0, archive=False)
+    conn = worker.connect()
+    try:
+        expired = seed_jobs(conn)
+        conn.execute("INSERT INTO demo_usage (agent_id, user_wallet, count) VALUES ('agent-1', 'addr_test', 3)")
+        conn.commit()
+        worker.run_once(conn, NOW)
+        assert not any(remaining_ids(conn) & expired)
+        assert conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'agent_jobs_archive'").fetchone() is None
+        # Demo quotas are counted separately and survive the cleanup
+        assert conn.execute("SELECT count FROM demo_usage").fetchone()[0] == 3
+    finally:
+        conn.close()
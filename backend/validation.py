@@ -0,0 +1,354 @@
+"""
+Validation of job and demo input against an agent's input_schema.
+
+Schemas are compiled once into plain Python closures and cached per agent
+version, so checking an input is a handful of function calls rather than a
+walk over the schema document on every request.
+
+The compiler covers the JSON Schema keywords agent schemas use in practice:
+type, enum, const, properties, required, additionalProperties, items,
+minItems/maxItems, minLength/maxLength, pattern, minimum/maximum,
+exclusiveMinimum/exclusiveMaximum, allOf, anyOf and oneOf. Like JSON Schema
+itself, other keywords (title, description, format, ...) are ignored.
+"""
+
+import json
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from config import settings
+
+# A compiled check returns None when the value is valid, otherwise a message
+Check = Callable[[Any, str], Optional[str]]
+
+class SchemaError(ValueError):
+    """The schema itself is malformed and cannot be compiled."""
+
+class InputValidationError(ValueError):
+    """An input does not match the agent's input_schema."""
+
+_TYPE_CHECKS: Dict[str, Callable[[Any], bool]] = {
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+    "string": lambda value: isinstance(value, str),
+    "boolean": lambda value: isinstance(value, bool),
+    "null": lambda value: value is None,
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "integer": lambda value: (
+        (isinstance(value, int) and not isinstance(value, bool))
+        or (isinstance(value, float) and value.is_integer())
+    ),
+}
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def compile_schema(schema: Any) -> Optional[Check]:
+    """
+    Compile a schema into a check function, or None if it accepts everything.
+
+    Raises SchemaError if the schema is malformed.
+    """
+    if schema is True or schema == {}:
+        return None
+    if schema is False:
+        return lambda value, path: f"{path} is not allowed"
+    if not isinstance(schema, dict):
+        raise SchemaError("A schema must be an object or a boolean")
+
+    checks = []
+
+    schema_type = schema.get("type")
+    if schema_type is not None:
+        types = [schema_type] if isinstance(schema_type, str) else schema_type
+        if not isinstance(types, list) or not types or any(t not in _TYPE_CHECKS for t in types):
+            raise SchemaError(f"Unsupported type: {schema_type!r}")
+        type_checks = tuple(_TYPE_CHECKS[t] for t in types)
+        expected = " or ".join(types)
+        if len(type_checks) == 1:
+            type_check = type_checks[0]
+            checks.append(lambda value, path: None if type_check(value) else f"{path} must be {expected}")
+        else:
+            checks.append(lambda value, path: (
+                None if any(check(value) for check in type_checks) else f"{path} must be {expected}"
+            ))
+
+    if "enum" in schema:
+        options = schema["enum"]
+        if not isinstance(options, list):
+            raise SchemaError("enum must be an array")
+        message = f"must be one of {json.dumps(options)}"
+        if all(isinstance(option, str) for option in options):
+            allowed_strings = frozenset(options)
+            checks.append(lambda value, path: (
+                None if isinstance(value, str) and value in allowed_strings else f"{path} {message}"
+            ))
+        else:
+            # Compare through JSON so that e.g. True and 1 stay distinct
+            allowed = {json.dumps(option, sort_keys=True) for option in options}
+            checks.append(lambda value, path: (
+                None if json.dumps(value, sort_keys=True) in allowed else f"{path} {message}"
+            ))
+
+    if "const" in schema:
+        const = json.dumps(schema["const"], sort_keys=True)
+        checks.append(lambda value, path: (
+            None if json.dumps(value, sort_keys=True) == const else f"{path} must be {const}"
+        ))
+
+    checks.extend(_compile_string(schema))
+    checks.extend(_compile_number(schema))
+    checks.extend(_compile_object(schema))
+    checks.extend(_compile_array(schema))
+    checks.extend(_compile_combinators(schema))
+
+    if not checks:
+        return None
+    if len(checks) == 1:
+        return checks[0]
+    checks = tuple(checks)
+
+    def check_all(value, path):
+        for check in checks:
+            error = check(value, path)
+            if error is not None:
+                return error
+        return None
+
+    return check_all
+
+def _int_keyword(schema: dict, keyword: str) -> Optional[int]:
+    value = schema.get(keyword)
+    if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < 0):
+        raise SchemaError(f"{keyword} must be a non-negative integer")
+    return value
+
+def _number_keyword(schema: dict, keyword: str):
+    value = schema.get(keyword)
+    if value is not None and not _is_number(value):
+        raise SchemaError(f"{keyword} must be a number")
+    return value
+
+def _compile_string(schema: dict):
+    min_length = _int_keyword(schema, "minLength")
+    max_length = _int_keyword(schema, "maxLength")
+    pattern = schema.get("pattern")
+    if min_length is not None:
+        yield lambda value, path: (
+            f"{path} must be at least {min_length} characters"
+            if isinstance(value, str) and len(value) < min_length else None
+        )
+    if max_length is not None:
+        yield lambda value, path: (
+            f"{path} must be at most {max_length} characters"
+            if isinstance(value, str) and len(value) > max_length else None
+        )
+    if pattern is not None:
+        try:
+            regex = re.compile(pattern)
+        except (re.error, TypeError) as e:
+            raise SchemaError(f"Invalid pattern: {e}")
+        yield lambda value, path: (
+            f"{path} must match {pattern!r}"
+            if isinstance(value, str) and regex.search(value) is None else None
+        )
+
+def _compile_number(schema: dict):
+    minimum = _number_keyword(schema, "minimum")
+    maximum = _number_keyword(schema, "maximum")
+    exclusive_minimum = _number_keyword(schema, "exclusiveMinimum")
+    exclusive_maximum = _number_keyword(schema, "exclusiveMaximum")
+    if minimum is not None:
+        yield lambda value, path: (
+            f"{path} must be at least {minimum}" if _is_number(value) and value < minimum else None
+        )
+    if maximum is not None:
+        yield lambda value, path: (
+            f"{path} must be at most {maximum}" if _is_number(value) and value > maximum else None
+        )
+    if exclusive_minimum is not None:
+        yield lambda value, path: (
+            f"{path} must be greater than {exclusive_minimum}"
+            if _is_number(value) and value <= exclusive_minimum else None
+        )
+    if exclusive_maximum is not None:
+        yield lambda value, path: (
+            f"{path} must be less than {exclusive_maximum}"
+            if _is_number(value) and value >= exclusive_maximum else None
+        )
+
+def _compile_object(schema: dict):
+    properties = schema.get("properties", {})
+    required = schema.get("required", [])
+    additional = schema.get("additionalProperties", True)
+    if not isinstance(properties, dict):
+        raise SchemaError("properties must be an object")
+    if not isinstance(required, list) or not all(isinstance(name, str) for name in required):
+        raise SchemaError("required must be an array of strings")
+
+    if required:
+        required = tuple(required)
+
+        def check_required(value, path):
+            if isinstance(value, dict):
+                for name in required:
+                    if name not in value:
+                        return f"{path}.{name} is required"
+            return None
+
+        yield check_required
+
+    property_checks = {}
+    for name, subschema in properties.items():
+        check = compile_schema(subschema)
+        if check is not None:
+            property_checks[name] = check
+    additional_check = None if additional is True else compile_schema(additional)
+
+    if property_checks or additional_check is not None:
+        def check_properties(value, path):
+            if not isinstance(value, dict):
+                return None
+            for name, item in value.items():
+                check = property_checks.get(name)
+                if check is None:
+                    if additional_check is None or name in properties:
+                        continue
+                    check = additional_check
+                error = check(item, f"{path}.{name}")
+                if error is not None:
+                    return error
+            return None
+
+        yield check_properties
+
+def _compile_array(schema: dict):
+    min_items = _int_keyword(schema, "minItems")
+    max_items = _int_keyword(schema, "maxItems")
+    items = schema.get("items")
+    if min_items is not None:
+        yield lambda value, path: (
+            f"{path} must have at least {min_items} items"
+            if isinstance(value, list) and len(value) < min_items else None
+        )
+    if max_items is not None:
+        yield lambda value, path: (
+            f"{path} must have at most {max_items} items"
+            if isinstance(value, list) and len(value) > max_items else None
+        )
+    if items is not None:
+        item_check = compile_schema(items)
+        if item_check is not None:
+            def check_items(value, path):
+                if not isinstance(value, list):
+                    return None
+                for n, item in enumerate(value):
+                    error = item_check(item, f"{path}[{n}]")
+                    if error is not None:
+                        return error
+                return None
+
+            yield check_items
+
+def _compile_combinators(schema: dict):
+    for keyword in ("allOf", "anyOf", "oneOf"):
+        subschemas = schema.get(keyword)
+        if subschemas is None:
+            continue
+        if not isinstance(subschemas, list) or not subschemas:
+            raise SchemaError(f"{keyword} must be a non-empty array")
+        subchecks = tuple(compile_schema(subschema) or (lambda value, path: None) for subschema in subschemas)
+        if keyword == "allOf":
+            def check_all_of(value, path, subchecks=subchecks):
+                for check in subchecks:
+                    error = check(value, path)
+                    if error is not None:
+                        return error
+                return None
+            yield check_all_of
+        elif keyword == "anyOf":
+            yield lambda value, path, subchecks=subchecks: (
+                None if any(check(value, path) is None for check in subchecks)
+                else f"{path} does not match any allowed schema"
+            )
+        else:
+            yield lambda value, path, subchecks=subchecks: (
+                None if sum(check(value, path) is None for check in subchecks) == 1
+                else f"{path} must match exactly one allowed schema"
+            )
+
+class ValidatorCache:
+    """
+    LRU cache of compiled input validators keyed by (agent id, updated_at).
+
+    Only the newest version of each agent is kept: compiling a validator for
+    a new ``updated_at`` drops the previous one.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Optional[Check]]" = OrderedDict()
+        self._versions: Dict[str, Hashable] = {}
+        self._lock = threading.Lock()
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.schema_errors = 0
+
+    def get(self, agent_id: str, updated_at: str, input_schema: Optional[str]) -> Optional[Check]:
+        """Return the compiled validator for an agent version, compiling it on first use."""
+        key = (agent_id, updated_at)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        try:
+            check = compile_schema(json.loads(input_schema) if input_schema else {})
+        except (SchemaError, ValueError) as e:
+            # A stored schema we cannot interpret must not lock users out of the agent
+            print(f"Ignoring invalid input_schema of agent {agent_id}: {e}")
+            self.schema_errors += 1
+            check = None
+
+        if self.max_entries <= 0:
+            return check
+        with self._lock:
+            previous = self._versions.get(agent_id)
+            if previous is not None and previous != key:
+                self._entries.pop(previous, None)
+            self._versions[agent_id] = key
+            self._entries[key] = check
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                if self._versions.get(evicted[0]) == evicted:
+                    del self._versions[evicted[0]]
+                self.evictions += 1
+        return check
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "schema_errors": self.schema_errors,
+            }
+
+def validate_input(agent_id: str, updated_at: str, input_schema: Optional[str], value: Any):
+    """Check a job input against the agent's input_schema; raise InputValidationError if it does not match."""
+    check = input_validators.get(agent_id, updated_at, input_schema)
+    if check is not None:
+        error = check(value, "input")
+        if error is not None:
+            raise InputValidationError(error)
+
+input_validators = ValidatorCache(settings.INPUT_VALIDATOR_CACHE_SIZE)